@@ -1,7 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database.database import init_db
+from fastapi.responses import PlainTextResponse
+from database.database import init_db, engine
+from sqlmodel import Session
+from services.theme_index import theme_index
+from services.generation.near_dup import near_dup_index
+from services.llm import ollama_client
+from services.llm.admission import admission
 from database.config import get_settings
+from core import metrics, query_audit, tracing, traffic_recorder
 import uvicorn
 import logging
 
@@ -13,6 +20,8 @@ from routers.task_log import tasklog_route
 from routers.task import task_route
 from routers.prediction_async import predict_async_route
 from routers import panel
+from routers.recommendation import recommend_route
+from routers.debug import debug_route
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -38,6 +47,17 @@ def create_application() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # латентность по маршрутам и SQL на запрос (см. core/metrics)
+    metrics.install_http_metrics(app)
+    metrics.install_db_metrics()
+    # сквозные трейсы: HTTP → SQL → MQ → воркер → Ollama (см. core/tracing)
+    tracing.install_http_tracing(app)
+    tracing.install_db_tracing()
+    # dev: число SQL на запрос и N+1 (QUERY_AUDIT=1, сводка — /api/debug/queries)
+    query_audit.install(app)
+    # запись трафика для bench/replay.py (TRAFFIC_RECORD_PATH=<файл.jsonl>)
+    traffic_recorder.install(app)
+
     # Регистрация маршрутов
     app.include_router(user_route,    prefix="/api")
     app.include_router(wallet_route,  prefix="/api")
@@ -47,12 +67,30 @@ def create_application() -> FastAPI:
     app.include_router(task_route,    prefix="/api")
     app.include_router(predict_async_route, prefix="/api")
     app.include_router(panel.router, prefix="/api")
+    app.include_router(recommend_route, prefix="/api")
+    app.include_router(debug_route, prefix="/api")
 
     # healthcheck для docker-compose
     @app.get("/health", tags=["meta"])
     def health():
         return {"status": "ok"}
 
+    # загружена ли модель Ollama, когда использовалась и пинговалась
+    @app.get("/health/ollama", tags=["meta"])
+    def health_ollama():
+        return {
+            "enabled": ollama_client.enabled(),
+            **ollama_client.model_warmer.state(),
+            "prompt_eval": ollama_client.prompt_stats.stats(),
+            "routing": ollama_client.routing.snapshot(),
+            "admission": admission.snapshot(),
+        }
+
+    # метрики процесса в формате Prometheus
+    @app.get("/metrics", tags=["meta"], include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
     return app
 
 app = create_application()
@@ -62,6 +100,12 @@ def on_startup():
     try:
         logger.info("Initializing database...")
         init_db()
+        # индекс тем загружаем заранее, чтобы горячие пути не ходили в БД за темой
+        with Session(engine) as session:
+            theme_index.load(session)
+        # модель грузится в фоне, чтобы первый пользователь не ждал холодный старт
+        if ollama_client.enabled():
+            ollama_client.model_warmer.start()
         logger.info("Application startup completed successfully")
     except Exception as e:
         logger.error(f"Startup failed: {str(e)}")
@@ -72,6 +116,10 @@ def on_startup():
 async def shutdown_event():
     """Очистка ресурсов при завершении работы приложения."""
     logger.info("Application shutting down...")
+    ollama_client.model_warmer.stop()
+    # индекс почти-дубликатов сохраняется периодически; на выходе — досохраняем хвост
+    if near_dup_index.path:
+        near_dup_index.save(near_dup_index.path)
 
 
 if __name__ == '__main__':
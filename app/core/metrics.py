@@ -0,0 +1,340 @@
+# app/core/metrics.py
+# Метрики процесса в текстовом формате Prometheus (без prometheus_client).
+#
+# Реестр живёт в памяти процесса: у каждого uvicorn-воркера и у каждого
+# MQ-воркера он свой, Prometheus скрейпит их по отдельности (API — /metrics,
+# воркеры — боковой порт METRICS_PORT, см. start_metrics_server).
+#
+# Что меряем:
+#   http_request_duration_seconds  — латентность по шаблону маршрута;
+#   http_request_db_queries / _db_seconds — сколько SQL и сколько времени в БД на запрос;
+#   db_query_duration_seconds      — все SQL-запросы процесса (события SQLAlchemy);
+#   ollama_*                       — длительность, токены и исход вызовов LLM;
+#   mq_publish_duration_seconds    — публикация в RabbitMQ;
+#   worker_job_duration_seconds    — обработка задачи воркером по очереди;
+#   mq_queue_wait_seconds          — ожидание задачи в очереди по полосе (paid|free).
+from __future__ import annotations
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in {"1", "true", "yes"}
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # боковой порт воркеров; 0 — не поднимать
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in items]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # на набор меток: [счётчики по корзинам (не накопительные)..., +Inf], сумма
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][idx] += 1
+            entry[1][0] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def sum(self, **labels) -> float:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[1][0] if entry else 0.0
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {acc}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class _Timer:
+    """with HIST.time(label=...): ... — длительность блока в секундах."""
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: Histogram, labels: Dict[str, str]):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.header())
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for m in list(self._metrics.values()):
+            m.reset()
+
+
+registry = Registry()
+
+# ---- HTTP ----
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"))
+HTTP_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ("route",), COUNT_BUCKETS)
+HTTP_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL per HTTP request", ("route",))
+
+# ---- БД ----
+DB_QUERY = registry.histogram("db_query_duration_seconds", "SQL statement execution time", ("op",))
+
+# ---- LLM ----
+OLLAMA_CALL = registry.histogram(
+    "ollama_request_duration_seconds", "Ollama call duration by outcome (success|rejected|parse_fail|timeout|error)",
+    ("kind", "model", "outcome"), LLM_BUCKETS)
+OLLAMA_TOKENS = registry.counter(
+    "ollama_tokens_total", "Tokens processed by Ollama (type=prompt|eval)", ("kind", "model", "type"))
+OLLAMA_GENERATIONS = registry.counter(
+    "ollama_generations_total", "Generation results after retries/escalation (success|fallback)", ("kind", "outcome"))
+PANEL_FALLBACK = registry.counter(
+    "panel_fallback_total", "Panels served from the built-in bank (forced|soft_timeout|error|empty|shed)", ("reason",))
+LLM_ADMISSION = registry.counter(
+    "llm_admission_total", "LLM admission decisions (admitted|fallback|rejected)", ("priority", "outcome"))
+LLM_ADMISSION_WAIT = registry.histogram(
+    "llm_admission_wait_seconds", "Time waited for an LLM slot before admission", ("priority",))
+
+# ---- MQ и воркеры ----
+MQ_PUBLISH = registry.histogram("mq_publish_duration_seconds", "RabbitMQ publish latency", ("queue",))
+WORKER_JOB = registry.histogram(
+    "worker_job_duration_seconds", "Job processing time in workers", ("queue", "status"), LLM_BUCKETS)
+MQ_QUEUE_WAIT = registry.histogram(
+    "mq_queue_wait_seconds", "Time from publish to worker pickup (priority=paid|free)", ("queue", "priority"),
+    LLM_BUCKETS)
+
+
+# ---- SQL на запрос: контекст + события SQLAlchemy ----
+# [число запросов, секунды]; список — чтобы поток из threadpool (sync-эндпоинты)
+# дописывал в тот же объект, что видит middleware
+_request_db: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("request_db", default=None)
+_installed = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_metrics_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("_metrics_t0")
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    op = statement.lstrip()[:6].upper()
+    DB_QUERY.observe(elapsed, op=op if op in {"SELECT", "INSERT", "UPDATE", "DELETE"} else "OTHER")
+    acc = _request_db.get()
+    if acc is not None:
+        acc[0] += 1
+        acc[1] += elapsed
+
+
+def _handle_error(ctx):
+    # упавший запрос не доходит до after_cursor_execute — снимаем его отметку времени
+    stack = ctx.connection.info.get("_metrics_t0") if ctx.connection is not None else None
+    if stack:
+        stack.pop()
+
+
+def install_db_metrics() -> None:
+    """Подписаться на события всех Engine процесса (идемпотентно)."""
+    global _installed
+    if _installed or not METRICS_ENABLED:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _installed = True
+
+
+def install_http_metrics(app) -> None:
+    """Middleware латентности и SQL на запрос; метка route — шаблон пути, а не сам путь."""
+    if not METRICS_ENABLED:
+        return
+
+    @app.middleware("http")
+    async def _metrics_middleware(request, call_next):
+        acc = [0, 0.0]
+        token = _request_db.set(acc)
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - t0
+            _request_db.reset(token)
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(elapsed, method=request.method, route=path, status=str(status))
+            HTTP_DB_QUERIES.observe(acc[0], route=path)
+            HTTP_DB_SECONDS.observe(acc[1], route=path)
+
+
+# ---- боковой порт для воркеров ----
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002 — не засоряем лог воркера скрейпами
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """GET /metrics на port в фоновом потоке; None — отключено или порт занят."""
+    if not METRICS_ENABLED or port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        logger.warning("Metrics server on :%s not started: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics exposed on :%s/metrics", port)
+    return server
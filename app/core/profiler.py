@@ -0,0 +1,121 @@
+# app/core/profiler.py
+# Статистический профайлер для живых процессов (API и воркеры).
+#
+# Фоновый поток раз в interval снимает стеки всех потоков через
+# sys._current_frames() и считает одинаковые стеки. Код приложения не
+# инструментируется и не замедляется: цена — один обход фреймов на тик в
+# отдельном потоке (при 10 мс и десятке потоков — доли процента CPU).
+# Результат — collapsed stacks ("поток;файл:функция;... N"), их понимают
+# flamegraph.pl, speedscope и inferno.
+#
+# Безопасность на проде: одновременно идёт только один профиль, длительность
+# ограничена PROFILE_MAX_SECONDS, потоки, ждущие в select/wait/queue.get,
+# по умолчанию не учитываются (иначе простаивающий threadpool забивает график).
+from __future__ import annotations
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp")
+
+# верхние фреймы, означающие «поток ждёт», а не работает
+_IDLE_FUNCS = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("socket.py", "accept"), ("socketserver.py", "serve_forever"),
+}
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Профиль уже снимается в этом процессе."""
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCS
+
+
+def sample_once(counts: Counter, skip_ident: int, include_idle: bool = False,
+                names: Optional[Dict[int, str]] = None) -> None:
+    """Один тик: стеки всех потоков, кроме skip_ident, в counts (корень слева)."""
+    names = names if names is not None else {t.ident: t.name for t in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident == skip_ident or (not include_idle and _is_idle(frame)):
+            continue
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        stack.append(f"thread:{names.get(ident, ident)}")
+        stack.reverse()
+        counts[";".join(stack)] += 1
+
+
+def profile(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS, include_idle: bool = False) -> str:
+    """
+    Снять профиль за seconds (не больше PROFILE_MAX_SECONDS) и вернуть collapsed stacks.
+    ProfilerBusy — если в процессе уже идёт другой профиль.
+    """
+    seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+    interval = max(1.0, float(interval_ms)) / 1000.0
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("profile already running")
+    try:
+        counts: Counter = Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        ticks = 0
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            sample_once(counts, me, include_idle, names)
+            ticks += 1
+            time.sleep(interval)
+    finally:
+        _busy.release()
+    logger.info("profile: %d ticks, %d unique stacks over %.1fs", ticks, len(counts), seconds)
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+def profile_to_file(seconds: float, directory: Optional[str] = None) -> Optional[str]:
+    """Профиль в файл profile-<pid>-<время>.collapsed; None — если профиль уже идёт."""
+    try:
+        data = profile(seconds)
+    except ProfilerBusy:
+        logger.warning("profile request ignored: another profile is running")
+        return None
+    path = os.path.join(directory or PROFILE_DIR, f"profile-{os.getpid()}-{int(time.time())}.collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    logger.info("profile written to %s", path)
+    return path
+
+
+def install_signal_handler(signum: int = getattr(signal, "SIGUSR1", 0),
+                           seconds: float = PROFILE_SIGNAL_SECONDS) -> bool:
+    """
+    kill -USR1 <pid> → профиль на seconds в фоне, файл в PROFILE_DIR.
+    Обработчик только запускает поток: сам сигнал не блокирует обработку сообщений.
+    """
+    if not signum or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def _handler(_signum, _frame):
+        threading.Thread(target=profile_to_file, args=(seconds,), name="profiler", daemon=True).start()
+
+    signal.signal(signum, _handler)
+    return True
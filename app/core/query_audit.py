@@ -0,0 +1,178 @@
+# app/core/query_audit.py
+# Счётчик SQL на запрос и детектор N+1 (для разработки и тестов).
+#
+# Включается QUERY_AUDIT=1. Middleware собирает все SQL, выполненные за
+# HTTP-запрос; текст запроса уже параметризован (значения — в bind-параметрах),
+# поэтому одинаковый текст, повторённый QUERY_AUDIT_REPEAT+ раз, — признак
+# N+1 (ленивые загрузки в цикле, lookup на каждую строку). Запросы с
+# повторами или больше QUERY_AUDIT_MAX запросов попадают в лог и в сводку
+# по маршрутам: GET /api/debug/queries. В ответ добавляется X-Query-Count.
+#
+# Для тестов тот же QueryAudit собирает запросы движка напрямую
+# (фикстура query_counter в tests/conftest.py).
+from __future__ import annotations
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_AUDIT = os.getenv("QUERY_AUDIT", "0").lower() in {"1", "true", "yes"}
+QUERY_AUDIT_MAX = int(os.getenv("QUERY_AUDIT_MAX", "15"))
+QUERY_AUDIT_REPEAT = int(os.getenv("QUERY_AUDIT_REPEAT", "3"))
+
+
+def _normalize(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+class QueryAudit:
+    """SQL одного запроса (или блока в тесте): число, время, повторы одинаковых текстов."""
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float = 0.0) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        self.statements[_normalize(statement)] += 1
+
+    def repeated(self, min_count: int = QUERY_AUDIT_REPEAT) -> List[Tuple[str, int]]:
+        return [(stmt, n) for stmt, n in self.statements.most_common() if n >= min_count]
+
+    def suspicious(self, max_queries: int = QUERY_AUDIT_MAX, min_repeat: int = QUERY_AUDIT_REPEAT) -> bool:
+        return self.count > max_queries or bool(self.repeated(min_repeat))
+
+
+class RouteReport:
+    """Сводка по маршрутам за время жизни процесса."""
+
+    def __init__(self, top_statements: int = 5):
+        self.top_statements = top_statements
+        self._routes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, route: str, audit: QueryAudit) -> None:
+        repeated = audit.repeated()
+        with self._lock:
+            r = self._routes.get(route)
+            if r is None:
+                r = self._routes[route] = {"requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0,
+                                           "flagged": 0, "repeated": Counter()}
+            r["requests"] += 1
+            r["queries"] += audit.count
+            r["max_queries"] = max(r["max_queries"], audit.count)
+            r["db_ms"] += audit.seconds * 1000
+            if audit.suspicious():
+                r["flagged"] += 1
+            for stmt, n in repeated:
+                r["repeated"][stmt] = max(r["repeated"][stmt], n)
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [
+                {
+                    "route": route,
+                    "requests": r["requests"],
+                    "avg_queries": round(r["queries"] / r["requests"], 2),
+                    "max_queries": r["max_queries"],
+                    "avg_db_ms": round(r["db_ms"] / r["requests"], 3),
+                    "flagged": r["flagged"],
+                    "repeated": [{"statement": s[:300], "max_repeats": n}
+                                 for s, n in r["repeated"].most_common(self.top_statements)],
+                }
+                for route, r in self._routes.items()
+            ]
+        rows.sort(key=lambda x: (-x["flagged"], -x["max_queries"], -x["avg_queries"]))
+        return rows[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+report = RouteReport()
+
+_current: contextvars.ContextVar[Optional[QueryAudit]] = contextvars.ContextVar("query_audit", default=None)
+
+
+# ---- SQLAlchemy ----
+def attach(target, audit: QueryAudit):
+    """Подписать audit на target (Engine/Connection); возвращает функцию отписки."""
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_audit_t0", []).append(time.perf_counter())
+
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_audit_t0")
+        audit.record(statement, time.perf_counter() - stack.pop() if stack else 0.0)
+
+    event.listen(target, "before_cursor_execute", _before)
+    event.listen(target, "after_cursor_execute", _after)
+
+    def _detach():
+        event.remove(target, "before_cursor_execute", _before)
+        event.remove(target, "after_cursor_execute", _after)
+    return _detach
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("_audit_ctx_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    audit = _current.get()
+    stack = conn.info.get("_audit_ctx_t0")
+    if audit is not None and stack:
+        audit.record(statement, time.perf_counter() - stack.pop())
+
+
+def _handle_error(ctx):
+    stack = ctx.connection.info.get("_audit_ctx_t0") if ctx.connection is not None else None
+    if stack:
+        stack.pop()
+
+
+_installed = False
+
+
+def install(app) -> None:
+    """Middleware аудита + события SQLAlchemy; без QUERY_AUDIT=1 ничего не делает."""
+    global _installed
+    if not QUERY_AUDIT:
+        return
+    if not _installed:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+        _installed = True
+
+    @app.middleware("http")
+    async def _query_audit_middleware(request, call_next):
+        audit = QueryAudit()
+        token = _current.set(audit)
+        try:
+            response = await call_next(request)
+        finally:
+            _current.reset(token)
+        route = request.scope.get("route")
+        path = f"{request.method} {getattr(route, 'path', None) or 'unmatched'}"
+        report.add(path, audit)
+        if audit.suspicious():
+            logger.warning(
+                "query audit: %s ran %d SQL (%.1f ms), repeated: %s",
+                path, audit.count, audit.seconds * 1000,
+                [(s[:120], n) for s, n in audit.repeated()[:3]],
+            )
+        response.headers["X-Query-Count"] = str(audit.count)
+        return response
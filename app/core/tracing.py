@@ -0,0 +1,331 @@
+# app/core/tracing.py
+# Сквозная трассировка API → RabbitMQ → воркер → Ollama без внешнего коллектора.
+#
+# Контекст передаётся в формате W3C traceparent ("00-<trace>-<span>-01"):
+# во входящем HTTP-заголовке, в headers AMQP-сообщения (publish_task) и
+# дальше в воркере. Вместе с traceparent публикуется x-enqueued-at, и воркер
+# строит ретроспективный спан "queue.wait" — время в очереди отдельно от
+# времени генерации ("job.<очередь>", "ollama.generate").
+#
+# Экспорт (TRACE_EXPORTER):
+#   memory — кольцевой буфер последних TRACE_BUFFER спанов (GET /api/debug/traces);
+#   jsonl  — построчно в TRACE_PATH (удобно для воркеров: у каждого свой процесс);
+#            при TRACE_MAX_BYTES файл уходит в TRACE_PATH.1 (одна старая копия);
+#   off    — спаны не создаются.
+#
+# Выборка: TRACE_SAMPLE — доля корневых трейсов, которые экспортируются. Решение
+# принимается в корне и едет дальше флагом traceparent ("-01" / "-00"), так что
+# трейс либо целиком есть (API, очередь, воркер), либо его нет нигде.
+from __future__ import annotations
+import contextvars
+import json
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Mapping, MutableMapping, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "memory").lower()
+TRACE_PATH = os.getenv("TRACE_PATH", "traces.jsonl")
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "5000"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", "1.0"))
+# спан на каждый SQL-запрос — для разбора конкретного эндпоинта, не для прода:
+# без них видно только суммарное время вызова
+TRACE_DB = os.getenv("TRACE_DB", "0").lower() in {"1", "true", "yes"}
+
+TRACEPARENT = "traceparent"
+ENQUEUED_AT = "x-enqueued-at"
+
+# (trace_id, span_id) или (trace_id, span_id, sampled); без флага — трейс выбран
+Parent = Tuple[Any, ...]
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attrs", "status", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 start: Optional[float] = None, attrs: Optional[Dict[str, Any]] = None,
+                 sampled: bool = True):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start = start if start is not None else time.time()
+        self.end: Optional[float] = None
+        self.attrs: Dict[str, Any] = dict(attrs or {})
+        self.status = "ok"
+        self.sampled = sampled
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end is None else round((self.end - self.start) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+# ---- экспортёры ----
+class InMemoryExporter:
+    def __init__(self, maxlen: int = TRACE_BUFFER):
+        self._spans: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span.to_dict())
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._spans)
+        return [s for s in items if trace_id is None or s["trace_id"] == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class JsonlExporter:
+    """Построчная запись в JSONL; файл открыт на всё время жизни процесса."""
+
+    def __init__(self, path: str, max_bytes: int = TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._size = self._file.tell()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock:
+                if self.max_bytes and self._size + len(line) > self.max_bytes:
+                    self._rotate()
+                self._file.write(line)
+                self._size += len(line)
+        except (OSError, ValueError) as e:
+            logger.warning("trace export failed (%s): %s", self.path, e)
+
+    def _rotate(self) -> None:
+        # одна старая копия: размер на диске не больше 2 × max_bytes
+        self._file.close()
+        try:
+            os.replace(self.path, self.path + ".1")
+        finally:
+            self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._size = self._file.tell()
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        for path in (self.path + ".1", self.path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    items.extend(json.loads(line) for line in f if line.strip())
+            except (OSError, ValueError):
+                continue
+        return [s for s in items if trace_id is None or s["trace_id"] == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            self._size = 0
+            if os.path.exists(self.path + ".1"):
+                os.remove(self.path + ".1")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _make_exporter():
+    if TRACE_EXPORTER == "off":
+        return None
+    if TRACE_EXPORTER == "jsonl":
+        return JsonlExporter(TRACE_PATH)
+    return InMemoryExporter()
+
+
+exporter = _make_exporter()
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def enabled() -> bool:
+    return exporter is not None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+# ---- спаны ----
+@contextmanager
+def span(name: str, parent: Optional[Parent] = None, **attrs) -> Iterator[Optional[Span]]:
+    """
+    with span("ollama.generate", model=...) as sp: ...
+    parent — из extract(); по умолчанию — текущий спан контекста.
+    """
+    if exporter is None:
+        yield None
+        return
+    sp = start_span(name, parent, **attrs)
+    token = _current.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.status = "error"
+        sp.attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        finish_span(sp)
+
+
+def start_span(name: str, parent: Optional[Parent] = None, start: Optional[float] = None,
+               **attrs) -> Span:
+    """Спан без входа в контекст (для ретроспективных интервалов и событий SQLAlchemy)."""
+    if parent is None:
+        cur = _current.get()
+        parent = (cur.trace_id, cur.span_id, cur.sampled) if cur is not None else None
+    if parent:
+        trace_id, parent_id, sampled = parent[0], parent[1], parent[2] if len(parent) > 2 else True
+    else:
+        trace_id, parent_id, sampled = secrets.token_hex(16), None, _sample()
+    return Span(name, trace_id, parent_id, start=start, attrs=attrs, sampled=sampled)
+
+
+def _sample() -> bool:
+    return TRACE_SAMPLE >= 1.0 or random.random() < TRACE_SAMPLE
+
+
+def finish_span(sp: Span, end: Optional[float] = None) -> None:
+    sp.end = end if end is not None else time.time()
+    if exporter is not None and sp.sampled:
+        exporter.export(sp)
+
+
+# ---- распространение контекста ----
+def inject(headers: MutableMapping[str, Any]) -> MutableMapping[str, Any]:
+    """Дописать traceparent текущего спана в заголовки (HTTP или AMQP)."""
+    cur = _current.get()
+    if cur is not None:
+        headers[TRACEPARENT] = cur.traceparent
+    return headers
+
+
+def extract(headers: Optional[Mapping[str, Any]]) -> Optional[Parent]:
+    """traceparent → (trace_id, parent_span_id, sampled) или None."""
+    raw = (headers or {}).get(TRACEPARENT)
+    if isinstance(raw, bytes):
+        raw = raw.decode("ascii", "ignore")
+    parts = str(raw or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+# ---- SQL ----
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    cur = _current.get()
+    if cur is None or not cur.sampled:
+        return
+    op = statement.lstrip()[:6].upper()
+    sp = start_span(f"db.{op.lower()}" if op in {"SELECT", "INSERT", "UPDATE", "DELETE"} else "db.other",
+                    statement=statement[:200])
+    conn.info.setdefault("_trace_spans", []).append(sp)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("_trace_spans")
+    if stack:
+        finish_span(stack.pop())
+
+
+def _handle_error(ctx):
+    # после ошибки after_cursor_execute не вызывается — закрываем спан здесь
+    stack = ctx.connection.info.get("_trace_spans") if ctx.connection is not None else None
+    if stack:
+        sp = stack.pop()
+        sp.status = "error"
+        sp.attrs["error"] = type(ctx.original_exception).__name__
+        finish_span(sp)
+
+
+_db_installed = False
+
+
+def install_db_tracing() -> None:
+    """Спан на SQL-запрос внутри активного трейса (идемпотентно)."""
+    global _db_installed
+    if _db_installed or exporter is None or not TRACE_DB:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _db_installed = True
+
+
+# ---- HTTP ----
+def install_http_tracing(app) -> None:
+    """Корневой спан на запрос; входящий traceparent продолжает чужой трейс."""
+    if exporter is None:
+        return
+
+    @app.middleware("http")
+    async def _tracing_middleware(request, call_next):
+        with span(f"HTTP {request.method}", parent=extract(request.headers), path=request.url.path) as sp:
+            response = await call_next(request)
+            route = request.scope.get("route")
+            sp.set(route=getattr(route, "path", None), status=response.status_code)
+            response.headers["traceparent"] = sp.traceparent
+            return response
+
+
+# ---- разбор трейсов ----
+def summarize(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Трейсы целиком: корень, длительность от первого до последнего спана и время по именам."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        groups.setdefault(s["trace_id"], []).append(s)
+    out = []
+    for trace_id, members in groups.items():
+        members.sort(key=lambda s: s["start"])
+        root = next((s for s in members if s["parent_id"] is None), members[0])
+        end = max(s["start"] + (s["duration_ms"] or 0.0) / 1000 for s in members)
+        by_name: Dict[str, float] = {}
+        for s in members:
+            by_name[s["name"]] = round(by_name.get(s["name"], 0.0) + (s["duration_ms"] or 0.0), 3)
+        out.append({
+            "trace_id": trace_id,
+            "root": root["name"],
+            "spans": len(members),
+            "wall_ms": round((end - members[0]["start"]) * 1000, 3),
+            "by_name": by_name,
+        })
+    return sorted(out, key=lambda t: -t["wall_ms"])
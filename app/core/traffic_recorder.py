@@ -0,0 +1,167 @@
+# app/core/traffic_recorder.py
+# Запись реального трафика для воспроизведения (bench/replay.py).
+#
+# Включается TRAFFIC_RECORD_PATH=<файл.jsonl>. На каждый запрос (с долей
+# TRAFFIC_SAMPLE) пишется строка: момент начала, метод, путь и шаблон
+# маршрута, query, «форма» JSON-тела, кто вызвал (user_id/is_admin из токена),
+# статус, длительность и число запросов в работе на момент начала — по нему
+# replay восстанавливает конкурентность.
+#
+# Тело очищается: значения ключей вроде password/token заменяются на "***",
+# email — на псевдоним (стабильный хеш), строки обрезаются. Сам токен не
+# пишется: replay выпускает свой для того же user_id.
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from core.security import decode_access_token
+
+logger = logging.getLogger(__name__)
+
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH", "")
+TRAFFIC_SAMPLE = float(os.getenv("TRAFFIC_SAMPLE", "1.0"))
+TRAFFIC_BODY_MAX = int(os.getenv("TRAFFIC_BODY_MAX", "8192"))  # тела больше — только размер
+
+REDACTED = "***"
+_SECRET_KEYS = {"password", "raw_password", "token", "access_token", "refresh_token", "secret", "authorization"}
+_EMAIL_KEYS = {"email"}
+_SKIP_PREFIXES = ("/metrics", "/health", "/api/debug", "/api/docs", "/api/redoc", "/openapi.json")
+_MAX_STR = 200
+
+
+def pseudonymize_email(value: str) -> str:
+    digest = hashlib.sha1(value.strip().lower().encode("utf-8")).hexdigest()[:12]
+    return f"user-{digest}@replay.example.com"
+
+
+def sanitize(value: Any, key: Optional[str] = None) -> Any:
+    """Очищенная копия JSON-значения: секреты скрыты, email — псевдонимы, длинные строки обрезаны."""
+    k = (key or "").lower()
+    if k in _SECRET_KEYS:
+        return REDACTED
+    if isinstance(value, dict):
+        return {kk: sanitize(v, kk) for kk, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v, key) for v in value]
+    if isinstance(value, str):
+        if k in _EMAIL_KEYS and "@" in value:
+            return pseudonymize_email(value)
+        return value[:_MAX_STR]
+    return value
+
+
+def sanitize_query(query: str) -> Optional[str]:
+    if not query:
+        return None
+    return urlencode([(k, sanitize(v, k)) for k, v in parse_qsl(query, keep_blank_values=True)])
+
+
+def _caller(authorization: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        payload = decode_access_token(authorization[7:].strip())
+    except Exception:
+        return {"invalid": True}
+    return {"user_id": payload.get("user_id"), "is_admin": bool(payload.get("is_admin", False))}
+
+
+class TrafficRecorder:
+    """Построчная запись в JSONL; файл открыт на всё время жизни процесса."""
+
+    def __init__(self, path: str, sample: float = TRAFFIC_SAMPLE, body_max: int = TRAFFIC_BODY_MAX):
+        self.path = path
+        self.sample = sample
+        self.body_max = body_max
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._inflight = 0
+        self.written = 0
+
+    def sampled(self) -> bool:
+        return self.sample >= 1.0 or random.random() < self.sample
+
+    def enter(self) -> int:
+        with self._lock:
+            self._inflight += 1
+            return self._inflight
+
+    def leave(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    def body_shape(self, raw: bytes, content_type: str) -> Dict[str, Any]:
+        if not raw:
+            return {}
+        if len(raw) > self.body_max or "json" not in content_type:
+            return {"body_bytes": len(raw), "content_type": content_type}
+        try:
+            return {"body": sanitize(json.loads(raw))}
+        except ValueError:
+            return {"body_bytes": len(raw), "content_type": content_type}
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                self._file.write(line + "\n")
+                self.written += 1
+        except (OSError, ValueError) as e:
+            logger.warning("traffic record failed (%s): %s", self.path, e)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+recorder: Optional[TrafficRecorder] = None
+
+
+def install(app, path: str = TRAFFIC_RECORD_PATH) -> Optional[TrafficRecorder]:
+    """Middleware записи трафика; без пути ничего не делает."""
+    global recorder
+    if not path:
+        return None
+    rec = recorder = TrafficRecorder(path)
+    logger.info("traffic recording to %s (sample=%.2f)", path, rec.sample)
+
+    @app.middleware("http")
+    async def _traffic_recorder_middleware(request, call_next):
+        path_ = request.url.path
+        if path_.startswith(_SKIP_PREFIXES) or not rec.sampled():
+            return await call_next(request)
+        raw = await request.body()
+        started = time.time()
+        inflight = rec.enter()
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            duration = (time.perf_counter() - t0) * 1000
+            rec.leave()
+            route = request.scope.get("route")
+            entry = {
+                "ts": round(started, 6),
+                "method": request.method,
+                "path": path_,
+                "route": getattr(route, "path", None),
+                "query": sanitize_query(request.url.query),
+                "auth": _caller(request.headers.get("authorization")),
+                "status": status,
+                "duration_ms": round(duration, 3),
+                "inflight": inflight,
+                **rec.body_shape(raw, request.headers.get("content-type", "")),
+            }
+            rec.write(entry)
+
+    return rec
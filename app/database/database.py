@@ -10,7 +10,10 @@ from models.prediction_log import PredictionLog
 from models.wallet import Wallet
 from models.user import User
 from models.theme import Theme
+from models.exercise_set import ExerciseSet
 from models.exercise import Exercise
+from models.theme_schedule import ThemeSchedule
+from models.rate_limit_bucket import RateLimitBucket
 
 
 logger = logging.getLogger(__name__)
@@ -0,0 +1,27 @@
+# app/dependencies/rate_limit.py
+from fastapi import Depends, HTTPException, Response, status
+
+from .auth import TokenData, get_current_user
+from services.rate_limit import rate_limiter
+
+
+def rate_limit(route_class: str):
+    """
+    Зависимость: token bucket по TokenData.user_id и общий бакет класса маршрутов
+    (лимиты — RATE_LIMITS, см. services/rate_limit). Остаток квоты — в заголовках
+    X-RateLimit-*; при исчерпании — 429 с Retry-After.
+
+        @router.post("/generate", dependencies=[Depends(rate_limit("llm"))])
+    """
+    def _dependency(response: Response, token: TokenData = Depends(get_current_user)) -> None:
+        decision = rate_limiter.check(route_class, token.user_id)
+        if decision is None:
+            return
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов, повторите позже",
+                headers=decision.headers(),
+            )
+        response.headers.update(decision.headers())
+    return _dependency
@@ -9,5 +9,8 @@ class Exercise(SQLModel, table=True):
     theme_id: int = Field(index=True, foreign_key="theme.id")
     level: str
     difficulty: str
-    payload_json: str  # здесь лежат вопросы С правильными ответами
+    # общий набор вопросов (с ответами), см. models/exercise_set
+    set_id: Optional[int] = Field(default=None, foreign_key="exerciseset.id", index=True)
+    # старые упражнения: полный набор вопросов текстом; новые строки — NULL
+    payload_json: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,25 @@
+# app/models/exercise_set.py
+from typing import Any, Optional
+from datetime import datetime, timezone
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, JSON, LargeBinary, String
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+class ExerciseSet(SQLModel, table=True):
+    """
+    Общий набор вопросов панели (с ответами). Одинаковые наборы у разных
+    пользователей хранятся один раз: Exercise ссылается сюда по set_id,
+    уникальность — по content_hash (sha256 канонического JSON вопросов).
+
+    Вопросы лежат либо в questions (JSON, на Postgres — JSONB; codec="json"),
+    либо сжатыми в blob (codec="zstd" | "zlib"), см. services/exercise_codec.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content_hash: str = Field(sa_column=Column(String(64), unique=True, nullable=False))
+    codec: str = Field(default="json", max_length=8)
+    questions: Optional[Any] = Field(default=None, sa_column=Column(JSON().with_variant(JSONB(), "postgresql")))
+    blob: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary, nullable=True))
+    # компактная запись для проверки (services/panel_grading) — общая для всех ссылок
+    grading: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -5,6 +5,7 @@ from models.user import User
 from models.theme import Theme
 from models.prediction_log import PredictionLog
 from models.task_log import TaskResult
+from services.spaced_repetition import recommend_next_theme
 
 
 class MLModel(ABC):
@@ -20,14 +21,16 @@ class MLModel(ABC):
         raise NotImplementedError
 
     def recommend_theme(self, user: User, themes: List[Theme], session: Session) -> Theme:
-        used_explanations = {t.result.explanation for t in user.completed_tasks if t.result}
-        for theme in themes:
-            if theme.name not in used_explanations:
-                self._log_prediction(user.id, theme, session)
-                return theme
-        fallback = themes[0]
-        self._log_prediction(user.id, fallback, session)
-        return fallback
+        """
+        Следующая тема по расписанию интервального повторения (SM-2).
+        themes — запасной вариант, если каталог в БД пуст для пользователя.
+        Лог рекомендации добавляется в сессию; commit — на вызывающей стороне.
+        """
+        theme, _ = recommend_next_theme(user.id, session)
+        if theme is None:
+            theme = themes[0]
+        self._log_prediction(user.id, theme, session)
+        return theme
 
     def _log_prediction(self, user_id: int, theme: Theme, session: Session):
         log = PredictionLog(
@@ -37,4 +40,3 @@ class MLModel(ABC):
             difficulty=theme.level
         )
         session.add(log)
-        session.commit()
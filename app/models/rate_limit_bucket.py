@@ -0,0 +1,16 @@
+# app/models/rate_limit_bucket.py
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, String
+
+
+class RateLimitBucket(SQLModel, table=True):
+    """
+    Состояние token bucket для общего бэкенда лимитов (services/rate_limit).
+    key — "<класс маршрута>:<user_id>" или "<класс>:*"; tokens — остаток на
+    момент updated_at (unix time), между запросами пополняется расчётом.
+    """
+    __tablename__ = "rate_limit_bucket"
+
+    key: str = Field(sa_column=Column(String(128), primary_key=True))
+    tokens: float
+    updated_at: float
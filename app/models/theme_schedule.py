@@ -0,0 +1,25 @@
+# app/models/theme_schedule.py
+from typing import Optional
+from datetime import datetime, timezone
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, UniqueConstraint
+
+
+class ThemeSchedule(SQLModel, table=True):
+    """
+    Состояние интервального повторения (SM-2) темы для пользователя.
+    Следующая тема для повторения — строка с минимальным due_at.
+    """
+    __table_args__ = (
+        UniqueConstraint("user_id", "theme_id", name="uq_themeschedule_user_theme"),
+        Index("ix_themeschedule_user_due", "user_id", "due_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", ondelete="CASCADE")
+    theme_id: int = Field(foreign_key="theme.id", ondelete="CASCADE")
+    repetitions: int = Field(default=0)       # подряд успешных повторений
+    interval_days: float = Field(default=0.0)  # текущий интервал
+    ease: float = Field(default=2.5)           # коэффициент лёгкости SM-2
+    due_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_reviewed_at: Optional[datetime] = None
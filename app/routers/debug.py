@@ -0,0 +1,69 @@
+# app/routers/debug.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from core import profiler, query_audit, tracing
+from dependencies.auth import get_current_admin, TokenData
+
+debug_route = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@debug_route.get(
+    "/traces",
+    summary="Последние трейсы процесса",
+    description="Сводка по трейсам из локального экспортёра (core/tracing); с trace_id — все спаны трейса.",
+)
+def list_traces(
+    trace_id: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=500),
+    _: TokenData = Depends(get_current_admin),
+):
+    if tracing.exporter is None:
+        raise HTTPException(status_code=404, detail="Трассировка отключена (TRACE_EXPORTER=off)")
+    spans = tracing.exporter.spans(trace_id)
+    if trace_id:
+        return sorted(spans, key=lambda s: s["start"])
+    return tracing.summarize(spans)[:limit]
+
+
+@debug_route.get(
+    "/queries",
+    summary="Маршруты с наибольшим числом SQL",
+    description="Сводка аудита запросов (QUERY_AUDIT=1): сколько SQL на запрос и какие тексты повторяются (N+1).",
+)
+def top_queries(
+    limit: int = Query(20, ge=1, le=200),
+    reset: bool = Query(False),
+    _: TokenData = Depends(get_current_admin),
+):
+    if not query_audit.QUERY_AUDIT:
+        raise HTTPException(status_code=404, detail="Аудит запросов выключен (QUERY_AUDIT=0)")
+    rows = query_audit.report.top(limit)
+    if reset:
+        query_audit.report.reset()
+    return rows
+
+
+@debug_route.get(
+    "/profile",
+    response_class=PlainTextResponse,
+    summary="Статистический профиль процесса",
+    description=(
+        "Сэмплирует стеки всех потоков seconds секунд и возвращает collapsed stacks "
+        "(flamegraph.pl / speedscope). Один профиль за раз; 409 — если уже идёт."
+    ),
+)
+def cpu_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_INTERVAL_MS, ge=1, le=1000),
+    include_idle: bool = Query(False),
+    _: TokenData = Depends(get_current_admin),
+):
+    # sync-эндпоинт: сэмплирование идёт в потоке threadpool, event loop не блокируется
+    try:
+        data = profiler.profile(seconds, interval_ms, include_idle)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Профиль уже снимается")
+    return PlainTextResponse(data, headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'})
@@ -3,24 +3,36 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 from sqlmodel import Session
-import json, unicodedata
+import os
 
-from database.database import engine
+from database.database import get_session
 from models.exercise import Exercise
-from models.theme import Theme
 from schemas.panel import PanelPayload, PanelQuestion
-from services.generation.exercise_panel import build_panel
+from services.generation.exercise_panel import build_panel, llm_enabled
+from services.llm.admission import admission, FREE
+from services.theme_index import theme_index
 from dependencies.auth import get_current_user
-from services.crud.wallet import credit_for_reason_no_commit
+from dependencies.rate_limit import rate_limit
+from services.crud.wallet import credit_for_reason_no_commit, credit_many_no_commit
+from services.crud.exercise import get_grading_row, get_grading_rows, get_payload_json
+from services.spaced_repetition import record_review_no_commit, record_reviews_no_commit, quality_from_score
+from services.crud.exercise_set import get_or_create_set_no_commit
+from services.panel_grading import grade, grading_from_payload
 
 router = APIRouter(prefix="/panel", tags=["panel"])
 
+BATCH_MAX = int(os.getenv("PANEL_BATCH_MAX", "100"))
+BATCH_LOG_MODE = os.getenv("PANEL_BATCH_LOG_MODE", "batch").lower()  # batch | exercise
+
 class SubmitBody(BaseModel):
     answers: Dict[str, str]
 
-def _norm(s: str) -> str:
-    s = (s or "").strip().lower()
-    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+class SubmitBatchItem(BaseModel):
+    exercise_id: int
+    answers: Dict[str, str]
+
+class SubmitBatchBody(BaseModel):
+    items: List[SubmitBatchItem]
 
 def _reward_points(difficulty: str, score: int) -> int:
     if score < 50:
@@ -30,81 +42,148 @@ def _reward_points(difficulty: str, score: int) -> int:
     return max(1, pts)
 
 
-@router.post("/generate", response_model=PanelPayload)
+@router.post("/generate", response_model=PanelPayload, dependencies=[Depends(rate_limit("llm"))])
 def generate_panel(
     theme_id: int,
     count: int = 5,
     level: str = "A1",
     difficulty: Optional[str] = None, 
     user=Depends(get_current_user),
+    s: Session = Depends(get_session),
 ):
     """
     Генерируем вопросы, сохраняем полный набор (с ответами) в БД,
     клиенту отдаём без ответов.
     """
-    with Session(engine) as s:
-        theme = s.get(Theme, theme_id)
-        if not theme:
-            raise HTTPException(404, "Тема не найдена")
-
-        raw = build_panel(theme.name, count, level)
-
-        diff = (difficulty or "medium").lower()
-        if diff not in {"easy", "medium", "hard"}:
-            diff = "medium"
-
-        payload_full = {
-            "theme_id": theme_id,
-            "level": level,
-            "difficulty": diff,
-            "questions": [q.model_dump() for q in raw],
-        }
-
-        ex = Exercise(
-            user_id=user.user_id,
-            theme_id=theme_id,
-            level=level,
-            difficulty=diff,
-            payload_json=json.dumps(payload_full, ensure_ascii=False),
-        )
-        s.add(ex)
-        s.commit()
-        s.refresh(ex)
-
-        client_payload = PanelPayload(
-            exercise_id=ex.id,
-            theme_id=theme_id,
-            level=level,
-            difficulty=diff,
-            instructions=f"Отметь правильные ответы по теме: {theme.name}",
-            questions=[PanelQuestion(id=q.id, prompt=q.prompt, choices=q.choices or None) for q in raw],
-        )
-        return client_payload
+    indexed = theme_index.get(theme_id, s)
+    if not indexed:
+        raise HTTPException(404, "Тема не найдена")
+    theme = indexed.theme
+
+    topic_key = indexed.topic_key_for(level)
+    # панель бесплатная: при перегрузке Ollama — сразу из банка
+    with admission.admit(FREE, calls_llm=llm_enabled()) as use_llm:
+        raw = build_panel(theme.name, count, level, topic_key=topic_key, use_llm=use_llm)
+
+    diff = (difficulty or "medium").lower()
+    if diff not in {"easy", "medium", "hard"}:
+        diff = "medium"
+
+    # одинаковые наборы у разных пользователей хранятся один раз
+    ex_set = get_or_create_set_no_commit([q.model_dump() for q in raw], s)
+    ex = Exercise(
+        user_id=user.user_id,
+        theme_id=theme_id,
+        level=level,
+        difficulty=diff,
+        set_id=ex_set.id,
+    )
+    s.add(ex)
+    s.commit()
+    s.refresh(ex)
+
+    client_payload = PanelPayload(
+        exercise_id=ex.id,
+        theme_id=theme_id,
+        level=level,
+        difficulty=diff,
+        instructions=f"Отметь правильные ответы по теме: {theme.name}",
+        questions=[PanelQuestion(id=q.id, prompt=q.prompt, choices=q.choices or None) for q in raw],
+    )
+    return client_payload
+
+
+def _grade_row(row, exercise_id: int, answers: Dict[str, str], session: Session):
+    """(score, correct, total, reward) по строке из get_grading_row(s)."""
+    blob, difficulty = row.grading, row.difficulty
+    if blob is None:
+        # старые упражнения без ExerciseSet
+        blob, payload_difficulty = grading_from_payload(get_payload_json(exercise_id, session))
+        difficulty = payload_difficulty or difficulty
+
+    correct, total = grade(blob, answers)
+    score = int(correct * 100 / total) if total else 0
+    reward = _reward_points((difficulty or "medium").lower(), score)
+    return score, correct, total, reward
 
 
 @router.post("/{exercise_id}/submit")
-def submit_panel(exercise_id: int, body: SubmitBody, user=Depends(get_current_user)):
-    with Session(engine) as session:
-        ex = session.get(Exercise, exercise_id)
-        if not ex or ex.user_id != user.user_id:
-            raise HTTPException(404, "Упражнение не найдено.")
-
-        payload = json.loads(ex.payload_json or "{}")
-        gold_map = {q["id"]: (q.get("answer") or "") for q in payload.get("questions", [])}
-
-        total = len(gold_map)
-        correct = 0
-        for qid, gold in gold_map.items():
-            user_ans = body.answers.get(qid, "")
-            if _norm(user_ans) == _norm(gold):
-                correct += 1
-        score = int(correct * 100 / total) if total else 0
-        difficulty = (payload.get("difficulty") or "medium").lower()
-        reward = _reward_points(difficulty, score)
-        
-        if reward:
-            credit_for_reason_no_commit(user.user_id, reward, "Начисление за упражнение", session)
-
-        session.commit()
-
-    return {"score": score, "correct": correct, "total": total, "reward": reward}
\ No newline at end of file
+def submit_panel(
+    exercise_id: int,
+    body: SubmitBody,
+    user=Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    # только колонки для проверки: сами вопросы не тянем
+    row = get_grading_row(exercise_id, session)
+    if not row or row.user_id != user.user_id:
+        raise HTTPException(404, "Упражнение не найдено.")
+
+    score, correct, total, reward = _grade_row(row, exercise_id, body.answers, session)
+
+    if reward:
+        credit_for_reason_no_commit(user.user_id, reward, "Начисление за упражнение", session)
+
+    # результат панели двигает тему в расписании интервального повторения
+    record_review_no_commit(user.user_id, row.theme_id, quality_from_score(score), session)
+
+    session.commit()
+
+    return {"score": score, "correct": correct, "total": total, "reward": reward}
+
+
+@router.post("/submit-batch")
+def submit_panel_batch(
+    body: SubmitBatchBody,
+    user=Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """
+    Проверка нескольких панелей за один запрос: одна выборка (IN), одно
+    изменение баланса, один commit. Лог начислений — одной записью на пачку
+    или по записи на упражнение (env PANEL_BATCH_LOG_MODE=batch|exercise).
+    Пачка атомарна: если хоть одно упражнение не найдено — 404 и ничего не меняется.
+    """
+    if len(body.items) > BATCH_MAX:
+        raise HTTPException(400, f"Не больше {BATCH_MAX} упражнений за раз.")
+    ids = [it.exercise_id for it in body.items]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(400, "Упражнения в пачке повторяются.")
+
+    rows = get_grading_rows(ids, session)
+    missing = [i for i in ids if i not in rows or rows[i].user_id != user.user_id]
+    if missing:
+        raise HTTPException(404, f"Упражнения не найдены: {missing}")
+
+    results = []
+    scores_by_theme: Dict[int, List[int]] = {}
+    for it in body.items:
+        row = rows[it.exercise_id]
+        score, correct, total, reward = _grade_row(row, it.exercise_id, it.answers, session)
+        results.append({"exercise_id": it.exercise_id, "score": score, "correct": correct,
+                        "total": total, "reward": reward})
+        scores_by_theme.setdefault(row.theme_id, []).append(score)
+
+    total_reward = sum(r["reward"] for r in results)
+    if total_reward:
+        if BATCH_LOG_MODE == "exercise":
+            credit_many_no_commit(
+                user.user_id,
+                ((r["reward"], f"Начисление за упражнение #{r['exercise_id']}") for r in results),
+                session,
+            )
+        else:
+            credit_for_reason_no_commit(
+                user.user_id, total_reward, f"Начисление за упражнения ({len(results)})", session
+            )
+
+    # несколько панелей одной темы — одно повторение со средним результатом
+    record_reviews_no_commit(
+        user.user_id,
+        {tid: quality_from_score(sum(sc) // len(sc)) for tid, sc in scores_by_theme.items()},
+        session,
+    )
+
+    session.commit()
+
+    return {"results": results, "reward": total_reward}
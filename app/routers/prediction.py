@@ -6,15 +6,17 @@ import logging
 from database.database import get_session
 from dependencies.auth import get_current_user, TokenData
 from dependencies.authz import self_or_admin
+from dependencies.rate_limit import rate_limit
 from models.user import User
 from models.wallet import Wallet
-from models.theme import Theme
 from models.task_log import TaskResult
 from services.crud.task_log import log_task
 from services.crud.wallet import deduct_from_wallet, top_up_wallet
 from services.generation.spanish_comic import SpanishComicModel
 from services.crud.prediction_log import log_prediction, get_predictions_by_user
-from services.llm.ollama_client import generate_exercises, enabled as ollama_enabled
+from services.theme_index import theme_index
+from services.llm.ollama_client import generate_exercises, remember_exercises, enabled as ollama_enabled
+from services.llm.admission import admission, priority_for, Overloaded
 from schemas.prediction import (
     PredictRequest, 
     PredictResponse, 
@@ -30,6 +32,7 @@ COST_PER_PREDICT = 1.0  # базовая стоимость запроса
 
 @predict_route.post(
     "/",
+    dependencies=[Depends(rate_limit("llm"))],
     response_model=PredictResponse,
     status_code=status.HTTP_200_OK,
     summary="Сделать предсказание (сгенерировать задание)",
@@ -60,10 +63,11 @@ def predict(
         logger.warning("Предсказание: кошелёк не найден, user_id=%s", user.id)
         raise HTTPException(status_code=404, detail="Кошелёк не найден")
 
-    theme = session.get(Theme, req.theme_id)
-    if not theme:
+    indexed = theme_index.get(req.theme_id, session)
+    if not indexed:
         logger.warning("Предсказание: тема не найдена, theme_id=%s", req.theme_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
+    theme = indexed.theme
 
 
     # 2) По умолчанию генерация бесплатна
@@ -93,7 +97,9 @@ def predict(
     model = SpanishComicModel()
     try:
         # Генерация задания (комикса/упражнения)
-        task_result: TaskResult = model.generate_task(theme, is_bonus=req.is_bonus)
+        # при перегрузке Ollama — фолбэк или 429 (LLM_SHED_MODE); 429 идёт через ветку возврата кредитов
+        with admission.admit(priority_for(req.is_bonus), calls_llm=ollama_enabled()) as use_llm:
+            task_result: TaskResult = model.generate_task(theme, is_bonus=req.is_bonus, use_llm=use_llm)
 
         # Лог предсказания
         log_prediction(
@@ -143,7 +149,7 @@ def predict(
                 logger.info("Средства возвращены после ошибки предсказания: user_id=%s, amount=%s", user.id, COST_PER_PREDICT)
             except Exception as re:
                 logger.error("Не удалось вернуть средства после ошибки предсказания: user_id=%s, err=%s", user.id, str(re))
-            raise
+        raise
     except Exception as e:
         # Любая другая ошибка: возврат средств + ошибка 500
         if did_deduct:
@@ -179,6 +185,7 @@ def prediction_history(
 
 @predict_route.post(
     "/panel",
+    dependencies=[Depends(rate_limit("llm"))],
     response_model=PanelResponse,
     status_code=status.HTTP_200_OK,
     summary="Тестовая панель упражнений (15 заданий)",
@@ -202,9 +209,10 @@ def generate_panel(
     if not wallet:
         raise HTTPException(status_code=404, detail="Кошелёк не найден")
 
-    theme = session.get(Theme, req.theme_id)
-    if not theme:
+    indexed = theme_index.get(req.theme_id, session)
+    if not indexed:
         raise HTTPException(status_code=404, detail="Тема не найдена")
+    theme = indexed.theme
 
     # если хотят бонус — списываем 1 кредит
     credits_spent = 0.0
@@ -225,17 +233,24 @@ def generate_panel(
     # 1) Сколько задач хотим
     count = max(1, int(req.count or 15))
     
-    # 2) Пробуем спросить Ollama (передаём и описание темы)
-    ex_list = generate_exercises(
-        theme_name=theme.name,
-        count=count,
-        level=theme.level,
-        theme_desc=getattr(theme, "description", None),
-) if ollama_enabled() else None
+    # 2) Пробуем спросить Ollama (передаём и описание темы); при перегрузке — сразу заглушки или 429
+    try:
+        with admission.admit(priority_for(req.is_bonus), calls_llm=ollama_enabled()) as use_llm:
+            ex_list = generate_exercises(
+                theme_name=theme.name,
+                count=count,
+                level=theme.level,
+                theme_desc=getattr(theme, "description", None),
+            ) if use_llm and ollama_enabled() else None
+    except Overloaded:
+        if credits_spent:
+            top_up_wallet(user_id=user.id, amount=credits_spent, session=session)
+        raise
     
     # 3) Собираем список упражнений
     exercises: list[ExerciseItem] = []
     if ex_list:
+        remember_exercises(theme.name, theme.level, ex_list[:count])
         for it in ex_list[:count]:
             exercises.append(ExerciseItem(
                 prompt=it["prompt"],
@@ -4,9 +4,10 @@ from typing import List
 from database.database import get_session
 from dependencies.auth import get_current_user, TokenData
 from dependencies.authz import self_or_admin
+from dependencies.rate_limit import rate_limit
 from services.crud.job import create_job, get_job, list_jobs_by_user
 from schemas.job import JobCreate, JobOut, JobStatusOut
-from mq.publisher import publish_task
+from mq.publisher import publish_task, job_queue
 from services.crud.wallet import deduct_from_wallet
 
 predict_async_route = APIRouter(prefix="/predictions", tags=["predictions-async"])
@@ -15,6 +16,7 @@ COST_PER_PREDICT = 1.0
 
 @predict_async_route.post(
     "/async",
+    dependencies=[Depends(rate_limit("jobs"))],
     response_model=JobOut,
     status_code=status.HTTP_202_ACCEPTED,
     summary="Создать асинхронную ML-задачу",
@@ -35,7 +37,8 @@ def create_async_job(
 
     # создаём запись и публикуем сообщение
     job = create_job(user_id=data.user_id, theme_id=data.theme_id, model_type=data.model_type, session=session)
-    publish_task(queue_name=f"queue.{data.model_type}", message={"job_id": job.id})
+    # бонусные (оплаченные) задачи — в быструю полосу
+    publish_task(queue_name=job_queue(data.model_type, data.is_bonus), message={"job_id": job.id})
     return job
 
 @predict_async_route.get(
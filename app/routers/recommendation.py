@@ -0,0 +1,44 @@
+# app/routers/recommendation.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+import logging
+
+from database.database import get_session
+from dependencies.auth import TokenData
+from dependencies.authz import self_or_admin
+from schemas.recommendation import RecommendationOut
+from schemas.theme import ThemeResponse
+from services.spaced_repetition import recommend_next_theme
+
+logger = logging.getLogger(__name__)
+recommend_route = APIRouter(prefix="/recommendations", tags=["recommendations"])
+
+
+@recommend_route.get(
+    "/{user_id}",
+    response_model=RecommendationOut,
+    summary="Следующая тема для изучения/повторения",
+    description="Интервальное повторение (SM-2): просроченные повторения, затем новые темы по порядку каталога.",
+)
+def recommend_theme(
+    user_id: int,
+    session: Session = Depends(get_session),
+    _: TokenData = Depends(self_or_admin),
+) -> RecommendationOut:
+    """
+    Только чтение: выбор темы — 1–2 индексных запроса независимо от размера
+    каталога и истории. Расписание двигает сдача панели, а не этот GET.
+    """
+    theme, schedule = recommend_next_theme(user_id, session)
+    if theme is None:
+        raise HTTPException(status_code=404, detail="Нет доступных тем")
+
+    out = RecommendationOut(
+        theme=ThemeResponse.model_validate(theme),
+        is_new=schedule is None,
+        due_at=schedule.due_at if schedule else None,
+        repetitions=schedule.repetitions if schedule else 0,
+        interval_days=schedule.interval_days if schedule else 0.0,
+    )
+    logger.info("Рекомендация: user_id=%s, theme_id=%s, new=%s", user_id, theme.id, out.is_new)
+    return out
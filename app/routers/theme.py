@@ -1,11 +1,14 @@
 # app/routers/theme.py
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
 from sqlmodel import Session
 from typing import List, Dict
 import logging
+import os
 
 from database.database import get_session
 from services.crud import theme as ThemeService
+from services.theme_catalog import theme_catalog, CatalogEntry
+from services.theme_index import theme_index
 from models.theme import Theme
 from schemas.theme import ThemeCreate, ThemeResponse
 from schemas.common import ActionMessage
@@ -14,26 +17,49 @@ from dependencies.auth import get_current_admin, TokenData
 logger = logging.getLogger(__name__)
 theme_route = APIRouter(prefix="/themes", tags=["themes"])
 
+# Браузер всегда ревалидирует (дёшево: 304 без тела), nginx держит микрокэш
+# по X-Accel-Expires — этот заголовок клиенту не передаётся.
+THEME_CACHE_CONTROL = os.getenv("THEME_CACHE_CONTROL", "public, no-cache")
+THEME_PROXY_TTL = os.getenv("THEME_CACHE_PROXY_TTL", "5")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = (t.strip() for t in if_none_match.split(","))
+    return any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
+
+
+def _catalog_response(entry: CatalogEntry, request: Request) -> Response:
+    """Отдаёт готовое тело из каталога; при совпадении ETag — 304 без тела."""
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": THEME_CACHE_CONTROL,
+        "X-Accel-Expires": THEME_PROXY_TTL,
+    }
+    inm = request.headers.get("if-none-match")
+    if inm and _etag_matches(inm, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 @theme_route.get(
         "/", 
         response_model=List[ThemeResponse], 
         summary="Список тем",
         description="Вернуть все доступные темы.",
     )
-def list_themes(session: Session = Depends(get_session)) -> List[ThemeResponse]:
-    rows = ThemeService.get_all_themes(session)
-    logger.info("Тем загружено: %d", len(rows))
-    return [ThemeResponse.model_validate(r) for r in rows]
+def list_themes(request: Request, session: Session = Depends(get_session)) -> List[ThemeResponse]:
+    # без обращения к БД, пока версия каталога не изменилась
+    return _catalog_response(theme_catalog.all(session), request)
 
 @theme_route.get(
         "/level/{level}",
         response_model=List[ThemeResponse], 
         summary="Темы по уровню",
         )
-def get_themes_by_level(level: str, session: Session = Depends(get_session)) -> List[ThemeResponse]:
-    rows = ThemeService.get_themes_by_level(level, session)
-    logger.info("Тем уровня %s: %d", level, len(rows))
-    return [ThemeResponse.model_validate(r) for r in rows]
+def get_themes_by_level(level: str, request: Request, session: Session = Depends(get_session)) -> List[ThemeResponse]:
+    return _catalog_response(theme_catalog.by_level(level, session), request)
 
 @theme_route.get(
         "/{theme_id}",
@@ -41,12 +67,12 @@ def get_themes_by_level(level: str, session: Session = Depends(get_session)) ->
         summary="Получить тему по ID",
         description="Вернуть тему по её ID. Если тема не найдена, вернёт 404.",
     )
-def get_theme(theme_id: int, session: Session = Depends(get_session)) -> ThemeResponse:
-    t = ThemeService.get_theme_by_id(theme_id, session)
-    if not t:
+def get_theme(theme_id: int, request: Request, session: Session = Depends(get_session)) -> ThemeResponse:
+    entry = theme_catalog.by_id(theme_id, session)
+    if not entry:
         logger.warning("Тема не найдена: id=%s", theme_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
-    return ThemeResponse.model_validate(t)
+    return _catalog_response(entry, request)
 
 @theme_route.post(
         "/", 
@@ -67,6 +93,7 @@ def create_theme(
             bonus_comics=data.bonus_comics,
         )
         theme = ThemeService.create_theme(theme, session)
+        theme_index.notify_changed()
         logger.info("Создана тема: id=%s, name=%s", theme.id, theme.name)
         return ThemeResponse.model_validate(theme)
     except Exception as e:
@@ -87,5 +114,6 @@ def delete_theme(
     if not ok:
         logger.warning("Удаление темы — не найдена: id=%s", theme_id)
         raise HTTPException(status_code=404, detail="Тема не найдена")
+    theme_index.notify_changed()
     logger.info("Тема удалена: id=%s", theme_id)
     return ActionMessage(message=f"Тема удалена (id={theme_id})")
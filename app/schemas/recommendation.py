@@ -0,0 +1,14 @@
+# app/schemas/recommendation.py
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional
+
+from schemas.theme import ThemeResponse
+
+
+class RecommendationOut(BaseModel):
+    theme: ThemeResponse = Field(..., description="Рекомендуемая тема")
+    is_new: bool = Field(..., description="Тема ещё не изучалась (первое знакомство)")
+    due_at: Optional[datetime] = Field(None, description="Когда тема стала/станет доступной для повторения")
+    repetitions: int = Field(0, description="Успешных повторений подряд")
+    interval_days: float = Field(0.0, description="Текущий интервал повторения (дни)")
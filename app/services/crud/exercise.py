@@ -0,0 +1,66 @@
+import json
+from sqlmodel import Session, select
+from sqlalchemy import bindparam
+from sqlalchemy.engine import Row
+from models.exercise import Exercise
+from models.exercise_set import ExerciseSet
+from services.exercise_codec import decode_questions
+from typing import Dict, Iterable, Optional
+
+_t = Exercise.__table__
+_s = ExerciseSet.__table__
+
+# Core-запросы с bindparam: компилируются один раз и берутся из кэша SQLAlchemy,
+# ORM-объекты не строятся, сами вопросы не читаются. grading — из общего набора;
+# у старых строк (set_id IS NULL) он NULL, и проверка идёт по payload_json.
+_GRADING_COLS = (_t.c.id, _t.c.user_id, _t.c.theme_id, _t.c.difficulty, _s.c.grading)
+_GRADING_FROM = _t.outerjoin(_s, _s.c.id == _t.c.set_id)
+_GRADING_BY_ID = (
+    select(*_GRADING_COLS).select_from(_GRADING_FROM)
+    .where(_t.c.id == bindparam("exercise_id"))
+)
+_GRADING_BY_IDS = (
+    select(*_GRADING_COLS).select_from(_GRADING_FROM)
+    .where(_t.c.id.in_(bindparam("exercise_ids", expanding=True)))
+)
+_PAYLOAD_BY_ID = select(_t.c.payload_json).where(_t.c.id == bindparam("exercise_id"))
+
+
+def get_grading_row(exercise_id: int, session: Session) -> Optional[Row]:
+    """(id, user_id, theme_id, difficulty, grading) упражнения одним поиском по PK."""
+    return session.execute(_GRADING_BY_ID, {"exercise_id": exercise_id}).first()
+
+
+def get_grading_rows(exercise_ids: Iterable[int], session: Session) -> Dict[int, Row]:
+    """То же для пачки упражнений одним IN-запросом: {exercise_id: row}."""
+    ids = list(exercise_ids)
+    if not ids:
+        return {}
+    return {row.id: row for row in session.execute(_GRADING_BY_IDS, {"exercise_ids": ids})}
+
+
+def get_payload_json(exercise_id: int, session: Session) -> Optional[str]:
+    return session.execute(_PAYLOAD_BY_ID, {"exercise_id": exercise_id}).scalar_one_or_none()
+
+
+def get_exercise_payload(exercise_id: int, session: Session) -> Optional[dict]:
+    """
+    Полный набор упражнения с ответами: {"theme_id", "level", "difficulty", "questions"}.
+    Работает и для новых строк (ExerciseSet), и для старых (payload_json).
+    """
+    row = session.exec(
+        select(Exercise, ExerciseSet)
+        .outerjoin(ExerciseSet, ExerciseSet.id == Exercise.set_id)
+        .where(Exercise.id == exercise_id)
+    ).first()
+    if row is None:
+        return None
+    ex, ex_set = row
+    if ex_set is None:
+        return json.loads(ex.payload_json or "{}")
+    return {
+        "theme_id": ex.theme_id,
+        "level": ex.level,
+        "difficulty": ex.difficulty,
+        "questions": decode_questions(ex_set.codec, ex_set.questions, ex_set.blob),
+    }
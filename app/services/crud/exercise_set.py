@@ -0,0 +1,43 @@
+from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+from models.exercise_set import ExerciseSet
+from services.exercise_codec import Questions, content_hash, encode_questions
+from services.panel_grading import encode_grading
+from typing import Optional
+
+
+def get_set_by_hash(digest: str, session: Session) -> Optional[ExerciseSet]:
+    return session.exec(select(ExerciseSet).where(ExerciseSet.content_hash == digest)).first()
+
+
+def get_or_create_set_no_commit(questions: Questions, session: Session) -> ExerciseSet:
+    """
+    Найти набор по хэшу содержимого или создать его БЕЗ commit().
+    Вставка — в SAVEPOINT: при гонке двух запросов с одинаковым набором
+    проигравший получает IntegrityError, откатывает только SAVEPOINT
+    и берёт уже вставленную строку.
+    """
+    digest = content_hash(questions)
+    found = get_set_by_hash(digest, session)
+    if found is not None:
+        return found
+
+    codec, as_json, blob = encode_questions(questions)
+    row = ExerciseSet(
+        content_hash=digest,
+        codec=codec,
+        questions=as_json,
+        blob=blob,
+        grading=encode_grading((q["id"], q.get("answer") or "") for q in questions),
+    )
+    savepoint = session.begin_nested()
+    try:
+        session.add(row)
+        session.flush()
+        savepoint.commit()
+    except IntegrityError:
+        savepoint.rollback()
+        row = get_set_by_hash(digest, session)
+        if row is None:
+            raise
+    return row
@@ -0,0 +1,51 @@
+from sqlmodel import Session, select
+from models.theme import Theme
+from models.theme_schedule import ThemeSchedule
+from typing import Dict, Iterable, Optional, Tuple
+
+
+def get_earliest_schedule(user_id: int, session: Session) -> Optional[Tuple[ThemeSchedule, Theme]]:
+    """
+    Ближайшая по due_at запись расписания пользователя вместе с темой.
+    Идёт по индексу (user_id, due_at) и читает одну строку.
+    """
+    statement = (
+        select(ThemeSchedule, Theme)
+        .join(Theme, Theme.id == ThemeSchedule.theme_id)
+        .where(ThemeSchedule.user_id == user_id)
+        .order_by(ThemeSchedule.due_at, ThemeSchedule.id)
+        .limit(1)
+    )
+    return session.exec(statement).first()
+
+
+def get_next_unseen_theme(user_id: int, session: Session) -> Optional[Theme]:
+    """
+    Первая по id тема без записи в расписании пользователя; темы, пропущенные
+    при повторении более поздних, тоже считаются новыми.
+    Anti-join (NOT EXISTS): темы перебираются по PK, и для каждой — одна проба
+    уникального индекса (user_id, theme_id). Стоимость растёт с числом уже
+    пройденных тем перед первой новой — O(seen), а не один поиск по индексу.
+    """
+    seen = select(ThemeSchedule.id).where(
+        ThemeSchedule.user_id == user_id,
+        ThemeSchedule.theme_id == Theme.id,
+    )
+    statement = select(Theme).where(~seen.exists()).order_by(Theme.id).limit(1)
+    return session.exec(statement).first()
+
+
+def get_schedules_for_themes(
+    user_id: int, theme_ids: Iterable[int], session: Session
+) -> Dict[int, ThemeSchedule]:
+    """
+    Записи расписания пользователя для набора тем одним IN-запросом.
+    """
+    ids = list(set(theme_ids))
+    if not ids:
+        return {}
+    statement = select(ThemeSchedule).where(
+        ThemeSchedule.user_id == user_id,
+        ThemeSchedule.theme_id.in_(ids),
+    )
+    return {row.theme_id: row for row in session.exec(statement).all()}
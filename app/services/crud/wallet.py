@@ -2,7 +2,7 @@ from sqlmodel import Session, select
 from models.wallet import Wallet
 from models.transaction_log import OperationType
 from services.crud.transaction_log import log_transaction
-from typing import Optional
+from typing import Iterable, Optional, Tuple
 
 def get_wallet_by_user_id(user_id: int, session: Session) -> Optional[Wallet]:
     """
@@ -71,6 +71,33 @@ def credit_for_reason_no_commit(user_id: int, amount: float, reason: str, sessio
         session=session,
     )
 
+def credit_many_no_commit(user_id: int, credits: Iterable[Tuple[float, str]], session: Session) -> float:
+    """
+    Несколько начислений одному пользователю БЕЗ commit():
+    баланс меняется один раз, лог транзакции пишется на каждое начисление.
+    Возвращает итоговую сумму.
+    """
+    credits = [(amount, reason) for amount, reason in credits if amount > 0]
+    if not credits:
+        return 0.0
+
+    wallet = get_wallet_by_user_id(user_id, session)
+    if not wallet:
+        raise ValueError("Кошелёк не найден")
+
+    total = sum(amount for amount, _ in credits)
+    wallet.add(total)
+    session.add(wallet)
+    for amount, reason in credits:
+        log_transaction(
+            user_id=user_id,
+            amount=amount,
+            operation=OperationType.credit.value,
+            reason=reason,
+            session=session,
+        )
+    return total
+
 def admin_top_up_wallet(user_id: int, amount: float, session: Session) -> Wallet:
     """
     Специальное пополнение админом (можно вести логи).
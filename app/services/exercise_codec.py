@@ -0,0 +1,65 @@
+# app/services/exercise_codec.py
+# Кодирование набора вопросов панели для ExerciseSet.
+#   json — JSON-колонка (JSONB на Postgres), без сжатия;
+#   zstd — сжатые байты, нужен пакет zstandard (иначе откат на zlib);
+#   zlib — сжатые байты, только stdlib.
+# Кодек выбирается через env EXERCISE_SET_CODEC; читаются все три.
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import zlib
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:  # опциональная зависимость
+    import zstandard as _zstd
+except ImportError:  # pragma: no cover - зависит от окружения
+    _zstd = None
+
+CODEC = os.getenv("EXERCISE_SET_CODEC", "json").lower()
+ZSTD_LEVEL = int(os.getenv("EXERCISE_SET_ZSTD_LEVEL", "9"))
+
+Questions = List[dict]
+
+
+def _canonical(questions: Questions) -> bytes:
+    return json.dumps(questions, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def content_hash(questions: Questions) -> str:
+    """sha256 канонического JSON: одинаковые наборы → одинаковый хэш."""
+    return hashlib.sha256(_canonical(questions)).hexdigest()
+
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    codec = (codec or CODEC).lower()
+    if codec == "zstd" and _zstd is None:
+        logger.warning("EXERCISE_SET_CODEC=zstd, но пакет zstandard не установлен — используется zlib")
+        return "zlib"
+    return codec if codec in ("json", "zstd", "zlib") else "json"
+
+
+def encode_questions(questions: Questions, codec: Optional[str] = None) -> Tuple[str, Optional[Any], Optional[bytes]]:
+    """→ (codec, questions для JSON-колонки | None, blob | None)."""
+    codec = resolve_codec(codec)
+    if codec == "json":
+        return codec, questions, None
+    raw = _canonical(questions)
+    if codec == "zstd":
+        return codec, None, _zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return codec, None, zlib.compress(raw, 9)
+
+
+def decode_questions(codec: str, questions: Optional[Any], blob: Optional[bytes]) -> Questions:
+    if codec == "json":
+        return list(questions or [])
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("Набор сжат zstd — нужен пакет zstandard")
+        raw = _zstd.ZstdDecompressor().decompress(bytes(blob))
+    else:
+        raw = zlib.decompress(bytes(blob))
+    return json.loads(raw)
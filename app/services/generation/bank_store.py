@@ -0,0 +1,213 @@
+# app/services/generation/bank_store.py
+# Большой банк упражнений в бинарном файле, читаемом через mmap.
+#
+# Формат (.spbank, little-endian):
+#   b"SPBANK1\0" | u32 длина заголовка | заголовок (JSON) | выравнивание до 8 |
+#   offsets: (N+1) x u64 относительно начала data | data: записи подряд.
+# Запись — UTF-8 строка "prompt\x1fanswer\x1fchoice1\x1fchoice2...".
+# Записи отсортированы по (уровень, тема), поэтому каждой паре соответствует
+# непрерывный диапазон [start, start+count) — он хранится в заголовке.
+#
+# Файл открывается только на чтение: страницы делятся между всеми воркерами
+# uvicorn через page cache ОС, а выборка декодирует лишь k выбранных записей.
+from __future__ import annotations
+import argparse
+import json
+import mmap
+import random
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from services.generation.exercise_bank import BankItem, _coerce_item
+from services.generation.keyword_index import KeywordMatcher
+
+MAGIC = b"SPBANK1\0"
+SEP = "\x1f"
+
+
+def _clean(s: str) -> str:
+    return str(s).replace(SEP, " ").strip()
+
+
+def build_bank_file(src_path: str, dst_path: str) -> Dict[str, int]:
+    """Собрать .spbank из JSONL ({"level", "topic", "prompt", "choices", "answer"} на строку)."""
+    groups: Dict[Tuple[str, str], List[bytes]] = {}
+    skipped = 0
+    with open(src_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            item = _coerce_item(row)
+            if item is None:
+                skipped += 1
+                continue
+            prompt, choices, answer = item
+            level = str(row.get("level") or "A1").strip().upper()
+            topic = str(row.get("topic") or "general")
+            rec = SEP.join([_clean(prompt), _clean(answer), *(_clean(c) for c in choices)])
+            groups.setdefault((level, topic), []).append(rec.encode("utf-8"))
+
+    segments: Dict[str, Dict[str, List[int]]] = {}
+    offsets = array("Q", [0])
+    chunks: List[bytes] = []
+    pos = 0
+    for (level, topic) in sorted(groups):
+        recs = groups[(level, topic)]
+        segments.setdefault(level, {})[topic] = [len(offsets) - 1, len(recs)]
+        for rec in recs:
+            chunks.append(rec)
+            pos += len(rec)
+            offsets.append(pos)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    header = json.dumps(
+        {"version": 1, "count": len(offsets) - 1, "segments": segments},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    head_len = len(MAGIC) + 4 + len(header)
+    pad = (-head_len) % 8
+    with open(dst_path, "wb") as out:
+        out.write(MAGIC)
+        out.write(struct.pack("<I", len(header)))
+        out.write(header)
+        out.write(b"\0" * pad)
+        out.write(offsets.tobytes())
+        for rec in chunks:
+            out.write(rec)
+    return {"items": len(offsets) - 1, "skipped": skipped, "segments": len(groups)}
+
+
+class MmapBank:
+    """
+    Банк поверх mmap с тем же интерфейсом, что CompiledBank:
+    match_topic(), sample(), has_topic(), has_level(), len().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: не .spbank файл")
+        (head_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mm[start:start + head_len].decode("utf-8"))
+        self._count = int(header["count"])
+        off_at = start + head_len
+        off_at += (-off_at) % 8
+        off_len = 8 * (self._count + 1)
+        if sys.byteorder == "little":
+            self._offsets = memoryview(self._mm)[off_at:off_at + off_len].cast("Q")
+        else:  # редкий случай: копия с перестановкой байт
+            arr = array("Q", self._mm[off_at:off_at + off_len])
+            arr.byteswap()
+            self._offsets = arr
+        self._data_at = off_at + off_len
+
+        # (уровень → тема → (start, count)) и диапазоны уровней
+        self.segments: Dict[str, Dict[str, Tuple[int, int]]] = {
+            lvl: {k: (int(s), int(c)) for k, (s, c) in topics.items()}
+            for lvl, topics in header["segments"].items()
+        }
+        self._level_range: Dict[str, Tuple[int, int]] = {}
+        self._matchers: Dict[str, KeywordMatcher[str]] = {}
+        for lvl, topics in self.segments.items():
+            lo = min(s for s, _ in topics.values())
+            hi = max(s + c for s, c in topics.values())
+            self._level_range[lvl] = (lo, hi)
+            self._matchers[lvl] = KeywordMatcher(
+                (syn, key) for key in topics for syn in key.split("|")
+            )
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._mm.close()
+        self._file.close()
+
+    def has_level(self, level_key: str) -> bool:
+        return level_key in self.segments
+
+    def has_topic(self, level_key: str, topic_key: Optional[str]) -> bool:
+        return bool(topic_key) and topic_key in self.segments.get(level_key, {})
+
+    def match_topic(self, theme_name: str, level_key: str) -> Optional[str]:
+        m = self._matchers.get(level_key)
+        return m.best(theme_name) if m else None
+
+    def item(self, i: int) -> BankItem:
+        a, b = self._offsets[i], self._offsets[i + 1]
+        base = self._data_at
+        parts = self._mm[base + a:base + b].decode("utf-8").split(SEP)
+        return parts[0], tuple(parts[2:]), parts[1]
+
+    def sample(self, level_key: str, topic_key: Optional[str], k: int) -> List[BankItem]:
+        seg = self.segments.get(level_key, {}).get(topic_key) if topic_key else None
+        if seg:
+            lo, hi = seg[0], seg[0] + seg[1]
+        elif level_key in self._level_range:
+            lo, hi = self._level_range[level_key]
+        else:
+            return []
+        idx = random.sample(range(lo, hi), min(max(1, k), hi - lo))
+        return [self.item(i) for i in idx]
+
+
+class BankChain:
+    """Несколько банков по приоритету: большой внешний, затем встроенный."""
+
+    def __init__(self, *banks):
+        self.banks = banks
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self.banks)
+
+    def match_topic(self, theme_name: str, level_key: str) -> Optional[str]:
+        for b in self.banks:
+            key = b.match_topic(theme_name, level_key)
+            if key:
+                return key
+        return None
+
+    def sample(self, level_key: str, topic_key: Optional[str], k: int) -> List[BankItem]:
+        for b in self.banks:
+            if b.has_topic(level_key, topic_key):
+                return b.sample(level_key, topic_key, k)
+        for b in self.banks:
+            if b.has_level(level_key):
+                return b.sample(level_key, None, k)
+        return []
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Сборка/проверка бинарного банка упражнений (.spbank)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="JSONL → .spbank")
+    b.add_argument("src")
+    b.add_argument("dst")
+    s = sub.add_parser("sample", help="случайные элементы из .spbank")
+    s.add_argument("path")
+    s.add_argument("--level", default="A1")
+    s.add_argument("--theme", default="")
+    s.add_argument("-k", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        print(json.dumps(build_bank_file(args.src, args.dst), ensure_ascii=False))
+    else:
+        bank = MmapBank(args.path)
+        key = bank.match_topic(args.theme, args.level) if args.theme else None
+        for p, c, a in bank.sample(args.level, key, args.k):
+            print(json.dumps({"topic": key, "prompt": p, "choices": list(c), "answer": a}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# app/services/generation/exercise_bank.py
+# Скомпилированный банк заглушек для панели упражнений.
+# Источник — словарь {уровень: {"ключ|синоним": [(prompt, choices, answer), ...]}}
+# (как FALLBACK_BANK) и/или внешний файл (JSONL, JSON, YAML). Компиляция — один раз:
+# элементы проверяются и хранятся компактными кортежами, для каждого уровня строится
+# автомат Ахо–Корасик «синоним → ключ темы». Выборка k элементов — O(k).
+from __future__ import annotations
+import json
+import logging
+import random
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from services.generation.keyword_index import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+# (prompt, choices, answer)
+BankItem = Tuple[str, Tuple[str, ...], str]
+BankSource = Mapping[str, Mapping[str, Iterable[Any]]]
+
+
+class LevelBank:
+    __slots__ = ("topics", "all_items", "matcher")
+
+    def __init__(self, topics: Dict[str, List[BankItem]]):
+        self.topics = topics
+        self.all_items: List[BankItem] = [it for items in topics.values() for it in items]
+        self.matcher: KeywordMatcher[str] = KeywordMatcher(
+            (syn, key) for key in topics for syn in key.split("|")
+        )
+
+
+class CompiledBank:
+    def __init__(self, levels: Dict[str, LevelBank]):
+        self.levels = levels
+
+    def __len__(self) -> int:
+        return sum(len(lb.all_items) for lb in self.levels.values())
+
+    def has_level(self, level_key: str) -> bool:
+        return level_key in self.levels
+
+    def has_topic(self, level_key: str, topic_key: Optional[str]) -> bool:
+        lb = self.levels.get(level_key)
+        return bool(topic_key) and lb is not None and bool(lb.topics.get(topic_key))
+
+    def match_topic(self, theme_name: str, level_key: str) -> Optional[str]:
+        lb = self.levels.get(level_key)
+        return lb.matcher.best(theme_name) if lb else None
+
+    def sample(self, level_key: str, topic_key: Optional[str], k: int) -> List[BankItem]:
+        """k случайных элементов темы (или всего уровня, если тема не задана)."""
+        lb = self.levels.get(level_key)
+        if lb is None:
+            return []
+        pool = lb.topics.get(topic_key) if topic_key else None
+        if not pool:
+            pool = lb.all_items
+        return random.sample(pool, min(max(1, k), len(pool)))
+
+
+def _coerce_item(raw: Any) -> Optional[BankItem]:
+    if isinstance(raw, Mapping):
+        prompt, choices, answer = raw.get("prompt"), raw.get("choices"), raw.get("answer")
+    elif isinstance(raw, (list, tuple)) and len(raw) == 3:
+        prompt, choices, answer = raw
+    else:
+        return None
+    if not isinstance(prompt, str) or not prompt.strip():
+        return None
+    if not isinstance(choices, (list, tuple)) or not choices:
+        return None
+    choices_t = tuple(str(c) for c in choices)
+    answer = str(answer or "")
+    if answer not in choices_t:
+        return None
+    return prompt, choices_t, answer
+
+
+def compile_bank(*sources: BankSource) -> CompiledBank:
+    """Слить источники (одинаковые ключи тем объединяются) и скомпилировать."""
+    merged: Dict[str, Dict[str, List[BankItem]]] = {}
+    skipped = 0
+    for source in sources:
+        for level, topics in source.items():
+            lvl = merged.setdefault(str(level).strip().upper(), {})
+            for key, items in topics.items():
+                bucket = lvl.setdefault(key, [])
+                for raw in items:
+                    item = _coerce_item(raw)
+                    if item is None:
+                        skipped += 1
+                        continue
+                    bucket.append(item)
+    if skipped:
+        logger.warning("exercise bank: skipped %d malformed items", skipped)
+    return CompiledBank({lvl: LevelBank(topics) for lvl, topics in merged.items()})
+
+
+def load_bank_file(path: str) -> Dict[str, Dict[str, List[Any]]]:
+    """
+    Загрузить внешний банк.
+    JSONL: по строке на элемент {"level", "topic", "prompt", "choices", "answer"}.
+    JSON/YAML: {уровень: {ключ: [{"prompt", "choices", "answer"} | [p, c, a], ...]}}.
+    """
+    lower = path.lower()
+    if lower.endswith((".yaml", ".yml")):
+        try:
+            import yaml  # опциональная зависимость
+        except ImportError as e:
+            raise RuntimeError("Для YAML-банка нужен пакет PyYAML") from e
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    if lower.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    bank: Dict[str, Dict[str, List[Any]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            level = str(row.get("level") or "A1")
+            topic = str(row.get("topic") or "general")
+            bank.setdefault(level, {}).setdefault(topic, []).append(row)
+    return bank
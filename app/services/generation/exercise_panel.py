@@ -2,14 +2,21 @@
 from __future__ import annotations
 import os
 import logging
-import random
+import time
+from functools import lru_cache
 from typing import List
 from pydantic import BaseModel, Field
-from services.llm.ollama_client import generate_exercises as ollama_generate
+from services.llm.ollama_client import generate_exercises as ollama_generate, remember_exercises, enabled as ollama_enabled
+from services.generation.exercise_bank import CompiledBank, compile_bank, load_bank_file
+from services.generation.bank_store import BankChain, MmapBank
+from core.metrics import PANEL_FALLBACK
 import concurrent.futures
+import contextvars
 
 SOFT_TIMEOUT = float(os.getenv("PANEL_SOFT_TIMEOUT", "20"))
 DEFAULT_PANEL_COUNT = int(os.getenv("PANEL_DEFAULT_COUNT", "1"))
+# внешний банк заглушек (JSONL/JSON/YAML), дополняет FALLBACK_BANK
+BANK_PATH = os.getenv("PANEL_BANK_PATH", "")
 # На вход — "сырой" словарь упражнения, на выход — pydantic-модель в роутере
 class RawExercise(BaseModel):
     id: str 
@@ -115,61 +122,97 @@ FALLBACK_BANK = {
     },
 }
 
-def _normalize_level(level: str) -> str:
+def normalize_level(level: str) -> str:
+    """'a2+', ' B1 ' → ключ уровня банка (A1|A2|B1|B2); неизвестное — A1."""
     lvl = (level or "A1").strip().upper()
     for key in ("A1", "A2", "B1", "B2"):
         if lvl.startswith(key):
             return key
     return "A1"
 
-def _fallback_generate(theme_name: str, count: int, level: str) -> List[RawExercise]:
-    bank = FALLBACK_BANK[_normalize_level(level)]
-    # подбираем подходящую тему по ключам; если не нашли — берём всё подряд
-    def _match_topic_key(theme_name: str, keys: list[str]) -> str | None:
-        t = (theme_name or "").lower()
-        for k in keys:
-            for v in [s.strip() for s in k.split("|")]:
-                if v and v in t:
-                    return k
-        return None
-    
-    topic_key = _match_topic_key(theme_name, list(bank.keys()))
-    pool: list[tuple[str, list[str], str]] = []
-    if topic_key:
-        pool.extend(bank[topic_key])
-    else:
-        for lst in bank.values():
-            pool.extend(lst)
+@lru_cache(maxsize=1)
+def get_bank() -> CompiledBank | BankChain:
+    """
+    FALLBACK_BANK + внешний банк из PANEL_BANK_PATH, компилируется один раз на процесс.
+    .spbank (см. bank_store) не загружается в память: он открывается через mmap
+    и опрашивается первым, встроенный банк остаётся запасным.
+    """
+    sources = [FALLBACK_BANK]
+    if BANK_PATH.lower().endswith(".spbank"):
+        try:
+            external = MmapBank(BANK_PATH)
+            logging.getLogger(__name__).info("Exercise bank mapped: %s (%d items)", BANK_PATH, len(external))
+            return BankChain(external, compile_bank(*sources))
+        except Exception as e:
+            logging.getLogger(__name__).error("Failed to map exercise bank %s: %s", BANK_PATH, e)
+    elif BANK_PATH:
+        try:
+            sources.append(load_bank_file(BANK_PATH))
+        except Exception as e:
+            logging.getLogger(__name__).error("Failed to load exercise bank %s: %s", BANK_PATH, e)
+    bank = compile_bank(*sources)
+    logging.getLogger(__name__).info("Exercise bank compiled: %d items", len(bank))
+    return bank
 
-    random.shuffle(pool)
-    picked = pool[:max(1, count)]
-    return [RawExercise(id=f"q{i}", prompt=p, choices=c, answer=a)
+def match_topic_key(theme_name: str, level: str) -> str | None:
+    """Ключ темы банка для уровня по вхождению синонимов ключа в название."""
+    return get_bank().match_topic(theme_name, normalize_level(level))
+
+def _fallback_generate(theme_name: str, count: int, level: str, topic_key: str | None = None) -> List[RawExercise]:
+    level_key = normalize_level(level)
+    bank = get_bank()
+    # подбираем подходящую тему по ключам; если не нашли — берём всё подряд
+    if topic_key is None:
+        topic_key = bank.match_topic(theme_name, level_key)
+    picked = bank.sample(level_key, topic_key, count)
+    # элементы уже проверены при компиляции банка — собираем модели без валидации
+    return [RawExercise.model_construct(id=f"q{i}", prompt=p, choices=list(c), answer=a)
             for i, (p, c, a) in enumerate(picked, start=1)]
 
-def build_panel(theme_name: str, count: int, level: str) -> List[RawExercise]:
+def llm_enabled() -> bool:
+    """Пойдёт ли build_panel в Ollama: банк не форсирован и Ollama включена."""
+    return os.getenv("PANEL_FORCE_FALLBACK", "0") != "1" and ollama_enabled()
+
+def build_panel(theme_name: str, count: int, level: str, topic_key: str | None = None,
+                use_llm: bool = True) -> List[RawExercise]:
     """
     Пробуем Ollama; при любой ошибке — мгновенный fallback.
     Можно принудительно форсировать заглушки через env PANEL_FORCE_FALLBACK=1.
+    topic_key — заранее найденный ключ FALLBACK_BANK (см. ThemeIndex).
+    use_llm=False — Ollama перегружена (services/llm/admission): сразу банк.
     """
     # фиксируем 1 задание (или сколько укажешь в env)
     count = DEFAULT_PANEL_COUNT
     # Форсируем заглушки (удобно на деве/когда Ollama недоступен)
     if os.getenv("PANEL_FORCE_FALLBACK", "0") == "1":
-        return _fallback_generate(theme_name, count, level)
+        PANEL_FALLBACK.inc(reason="forced")
+        return _fallback_generate(theme_name, count, level, topic_key)
+    if not use_llm:
+        PANEL_FALLBACK.inc(reason="shed")
+        return _fallback_generate(theme_name, count, level, topic_key)
 
     items = None
+    fallback_reason = "empty"
+    # даём Ollama шанс, но не дольше SOFT_TIMEOUT секунд; тот же срок — общий
+    # deadline генерации, чтобы брошенный по таймауту поток не начинал новых раундов
+    ex = concurrent.futures.ThreadPoolExecutor(max_workers=1)
     try:
-        # даём Ollama шанс, но не дольше SOFT_TIMEOUT секунд
-        #items = ollama_generate(theme_name=theme_name, count=count, level=level)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-            fut = ex.submit(ollama_generate, theme_name=theme_name, count=count, level=level)
-            items = fut.result(timeout=SOFT_TIMEOUT)
+        # копия контекста — чтобы спаны Ollama попали в трейс запроса
+        ctx = contextvars.copy_context()
+        fut = ex.submit(ctx.run, ollama_generate, theme_name=theme_name, count=count, level=level,
+                        deadline=time.monotonic() + SOFT_TIMEOUT)
+        items = fut.result(timeout=SOFT_TIMEOUT)
     except concurrent.futures.TimeoutError:
         logging.getLogger(__name__).warning("panel soft-timeout (%ss) -> fallback", SOFT_TIMEOUT)
+        fallback_reason = "soft_timeout"
         items = None
     except Exception as e:
         logging.getLogger(__name__).warning("Ollama failed, using fallback: %s", e)
+        fallback_reason = "error"
         items = None
+    finally:
+        # без ожидания: выход из with ждал бы Ollama, и soft-timeout не срабатывал
+        ex.shutdown(wait=False)
 
     if items:
         cleaned: List[RawExercise] = []
@@ -184,7 +227,10 @@ def build_panel(theme_name: str, count: int, level: str) -> List[RawExercise]:
             except Exception:
                 continue
         if cleaned:
+            # панель принята — только теперь её вопросы становятся «виденными»
+            remember_exercises(theme_name, level, items[:count])
             return cleaned
 
     # fallback всегда даёт результат
-    return _fallback_generate(theme_name, count, level)
\ No newline at end of file
+    PANEL_FALLBACK.inc(reason=fallback_reason)
+    return _fallback_generate(theme_name, count, level, topic_key)
\ No newline at end of file
@@ -3,20 +3,52 @@ import random
 from models.ml_model import MLModel
 from models.theme import Theme
 from models.task_log import TaskResult
+from services.generation.keyword_index import KeywordMatcher
 
 
+# Тематические правила: (правило, синонимы). Порядок = приоритет, как у прежних if-веток.
+_THEME_RULES = (
+    ("ser", ("ser",)),
+    ("adjectives", ("adjetiv", "прилагатель")),
+    ("past", ("pasado", "pretérito", "perfecto", "indefinido")),
+)
+_RULE_MATCHER: KeywordMatcher[str] = KeywordMatcher(
+    (kw, rule) for rule, kws in _THEME_RULES for kw in kws
+)
+
+_FOCUS = {
+    ("ser", True): "A1: спряжение 'ser' в настоящем времени.",
+    ("ser", False): "A2: контраст 'ser' vs 'estar' в типичных ситуациях.",
+    ("adjectives", True): "A1: согласование прилагательных по роду/числу.",
+    ("adjectives", False): "A2: сравнительные конструкции (más/menos/tan ... como).",
+    ("past", True): "A2: contraste pretérito perfecto vs indefinido (частые маркеры).",
+    ("past", False): "A2: contraste pretérito perfecto vs indefinido (частые маркеры).",
+}
+_THEME_VOCAB = {
+    ("ser", True): ["ser", "soy", "eres", "es"],
+    ("ser", False): ["ser", "estar", "es", "está", "somos"],
+    ("adjectives", True): ["grande", "pequeño", "bonito", "feo"],
+    ("adjectives", False): ["más", "menos", "tan", "como", "mejor", "peor"],
+    ("past", True): ["ayer", "anoche", "ya", "todavía", "nunca", "siempre"],
+    ("past", False): ["ayer", "anoche", "ya", "todavía", "nunca", "siempre"],
+}
+
+def match_theme_rule(theme_name: str) -> str | None:
+    """Тематическое правило (ser / adjectives / past) за один проход по названию."""
+    return _RULE_MATCHER.best(theme_name)
+
+def theme_vocab(theme_name: str, level: str) -> list[str] | None:
+    """Словарь по тематическому правилу или None, если тема не распознана."""
+    rule = match_theme_rule(theme_name)
+    if rule is None:
+        return None
+    return list(_THEME_VOCAB[(rule, (level or "A1").upper() == "A1")])
+
 def grammar_focus(theme_name: str, level: str) -> str:
-    t = (theme_name or "").lower()
     lvl = (level or "A1").upper()
-
-    if "ser" in t:
-        return "A1: спряжение 'ser' в настоящем времени." if lvl == "A1" \
-            else "A2: контраст 'ser' vs 'estar' в типичных ситуациях."
-    if "adjetiv" in t or "прилагатель" in t:
-        return "A1: согласование прилагательных по роду/числу." if lvl == "A1" \
-            else "A2: сравнительные конструкции (más/menos/tan ... como)."
-    if any(k in t for k in ["pasado", "pretérito", "perfecto", "indefinido"]):
-        return "A2: contraste pretérito perfecto vs indefinido (частые маркеры)."
+    rule = match_theme_rule(theme_name)
+    if rule is not None:
+        return _FOCUS[(rule, lvl == "A1")]
     if lvl.startswith("B1"):
         return "B1: subjuntivo básico, se impersonal, perífrasis."
     if lvl.startswith("B2"):
@@ -24,14 +56,10 @@ def grammar_focus(theme_name: str, level: str) -> str:
     return f"{lvl}: задания соответствующие уровню, без редких исключений."
 
 def _fallback_vocab_for(theme_name: str, level: str) -> list[str]:
-    t = (theme_name or "").lower()
+    vocab = theme_vocab(theme_name, level)
+    if vocab is not None:
+        return vocab
     lvl = (level or "A1").upper()
-    if "ser" in t:
-        return ["ser", "soy", "eres", "es"] if lvl == "A1" else ["ser", "estar", "es", "está", "somos"]
-    if "adjetiv" in t or "прилагатель" in t:
-        return ["grande", "pequeño", "bonito", "feo"] if lvl == "A1" else ["más", "menos", "tan", "como", "mejor", "peor"]
-    if any(k in t for k in ["pasado", "pretérito", "perfecto", "indefinido"]):
-        return ["ayer", "anoche", "ya", "todavía", "nunca", "siempre"]
     if lvl.startswith("B1"):
         return ["ojalá", "es importante que", "se dice", "llevar + gerundio"]
     if lvl.startswith("B2"):
@@ -66,7 +94,6 @@ def _sample_from_dist(dist: dict[str, float]) -> str:
 def _tweak_dist_for_theme(level: str, theme_name: str, is_bonus: bool) -> dict[str, float]:
     """Опционально корректируем распределение под тему/бонус."""
     base = _DIFF_DIST[_normalize_level(level)].copy()
-    t = (theme_name or "").lower()
 
     # Бонусные задания чуть сложнее
     if is_bonus:
@@ -75,7 +102,7 @@ def _tweak_dist_for_theme(level: str, theme_name: str, is_bonus: bool) -> dict[s
         base["easy"] = max(0.0, base["easy"] - 0.15)
 
     # Для «ser vs estar» на A2 можем чаще давать medium/hard
-    if "ser" in t and _normalize_level(level) == "A2":
+    if match_theme_rule(theme_name) == "ser" and _normalize_level(level) == "A2":
         base["hard"] += 0.1
         base["medium"] += 0.1
         base["easy"] = max(0.0, base["easy"] - 0.2)
@@ -94,9 +121,10 @@ class GrammarModel(MLModel):
     def __init__(self):
         super().__init__(name="GrammarModel", cost=0.0)
 
-    def generate_task(self, theme: Theme, is_bonus: bool = False) -> TaskResult:
+    def generate_task(self, theme: Theme, is_bonus: bool = False, focus: str | None = None) -> TaskResult:
+        # focus можно передать готовым (предрасчитан в ThemeIndex)
         difficulty = _choose_difficulty(theme.level, theme.name, is_bonus)
-        focus = grammar_focus(theme.name, theme.level)
+        focus = focus or grammar_focus(theme.name, theme.level)
         vocab = _fallback_vocab_for(theme.name, theme.level)
 
         explanation = f"{focus} | Тема: {theme.name} | Уровень: {theme.level} | Сложность: {difficulty}"
@@ -0,0 +1,77 @@
+# app/services/generation/keyword_index.py
+from __future__ import annotations
+from collections import deque
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class KeywordMatcher(Generic[T]):
+    """
+    Автомат Ахо–Корасик: поиск всех ключевых слов-подстрок за один проход по тексту.
+
+    Каждому слову сопоставлено значение (например, ключ темы). Приоритет значения —
+    порядок его первого появления в patterns, поэтому best() повторяет семантику
+    «первый ключ в словаре, у которого хоть один синоним входит в текст».
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, T]]):
+        self._values: List[T] = []
+        priority: Dict[object, int] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[int] = [-1]  # лучший (минимальный) приоритет, оканчивающийся в узле
+
+        for word, value in patterns:
+            word = (word or "").strip().lower()
+            if not word:
+                continue
+            if value not in priority:
+                priority[value] = len(self._values)
+                self._values.append(value)
+            self._add(word, priority[value])
+        self._build()
+
+    def _add(self, word: str, prio: int) -> None:
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(-1)
+            node = nxt
+        if self._best[node] == -1 or prio < self._best[node]:
+            self._best[node] = prio
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                inherited = self._best[self._fail[nxt]]
+                if inherited != -1 and (self._best[nxt] == -1 or inherited < self._best[nxt]):
+                    self._best[nxt] = inherited
+
+    def best(self, text: str) -> Optional[T]:
+        """Значение с наивысшим приоритетом среди всех слов, входящих в text."""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        node, best = 0, -1
+        for ch in (text or "").lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            b = best_at[node]
+            if b != -1 and (best == -1 or b < best):
+                best = b
+                if best == 0:
+                    break
+        return self._values[best] if best != -1 else None
@@ -0,0 +1,201 @@
+# app/services/generation/near_dup.py
+# Фильтр почти-дубликатов для сгенерированных упражнений.
+#
+# Отпечаток — 64-битный SimHash по символьным 3-граммам нормализованного
+# текста (регистр, диакритика и пунктуация не учитываются). Почти-дубликат —
+# отпечаток на расстоянии Хэмминга <= NEAR_DUP_MAX_DISTANCE от уже виденного.
+# Поиск через бэндинг: 64 бита режутся на (distance + 1) полос, и по принципу
+# Дирихле близкий отпечаток совпадает с запросом хотя бы в одной полосе целиком.
+# Поэтому проверка — несколько dict-lookup, а не перебор всей истории.
+#
+# В индекс попадают только упражнения принятых панелей (add после выдачи);
+# при генерации — проверка seen() без записи.
+#
+# Индекс свой на каждую пару (тема, уровень), живёт в памяти процесса и
+# периодически сбрасывается в JSON (NEAR_DUP_PATH) — это кэш: при гонке
+# процессов побеждает последний записавший, потеря части истории некритична.
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "1").lower() in {"1", "true", "yes"}
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))
+NEAR_DUP_MAX_PER_KEY = int(os.getenv("NEAR_DUP_MAX_PER_KEY", "5000"))
+NEAR_DUP_PATH = os.getenv("NEAR_DUP_PATH", "")
+NEAR_DUP_FLUSH_SEC = float(os.getenv("NEAR_DUP_FLUSH_SEC", "60"))
+
+Key = Tuple[str, str]
+_MASK64 = (1 << 64) - 1
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def _normalize(text: str) -> str:
+    t = unicodedata.normalize("NFD", (text or "").lower())
+    t = "".join(c for c in t if unicodedata.category(c) != "Mn")
+    return " ".join(_NON_WORD.sub(" ", t).replace("_", " ").split())
+
+
+def _feature_hash(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# Побитовые счётчики считаются «параллельно» в одном большом int: под каждый из
+# 64 бит — 16-битная ячейка; _SPREAD[b] раскладывает байт b по 8 ячейкам.
+_LANE = 16
+_SPREAD = [sum(1 << (_LANE * j) for j in range(8) if (b >> j) & 1) for b in range(256)]
+_MAX_SHINGLES = (1 << _LANE) - 1
+
+
+def simhash64(text: str) -> int:
+    norm = _normalize(text)
+    if len(norm) < 3:
+        return _feature_hash(norm)
+    shingles = {norm[i:i + 3] for i in range(len(norm) - 2)}
+    if len(shingles) > _MAX_SHINGLES:
+        shingles = set(list(shingles)[:_MAX_SHINGLES])
+    acc = 0
+    for sh in shingles:
+        h = _feature_hash(sh)
+        for k in range(8):
+            acc += _SPREAD[(h >> (8 * k)) & 0xFF] << (8 * _LANE * k)
+    # бит = 1, если он выставлен больше чем в половине признаков
+    n, lane_mask, out = len(shingles), (1 << _LANE) - 1, 0
+    for bit in range(64):
+        if 2 * ((acc >> (_LANE * bit)) & lane_mask) > n:
+            out |= 1 << bit
+    return out
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & _MASK64).bit_count()
+
+
+class _KeyIndex:
+    __slots__ = ("order", "bands")
+
+    def __init__(self, n_bands: int):
+        self.order: Deque[int] = deque()
+        self.bands: List[Dict[int, List[int]]] = [{} for _ in range(n_bands)]
+
+
+class NearDupIndex:
+    def __init__(self, max_distance: int = NEAR_DUP_MAX_DISTANCE, max_per_key: int = NEAR_DUP_MAX_PER_KEY,
+                 path: str = NEAR_DUP_PATH, flush_sec: float = NEAR_DUP_FLUSH_SEC):
+        self.max_distance = max(0, max_distance)
+        self.max_per_key = max_per_key
+        self.path = path
+        self.flush_sec = flush_sec
+        n = self.max_distance + 1
+        # границы полос: 64 бита на n почти равных частей
+        self._spans = [(64 * i // n, 64 * (i + 1) // n) for i in range(n)]
+        self._keys: Dict[Key, _KeyIndex] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def make_key(theme_name: str, level: str) -> Key:
+        return (_normalize(theme_name), (level or "A1").strip().upper()[:2])
+
+    def _band_values(self, fp: int):
+        for i, (lo, hi) in enumerate(self._spans):
+            yield i, (fp >> lo) & ((1 << (hi - lo)) - 1)
+
+    def _find(self, idx: _KeyIndex, fp: int) -> bool:
+        for i, val in self._band_values(fp):
+            for other in idx.bands[i].get(val, ()):
+                if hamming(fp, other) <= self.max_distance:
+                    return True
+        return False
+
+    def _insert(self, idx: _KeyIndex, fp: int) -> None:
+        idx.order.append(fp)
+        for i, val in self._band_values(fp):
+            idx.bands[i].setdefault(val, []).append(fp)
+        while len(idx.order) > self.max_per_key:
+            old = idx.order.popleft()
+            for i, val in self._band_values(old):
+                bucket = idx.bands[i].get(val)
+                if bucket:
+                    bucket.remove(old)
+                    if not bucket:
+                        del idx.bands[i][val]
+
+    def seen(self, key: Key, text: str) -> bool:
+        """Есть ли уже почти такой же текст для (тема, уровень)."""
+        fp = simhash64(text)
+        with self._lock:
+            idx = self._keys.get(key)
+            return idx is not None and self._find(idx, fp)
+
+    def add(self, key: Key, texts) -> int:
+        """
+        Записать тексты принятой панели; почти-дубликаты уже виденного пропускаются.
+        Возвращает, сколько добавлено. Проверка при генерации — только seen(),
+        иначе в историю попадали бы и упражнения отброшенных панелей.
+        """
+        fps = [simhash64(t) for t in texts]
+        added = 0
+        with self._lock:
+            idx = self._keys.get(key)
+            if idx is None:
+                idx = self._keys[key] = _KeyIndex(len(self._spans))
+            for fp in fps:
+                if not self._find(idx, fp):
+                    self._insert(idx, fp)
+                    added += 1
+            self._dirty = self._dirty or bool(added)
+        self._maybe_flush()
+        return added
+
+    def __len__(self) -> int:
+        return sum(len(idx.order) for idx in self._keys.values())
+
+    # ---- сохранение ----
+    def _maybe_flush(self) -> None:
+        if self.path and self._dirty and time.monotonic() - self._last_flush >= self.flush_sec:
+            self.save(self.path)
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            data = {"\t".join(key): [format(fp, "x") for fp in idx.order] for key, idx in self._keys.items()}
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        tmp = f"{path}.tmp{os.getpid()}"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "keys": data}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("near-dup index save failed (%s): %s", path, e)
+
+    def load(self, path: str) -> None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f).get("keys", {})
+        except (OSError, ValueError) as e:
+            logger.warning("near-dup index load failed (%s): %s", path, e)
+            return
+        with self._lock:
+            for raw_key, fps in data.items():
+                key = tuple(raw_key.split("\t", 1))
+                if len(key) != 2:
+                    continue
+                idx = self._keys.setdefault(key, _KeyIndex(len(self._spans)))
+                for fp in fps:
+                    self._insert(idx, int(fp, 16))
+
+
+near_dup_index = NearDupIndex()
@@ -4,21 +4,15 @@ from typing import List
 from models.ml_model import MLModel             
 from models.theme import Theme
 from models.task_log import TaskResult
+from services.generation.grammar import theme_vocab
 from services.llm.ollama_client import (
     enabled as ollama_enabled,
     generate_comic_task,    
 )
 
 def _fallback_vocab_for(theme_name: str, level: str) -> list[str]:
-        t = theme_name.lower()
-        lvl = (level or "A1").upper()
-        if "ser" in t:
-            return ["ser","soy","eres","es"] if lvl=="A1" else ["ser","estar","es","está","somos"]
-        if "adjetiv" in t or "прилагатель" in t:
-            return ["grande","pequeño","bonito","feo"] if lvl=="A1" else ["más","menos","tan","como","mejor","peor"]
-        if any(k in t for k in ["pasado","pretérito","perfecto","indefinido"]):
-            return ["ayer","anoche","ya","todavía","nunca","siempre"]
-        return ["palabra","nueva"]
+    # те же тематические правила, что и в GrammarModel, без уровневых B1/B2-списков
+    return theme_vocab(theme_name, level) or ["palabra", "nueva"]
 
 class SpanishComicModel(MLModel):
     """
@@ -29,7 +23,8 @@ class SpanishComicModel(MLModel):
     def __init__(self):
         super().__init__(name="SpanishComicModel", cost=0.0)
 
-    def generate_task(self, theme: Theme, is_bonus: bool = False) -> TaskResult:
+    def generate_task(self, theme: Theme, is_bonus: bool = False, use_llm: bool = True) -> TaskResult:
+        """use_llm=False — сразу фолбэк (перегрузка LLM, см. services/llm/admission)."""
         # 1. выбираем файл комикса как раньше
         comic_file = theme.get_bonus_comic() if is_bonus else theme.base_comic
         if is_bonus and not comic_file:
@@ -38,7 +33,7 @@ class SpanishComicModel(MLModel):
             raise ValueError("Нет комикса для этой темы")
 
         # 2. Попытка через Ollama
-        if ollama_enabled():
+        if use_llm and ollama_enabled():
             data = generate_comic_task(theme_name=theme.name, level=theme.level, is_bonus=is_bonus)
             if data:
                 vocab = data.get("vocabulary") or _fallback_vocab_for(theme.name, theme.level)
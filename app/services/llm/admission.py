@@ -0,0 +1,179 @@
+# app/services/llm/admission.py
+# Контроль допуска к Ollama для HTTP-эндпоинтов генерации.
+#
+# Ollama обрабатывает ограниченное число запросов параллельно (OLLAMA_NUM_PARALLEL),
+# остальные стоят в её очереди. Без ограничения всплеск на /predictions/,
+# /predictions/panel и /panel/generate копит очередь, и в таймаут уходят все.
+# Здесь — не больше LLM_MAX_INFLIGHT вызовов на процесс; ожидание слота
+# прогнозируется по скользящему среднему времени вызова. Если прогноз больше
+# бюджета ожидания класса, запрос не ставится в очередь:
+#   LLM_SHED_MODE=fallback — отдаём мгновенный ответ без LLM (банк/заглушка);
+#   LLM_SHED_MODE=reject   — 429 с Retry-After.
+#
+# Классы приоритета: LLM_PRIORITY_CLASSES="paid=3,free=1" — множитель бюджета
+# ожидания; класс с большим множителем и в очереди идёт первым. Бонусные
+# (оплаченные) запросы — "paid", остальные — "free".
+#
+# Лимит действует на процесс: при нескольких процессах API LLM_MAX_INFLIGHT
+# задаётся как доля общей параллельности Ollama.
+from __future__ import annotations
+import bisect
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from fastapi import HTTPException
+
+from core.metrics import LLM_ADMISSION, LLM_ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "4"))  # 0 — без ограничения
+LLM_WAIT_BUDGET = float(os.getenv("LLM_WAIT_BUDGET", "8"))  # секунд ожидания для множителя 1
+LLM_SHED_MODE = os.getenv("LLM_SHED_MODE", "fallback").lower()  # fallback | reject
+LLM_PRIORITY_CLASSES = os.getenv("LLM_PRIORITY_CLASSES", "paid=3,free=1")
+LLM_SERVICE_TIME = float(os.getenv("LLM_SERVICE_TIME", "4"))  # оценка вызова до первых замеров
+
+PAID, FREE = "paid", "free"
+
+
+def parse_classes(spec: str) -> Dict[str, float]:
+    """'paid=3,free=1' → {"paid": 3.0, "free": 1.0}; битые пары пропускаются."""
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, mult = part.partition("=")
+        try:
+            out[name.strip()] = float(mult)
+        except ValueError:
+            continue
+    return out or {PAID: 3.0, FREE: 1.0}
+
+
+def priority_for(is_bonus: bool) -> str:
+    return PAID if is_bonus else FREE
+
+
+class Overloaded(HTTPException):
+    """429 с Retry-After; наследник HTTPException — существующие ветки возврата кредитов его пропускают."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=429,
+            detail="Генерация перегружена, повторите позже",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class AdmissionController:
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT, wait_budget: float = LLM_WAIT_BUDGET,
+                 classes: Dict[str, float] | None = None, mode: str = LLM_SHED_MODE,
+                 service_time: float = LLM_SERVICE_TIME, alpha: float = 0.2):
+        self.max_inflight = max(0, int(max_inflight))
+        self.wait_budget = float(wait_budget)
+        self.classes = classes or parse_classes(LLM_PRIORITY_CLASSES)
+        self.mode = mode
+        self.service_time = float(service_time)
+        self.alpha = alpha
+        # ранг: 0 — самый приоритетный (наибольший множитель бюджета)
+        self._rank = {name: i for i, name in enumerate(sorted(self.classes, key=lambda n: -self.classes[n]))}
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._waiters: List[Tuple[int, int]] = []  # (ранг, порядковый номер), отсортирован
+        self._seq = itertools.count()
+
+    def _budget(self, priority: str) -> float:
+        return self.wait_budget * self.classes.get(priority, 1.0)
+
+    def _rank_of(self, priority: str) -> int:
+        return self._rank.get(priority, len(self._rank))
+
+    def _projected_wait(self, rank: int) -> float:
+        """Прогноз ожидания для нового запроса ранга rank (под self._cond)."""
+        ahead = bisect.bisect_right(self._waiters, (rank, math.inf))
+        if self._inflight < self.max_inflight and ahead == 0:
+            return 0.0
+        return (ahead + 1) / self.max_inflight * self.service_time
+
+    @contextmanager
+    def admit(self, priority: str = FREE, calls_llm: bool = True) -> Iterator[bool]:
+        """
+        with admission.admit(priority) as use_llm: ...
+        True — слот получен, можно звать Ollama; False — перегрузка, отдать ответ без LLM.
+        В режиме reject вместо False — Overloaded (429).
+        calls_llm=False — вызова Ollama не будет (выключена, форсирован банк): слот
+        не занимается, иначе мгновенные «вызовы» тянули бы service_time к нулю
+        и прогноз ожидания перестал бы срабатывать.
+        """
+        if not self.max_inflight or not calls_llm:
+            yield True
+            return
+        t0 = time.monotonic()
+        admitted, projected = self._acquire(priority)
+        waited = time.monotonic() - t0
+        if not admitted:
+            if self.mode == "reject":
+                LLM_ADMISSION.inc(priority=priority, outcome="rejected")
+                raise Overloaded(projected)
+            LLM_ADMISSION.inc(priority=priority, outcome="fallback")
+            yield False
+            return
+        LLM_ADMISSION.inc(priority=priority, outcome="admitted")
+        LLM_ADMISSION_WAIT.observe(waited, priority=priority)
+        started = time.monotonic()
+        try:
+            yield True
+        finally:
+            self._release(time.monotonic() - started)
+
+    def _acquire(self, priority: str) -> Tuple[bool, float]:
+        rank, budget = self._rank_of(priority), self._budget(priority)
+        with self._cond:
+            projected = self._projected_wait(rank)
+            if projected == 0.0:
+                self._inflight += 1
+                return True, 0.0
+            if projected > budget:
+                logger.info("LLM admission: shed %s (projected wait %.1fs > budget %.1fs)", priority, projected, budget)
+                return False, projected
+            key = (rank, next(self._seq))
+            bisect.insort(self._waiters, key)
+            deadline = time.monotonic() + budget
+            try:
+                while not (self._inflight < self.max_inflight and self._waiters[0] == key):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        logger.info("LLM admission: %s waited %.1fs without a slot", priority, budget)
+                        return False, self._projected_wait(rank)
+                    self._cond.wait(left)
+                self._inflight += 1
+                return True, 0.0
+            finally:
+                self._waiters.remove(key)
+                # следующий в очереди перепроверит условие
+                self._cond.notify_all()
+
+    def _release(self, elapsed: float) -> None:
+        with self._cond:
+            self._inflight -= 1
+            self.service_time += self.alpha * (elapsed - self.service_time)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": self._inflight,
+                "queued": len(self._waiters),
+                "service_time_s": round(self.service_time, 3),
+                "wait_budget_s": {name: self._budget(name) for name in self.classes},
+                "mode": self.mode,
+            }
+
+
+admission = AdmissionController()
@@ -1,58 +1,67 @@
 # app/services/llm/ollama_client.py
 from __future__ import annotations
-import os, json, logging, requests, random
-from typing import Any, List, Dict, Optional
+import os, json, logging, requests, random, time
+from typing import Any, List, Dict, Optional, Sequence, Tuple
+
+from services.generation.near_dup import NEAR_DUP_ENABLED, Key, hamming, near_dup_index, simhash64
+from services.llm.token_budget import token_budget
+from services.llm.prompts import (  # noqa: F401  (LEVEL_GUIDE/TASK_TYPES — прежнее место импорта)
+    LEVEL_GUIDE, TASK_TYPES, comic_system, comic_user, panel_system, panel_user, prompt_stats,
+)
+from services.llm.warmup import DEFAULT_KEEP_ALIVE, ModelWarmer, normalize_keep_alive
+from core import tracing
+from core.metrics import OLLAMA_CALL, OLLAMA_GENERATIONS, OLLAMA_TOKENS
+from services.llm.output_schema import (
+    COMIC_SCHEMA, RejectionStats, exercise_array_schema, rejections, validate_comic, validate_exercise_item,
+)
 
 logger = logging.getLogger(__name__)
 
 USE_OLLAMA = os.getenv("USE_OLLAMA", "0").lower() in {"1", "true", "yes"}
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434").rstrip("/")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:3b-instruct")
+# маршрутизация по уровням (LEVEL_GUIDE[...]["tier"]): малая модель первой,
+# сильная — для B1/B2 и при провале проверки; пустая STRONG — без эскалации
+OLLAMA_MODEL_FAST = os.getenv("OLLAMA_MODEL_FAST", OLLAMA_MODEL)
+OLLAMA_MODEL_STRONG = os.getenv("OLLAMA_MODEL_STRONG", "")
 REQUEST_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "20"))  # seconds
+# общий срок панели на все добор-раунды и эскалацию (если вызывающий не передал свой deadline)
+PANEL_DEADLINE = float(os.getenv("OLLAMA_PANEL_DEADLINE", str(REQUEST_TIMEOUT * 1.5)))
+# то же для комикса: общий срок на попытку малой модели и эскалацию
+COMIC_DEADLINE = float(os.getenv("OLLAMA_COMIC_DEADLINE", str(REQUEST_TIMEOUT * 1.5)))
+# эскалацию не начинаем, если до срока осталось меньше (сильная модель не успеет ответить)
+MIN_ESCALATION_TIME = float(os.getenv("OLLAMA_MIN_ESCALATION_TIME", "2"))
 TEMPERATURE = float(os.getenv("OLLAMA_TEMPERATURE", "0.3"))
 MAX_TOKENS = int(os.getenv("OLLAMA_MAX_TOKENS", "800"))
 TOKENS_COMIC = int(os.getenv("OLLAMA_TOKENS_COMIC", "200"))
 TOKENS_PANEL = int(os.getenv("OLLAMA_TOKENS_PANEL", str(MAX_TOKENS)))
 TOKENS_PER_ITEM = int(os.getenv("OLLAMA_TOKENS_PER_ITEM", "150"))
-
-# Профили уровней (можешь дополнять)
-LEVEL_GUIDE = {
-    "A1": {
-        "lexicon": "vocabulario muy básico del día a día",
-        "grammar": "presente de indicativo; ser/estar; artículos; adjetivos básicos; preposiciones simples",
-        "length": "frases cortas (<= 10-12 palabras)",
-        "avoid": "tiempos pasados/condicional/subjuntivo; oraciones complejas",
-    },
-    "A2": {
-        "lexicon": "vocabulario cotidiano más amplio",
-        "grammar": "presente; pretérito indefinido; perífrasis básicas (ir a + inf.); comparativos",
-        "length": "frases cortas-medias (<= 14 palabras)",
-        "avoid": "subjuntivo; oraciones muy complejas",
-    },
-    "B1": {
-        "lexicon": "temas frecuentes y algo abstractos",
-        "grammar": "presente; pasados (indef./impf.); futuro; condicional simple; subjuntivo presente en estructuras frecuentes",
-        "length": "frases medias (<= 18 palabras)",
-        "avoid": "construcciones raras o poco frecuentes",
-    },
-    "B2": {
-        "lexicon": "temas variados, incluido abstracto",
-        "grammar": "todos los tiempos principales; subjuntivo frecuente; pasivas sencillas",
-        "length": "frases medias-largas (<= 22 palabras)",
-        "avoid": "tecnicismos innecesarios",
-    },
-}
-
-TASK_TYPES = [
-    "completar hueco con la forma correcta",
-    "elegir sinónimos o antónimos básicos",
-    "elegir la palabra que complete mejor la frase",
-    "elegir la forma correcta de ser/estar/tiempo verbal permitido",
-]
+# сколько Ollama держит модель в памяти после запроса (передаём в каждом запросе)
+KEEP_ALIVE = normalize_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE))
+# потоковый ответ: читаем по токенам и обрываем генерацию, как только закрылся JSON
+STREAM = os.getenv("OLLAMA_STREAM", "1").lower() in {"1", "true", "yes"}
+# сколько раз добирать недостающие упражнения, если ответ пришёл неполным
+TOP_UP_ROUNDS = int(os.getenv("OLLAMA_TOP_UP_ROUNDS", "1"))
+# JSON-схема в "format" (Ollama >= 0.5); 0 — старый режим "format": "json"
+JSON_SCHEMA = os.getenv("OLLAMA_JSON_SCHEMA", "1").lower() in {"1", "true", "yes"}
+
+# прогрев/удержание моделей; запускается в api.on_startup и worker_base.start_worker
+model_warmer = ModelWarmer(OLLAMA_HOST, [m for m in dict.fromkeys([OLLAMA_MODEL_FAST, OLLAMA_MODEL_STRONG]) if m],
+                           KEEP_ALIVE)
+
+# сколько запросов ушло на какую модель и сколько эскалаций: {вид: {"model:...": n, "escalated": n}}
+routing = RejectionStats()
 
 def enabled() -> bool:
     return USE_OLLAMA
 
+def route_models(level: str) -> List[str]:
+    """Цепочка моделей для уровня: первая — основная, следующие — эскалация."""
+    guide = LEVEL_GUIDE.get((level or "A1").strip().upper()[:2], LEVEL_GUIDE["A1"])
+    strong = OLLAMA_MODEL_STRONG or OLLAMA_MODEL_FAST
+    chain = [strong] if guide.get("tier") == "strong" else [OLLAMA_MODEL_FAST, strong]
+    return list(dict.fromkeys(chain))
+
 def _strip_code_fences(text: str) -> str:
     t = (text or "").strip()
     if t.startswith("```"):
@@ -61,38 +70,144 @@ def _strip_code_fences(text: str) -> str:
             t = t[4:].lstrip()
     return t
 
-def _build_prompt(theme_name: str, count: int, level: str, theme_desc: Optional[str]) -> str:
-    guide = LEVEL_GUIDE.get(level.upper(), LEVEL_GUIDE["A1"])
-    # 2-3 типа заданий на партию — для разнообразия
-    picked = random.sample(TASK_TYPES, k=min(3, len(TASK_TYPES)))
-    extra = f"Descripción del tema: {theme_desc}." if theme_desc else ""
-    return f"""
-Eres profesor de ELE (Español como Lengua Extranjera).
-Genera EXACTAMENTE {count} ejercicios tipo test en español para nivel {level}.
-Tema: "{theme_name}". {extra}
-
-Respeta el perfil del nivel:
-- Léxico: {guide['lexicon']}
-- Gramática: {guide['grammar']}
-- Longitud de frase: {guide['length']}
-- Evitar: {guide['avoid']}
-
-Varía los tipos de ejercicio entre: {", ".join(picked)}.
-Cada ejercicio es un objeto JSON con claves:
-- "prompt": enunciado breve y claro en español;
-- "choices": array de 4 opciones plausibles (strings);
-- "answer": string con la ÚNICA opción correcta (debe estar en "choices").
-
-REQUISITOS:
-- Usa SOLO estructuras propias del nivel {level}.
-- Longitud del enunciado acorde al nivel.
-- No repitas enunciados ni respuestas.
-- Salida: SOLO un array JSON con {count} objetos (sin comentarios, sin markdown).
-""".strip()
-
-def _clean_and_validate(items: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+class _JsonCloseTracker:
+    """
+    Следит за потоком текста и сообщает, где закрылось верхнеуровневое
+    JSON-значение (массив или объект). Учитывает строки и экранирование.
+    """
+    __slots__ = ("depth", "in_string", "escape", "started")
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+
+    def feed(self, piece: str) -> int:
+        """Индекс символа в piece, закрывшего значение, или -1."""
+        for i, ch in enumerate(piece):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                if self.started:
+                    self.in_string = True
+            elif ch in "[{":
+                self.depth += 1
+                self.started = True
+            elif ch in "]}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i
+        return -1
+
+
+def _record_usage(kind: str, model: str, data: Dict[str, Any], eval_count: int,
+                  ttft_ms: Optional[float] = None) -> None:
+    """prompt_eval_* из финального ответа Ollama (длительности там в наносекундах) и токены в метрики."""
+    count = data.get("prompt_eval_count")
+    duration = data.get("prompt_eval_duration")
+    if count:
+        OLLAMA_TOKENS.inc(int(count), kind=kind, model=model, type="prompt")
+    if eval_count:
+        OLLAMA_TOKENS.inc(eval_count, kind=kind, model=model, type="eval")
+    prompt_stats.record(
+        kind,
+        prompt_eval_count=int(count) if count is not None else None,
+        prompt_eval_ms=duration / 1e6 if duration is not None else None,
+        ttft_ms=ttft_ms,
+    )
+
+
+def _generate_text(payload: Dict[str, Any], timeout: float, kind: str = "generate"):
+    with tracing.span("ollama.generate", kind=kind, model=payload.get("model") or OLLAMA_MODEL_FAST) as sp:
+        result = _generate_text_untraced(payload, timeout, kind)
+        if sp is not None:
+            sp.set(http_status=result[0], eval_count=result[2], done_reason=result[3])
+        return result
+
+
+def _generate_text_untraced(payload: Dict[str, Any], timeout: float, kind: str):
+    """
+    POST /api/generate → (status_code, text, eval_count, done_reason).
+    При status_code != 200 text — тело ошибки. В потоковом режиме соединение
+    закрывается сразу после закрытия JSON — Ollama прекращает генерацию,
+    а eval_count считается по полученным фрагментам (один фрагмент ≈ один токен).
+    Таймаут requests в потоке действует на каждое чтение, поэтому общий срок
+    timeout проверяется по часам между фрагментами — иначе модель, которая
+    не перестаёт выдавать токены, держала бы вызов сколько угодно.
+    Замеры prompt eval / TTFT пишутся в prompt_stats под ключом kind.
+    """
+    payload = {"keep_alive": KEEP_ALIVE, **payload}
+    model = payload.get("model") or OLLAMA_MODEL_FAST
+    model_warmer.note_use(model)
+    t0 = time.monotonic()
+    if not STREAM:
+        resp = _post_ollama({**payload, "stream": False}, timeout)
+        if resp.status_code != 200:
+            return resp.status_code, resp.text, 0, ""
+        data = resp.json() or {}
+        eval_count = int(data.get("eval_count") or 0)
+        _record_usage(kind, model, data, eval_count)
+        return 200, data.get("response", ""), eval_count, data.get("done_reason") or ""
+
+    resp = _post_ollama({**payload, "stream": True}, timeout, stream=True)
+    try:
+        if resp.status_code != 200:
+            return resp.status_code, resp.text, 0, ""
+        deadline = t0 + timeout
+        tracker = _JsonCloseTracker()
+        parts: List[str] = []
+        tokens, eval_count, done_reason = 0, 0, ""
+        ttft_ms: Optional[float] = None
+        final: Dict[str, Any] = {}
+        for line in resp.iter_lines():
+            if time.monotonic() > deadline:
+                raise requests.ReadTimeout(f"Ollama stream exceeded {timeout:g}s total")
+            if not line:
+                continue
+            chunk = json.loads(line)
+            piece = chunk.get("response") or ""
+            if piece:
+                if ttft_ms is None:
+                    ttft_ms = (time.monotonic() - t0) * 1000
+                tokens += 1
+                end = tracker.feed(piece)
+                if end != -1:
+                    parts.append(piece[:end + 1])
+                    done_reason = "closed"
+                    break
+                parts.append(piece)
+            if chunk.get("done"):
+                final = chunk
+                eval_count = int(chunk.get("eval_count") or 0)
+                done_reason = chunk.get("done_reason") or ""
+                break
+        eval_count = eval_count or tokens
+        _record_usage(kind, model, final, eval_count, ttft_ms)
+        return 200, "".join(parts), eval_count, done_reason
+    finally:
+        resp.close()
+
+
+def _clean_and_validate(
+        items: List[Dict[str, Any]], count: int, dedup_key: Optional[Key] = None,
+        stats: Optional[Dict[str, int]] = None,
+    ) -> List[Dict[str, Any]]:
+    """
+    dedup_key — (тема, уровень) для фильтра почти-дубликатов между вызовами
+    (services/generation/near_dup); None — только точные дубли внутри ответа.
+    Индекс только читается: принятые упражнения записывает remember_exercises.
+    stats["near_duplicate"] — сколько отброшено как почти-дубликаты.
+    """
     cleaned: List[Dict[str, Any]] = []
     seen_prompts = set()
+    batch_fps: List[int] = []
+    near_dups = 0
 
     for it in items:
         if not isinstance(it, dict): 
@@ -128,16 +243,36 @@ def _clean_and_validate(items: List[Dict[str, Any]], count: int) -> List[Dict[st
         # Убираем дубли
         key = (prompt.lower(), tuple(c.lower() for c in choices))
         if key in seen_prompts:
+            rejections.inc("panel", "duplicate")
             continue
         seen_prompts.add(key)
 
+        # почти такой же вопрос уже выдавался по этой теме (или есть в этом ответе) — не тратим на него место
+        if dedup_key is not None:
+            fp = simhash64(prompt)
+            if (any(hamming(fp, other) <= near_dup_index.max_distance for other in batch_fps)
+                    or near_dup_index.seen(dedup_key, prompt)):
+                near_dups += 1
+                rejections.inc("panel", "near_duplicate")
+                continue
+            batch_fps.append(fp)
+
         answer_final = answer or next((c for c in choices if c != "—"), choices[0])
         cleaned.append({"prompt": prompt, "choices": choices, "answer": answer_final})
 
         if len(cleaned) >= max(1, int(count)):
             break
+    if near_dups:
+        logger.info("Ollama panel: dropped %d near-duplicate items for %s", near_dups, dedup_key)
+        if stats is not None:
+            stats["near_duplicate"] = stats.get("near_duplicate", 0) + near_dups
     return cleaned
 
+def remember_exercises(theme_name: str, level: str, items: Sequence[Dict[str, Any]]) -> None:
+    """Записать упражнения выданной панели в индекс почти-дубликатов."""
+    if NEAR_DUP_ENABLED and items:
+        near_dup_index.add(near_dup_index.make_key(theme_name, level), [it["prompt"] for it in items])
+
 def _coerce_to_list(parsed):
     if isinstance(parsed, list):
         return parsed
@@ -153,142 +288,294 @@ def _coerce_to_list(parsed):
     return []
 
 
+_DECODER = json.JSONDecoder()
+
+
+def _salvage_array(text: str) -> List[Any]:
+    """
+    Достаёт все целиком записанные элементы из оборванного JSON-массива:
+    '[{..}, {..}, {"prompt": "..' → [{..}, {..}]. Разбор идёт по элементам через
+    raw_decode, так что хвост без закрывающей скобки просто отбрасывается.
+    """
+    start = text.find("[")
+    if start == -1:
+        return []
+    out: List[Any] = []
+    pos, n = start + 1, len(text)
+    while pos < n:
+        while pos < n and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= n or text[pos] == "]":
+            break
+        try:
+            value, pos = _DECODER.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        out.append(value)
+    return out
+
+
+def _salvage_object(text: str) -> Any:
+    """
+    Первый JSON-объект из ответа с пояснениями вокруг: 'Claro: {..} ¡Suerte!' → {..}.
+    Без объекта или при битом объекте — json.JSONDecodeError.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise json.JSONDecodeError("no JSON object in response", text, 0)
+    return _DECODER.raw_decode(text, start)[0]
+
+
+def _parse_exercise_text(text: str) -> Tuple[List[Any], Optional[str]]:
+    """
+    Текст ответа → (список элементов, причина). Причина: None — разобрано целиком,
+    "truncated_salvaged" — взяты готовые элементы оборванного массива,
+    "empty_response" / "json_decode" — разбирать нечего (список пуст).
+    Горячий путь каждой генерации; замеры — tests/test_microbench.py.
+    """
+    text = _strip_code_fences(text)
+    if not text:
+        return [], "empty_response"
+    problem = None
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        # чаще всего ответ обрезан по num_predict — спасаем готовые элементы
+        parsed = _salvage_array(text)
+        if not parsed:
+            return [], "json_decode"
+        problem = "truncated_salvaged"
+    # без схемы модель иногда заворачивает массив в объект
+    return _coerce_to_list(parsed), problem
+
+
 def generate_exercises(
         theme_name: str, 
         count: int, 
         level: str, 
         theme_desc: Optional[str] = None,
+        deadline: Optional[float] = None,
     ) -> Optional[List[Dict[str, Any]]]:
     """
     Запрашивает у Ollama массив JSON-объектов упражнений.
     Возвращает уже «прибранный» список через _clean_and_validate(...) или None (для fallback).
+    Если ответ пришёл неполным (обрезан по num_predict или часть элементов отброшена),
+    до TOP_UP_ROUNDS раз запрашивается только недостающий остаток. Если же
+    недобор — из-за почти-дубликатов, тема исчерпана: добор и эскалация дали бы
+    те же фразы, поэтому отдаём что есть. Принятую панель вызывающий записывает
+    через remember_exercises.
+    deadline — time.monotonic() общего срока на все вызовы (по умолчанию
+    OLLAMA_PANEL_DEADLINE от старта); каждый вызов получает остаток срока,
+    после срока новые не начинаются.
     """
     if not enabled():
         logger.info("Ollama disabled via USE_OLLAMA; skipping call.")
         return None
 
-    url = f"{OLLAMA_HOST}/api/generate"
-    prompt = _build_prompt(theme_name, count, level, theme_desc)
-    num_predict = max(TOKENS_PANEL, TOKENS_PER_ITEM * max(1, int(count)))
+    count = max(1, int(count))
+    if deadline is None:
+        deadline = time.monotonic() + PANEL_DEADLINE
+    items: List[Dict[str, Any]] = []
+    models = route_models(level)
+    saturated = expired = False
+    for step, model in enumerate(models):
+        if step:
+            # малая модель не добрала count годных упражнений — остаток просим у сильной
+            routing.inc("panel", "escalated")
+            logger.info("Ollama panel: escalating %s → %s (%d of %d items)", models[step - 1], model, len(items), count)
+        for round_no in range(1 + TOP_UP_ROUNDS):
+            need = count - len(items)
+            if need <= 0:
+                break
+            left = deadline - time.monotonic()
+            if left <= 0:
+                expired = True
+                logger.info("Ollama panel: deadline passed with %d of %d items", len(items), count)
+                break
+            stats: Dict[str, int] = {}
+            got = _request_exercises(theme_name, need, level, theme_desc,
+                                     avoid=[it["prompt"] for it in items], model=model, stats=stats,
+                                     timeout=min(REQUEST_TIMEOUT, left))
+            got = got or []
+            if round_no and got:
+                logger.info("Ollama panel top-up: +%d of %d missing", len(got), need)
+            seen = {it["prompt"].lower() for it in items}
+            items.extend(it for it in got if it["prompt"].lower() not in seen)
+            if stats.get("near_duplicate", 0) and len(got) < need:
+                saturated = True
+                logger.info("Ollama panel: %s/%s saturated with near-duplicates; no top-up", theme_name, level)
+                break
+            if not got:
+                break
+        if saturated or expired or len(items) >= count:
+            break
+    OLLAMA_GENERATIONS.inc(kind="panel", outcome="success" if items else "fallback")
+    return items or None
+
 
+def _request_exercises(
+        theme_name: str,
+        count: int,
+        level: str,
+        theme_desc: Optional[str] = None,
+        avoid: Sequence[str] = (),
+        model: Optional[str] = None,
+        stats: Optional[Dict[str, int]] = None,
+        timeout: float = REQUEST_TIMEOUT,
+    ) -> Optional[List[Dict[str, Any]]]:
+    """Один запрос к Ollama на count упражнений; stats — см. _clean_and_validate."""
+    model = model or OLLAMA_MODEL_FAST
+    routing.inc("panel", f"model:{model}")
+    # статичная часть (роль + профиль уровня) — в "system": общий префикс для кэша Ollama
+    system = panel_system(level)
+    prompt = panel_user(theme_name, count, theme_desc, avoid)
+    default_budget = max(TOKENS_PANEL, TOKENS_PER_ITEM * max(1, int(count)))
+    budget_key = ("panel", model, level.upper(), max(1, int(count)))
+    num_predict = token_budget.num_predict(budget_key, default_budget, cap=2 * default_budget)
+
+    # исход вызова для метрик: success | rejected (все элементы отброшены) | parse_fail | timeout | error
+    outcome, t0 = "error", time.perf_counter()
     try:
-        resp = requests.post(
-            url,
-            json={
-                "model": OLLAMA_MODEL,
+        status, text, eval_count, done_reason = _generate_text(
+            {
+                "model": model,
+                "system": system,
                 "prompt": prompt,
                 "options": {"temperature": TEMPERATURE, "num_predict": num_predict},
-                "stream": False,
-                "format": "json",
+                "format": exercise_array_schema(count) if JSON_SCHEMA else "json",
             },
-            timeout=REQUEST_TIMEOUT,
+            timeout,
+            kind="panel",
         )
-        if resp.status_code != 200:
-            logger.warning("Ollama non-200: %s %s", resp.status_code, resp.text[:800])
+        if status != 200:
+            rejections.inc("panel", "http_error")
+            logger.warning("Ollama non-200: %s %s", status, text[:800])
             return None
+        token_budget.record(budget_key, eval_count, truncated=done_reason == "length")
 
-        data = resp.json()
-        text = (data or {}).get("response", "").strip()
-        text = _strip_code_fences(text)
-        if not text:
+        outcome = "parse_fail"
+        parsed, problem = _parse_exercise_text(text)
+        if problem == "empty_response":
+            rejections.inc("panel", problem)
             logger.warning("Ollama returned empty response for panel.")
             return None
-        
-        # Пробуем распарсить как есть; если не вышло — вырезаем первый '[' и последний ']'
-        try:
-            parsed = json.loads(text)
-        except json.JSONDecodeError:
-            parsed = None
-            # 1) попробуем вырезать первый массив [...]
-            a1, a2 = text.find("["), text.rfind("]")
-            if a1 != -1 and a2 != -1 and a2 > a1:
-                try:
-                    parsed = json.loads(text[a1:a2 + 1])
-                except json.JSONDecodeError:
-                    parsed = None
-        # 2) если массива нет — попробуем объект {...}
-            if parsed is None:
-                o1, o2 = text.find("{"), text.rfind("}")
-                if o1 != -1 and o2 != -1 and o2 > o1:
-                    try:
-                        parsed = json.loads(text[o1:o2 + 1])
-                    except json.JSONDecodeError:
-                        parsed = None
-            if parsed is None:
-                logger.warning("Ollama panel JSON decode failed (no list/object could be parsed).")
-                return None
-        # нормализуем к списку объектов
-        parsed = _coerce_to_list(parsed)
+        if problem == "json_decode":
+            rejections.inc("panel", problem)
+            logger.warning("Ollama panel JSON decode failed (done_reason=%s).", done_reason)
+            return None
+        if problem == "truncated_salvaged":
+            rejections.inc("panel", problem)
+            logger.info("Ollama panel: salvaged %d items from truncated JSON", len(parsed))
         if not parsed:
+            rejections.inc("panel", "not_array")
             logger.warning("Ollama returned JSON but not an array/object list; fallback.")
             return None
 
-        items = _clean_and_validate(parsed, count)
+        # строгая проверка по схеме — поштучно, чтобы не выбрасывать весь ответ
+        valid = []
+        for it in parsed:
+            reason = validate_exercise_item(it)
+            if reason:
+                rejections.inc("panel", reason)
+            else:
+                valid.append(it)
+        if not valid:
+            logger.warning("Ollama panel: all %d items failed schema validation.", len(parsed))
+            return None
+        parsed = valid
+
+        dedup_key = near_dup_index.make_key(theme_name, level) if NEAR_DUP_ENABLED else None
+        items = _clean_and_validate(parsed, count, dedup_key, stats)
+        outcome = "success" if items else "rejected"
         return items or None
 
+    except requests.Timeout as e:
+        outcome = "timeout"
+        rejections.inc("panel", "timeout")
+        logger.error("Ollama timeout: %s", e)
+        return None
     except requests.RequestException as e:
+        outcome = "error"
+        rejections.inc("panel", "request_error")
         logger.error("Ollama request error: %s", e)
         return None
     except json.JSONDecodeError as e:
+        outcome = "parse_fail"
         logger.error("Ollama JSON parse error: %s", e)
         return None
     except Exception as e:
+        outcome = "error"
         logger.exception("Unexpected Ollama error: %s", e)
         return None
+    finally:
+        OLLAMA_CALL.observe(time.perf_counter() - t0, kind="panel", model=model, outcome=outcome)
 
-def _build_comic_prompt(theme_name: str, level: str, is_bonus: bool) -> str:
-    bonus = " (BONUS)" if is_bonus else ""
-    return f"""
-Eres un asistente de enseñanza de español. Nivel: {level}. Tema: "{theme_name}"{bonus}.
-
-Genera UN SOLO ejercicio breve relacionado con el tema.
-Devuelve SOLO JSON (objeto) sin texto extra, sin markdown, sin comentarios, con el siguiente esquema:
-
-{{
-  "difficulty": "easy|medium|hard",
-  "explanation": "Instrucción en ruso, 1-2 frases, ясная задача для ученика",
-  "vocabulary": ["palabra1","palabra2","..."]  // 3-8 испанских слов по теме
-}}
+def _post_ollama(payload, timeout, stream: bool = False):
+    return requests.post(f"{OLLAMA_HOST}/api/generate", json=payload, timeout=timeout, stream=stream)
 
-No incluyas nada más aparte del JSON.
-""".strip()
-
-def _post_ollama(payload, timeout):
-    return requests.post(f"{OLLAMA_HOST}/api/generate", json=payload, timeout=timeout)
-
-def generate_comic_task(theme_name: str, level: str, is_bonus: bool) -> Optional[Dict[str, Any]]:
-    """Запрашивает у Ollama JSON: {difficulty, explanation, vocabulary[]} с 1–2 попытками."""
+def generate_comic_task(theme_name: str, level: str, is_bonus: bool,
+                        deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Запрашивает у Ollama JSON: {difficulty, explanation, vocabulary[]}.
+    Попытки идут по цепочке route_models(level): ответ, не прошедший проверку,
+    уходит на следующую (сильную) модель; у последней мелкие отклонения чиним.
+    deadline — time.monotonic() общего срока на все попытки (по умолчанию
+    OLLAMA_COMIC_DEADLINE от старта): попытка получает остаток срока, эскалация
+    при остатке меньше OLLAMA_MIN_ESCALATION_TIME не начинается.
+    """
     if not enabled():
         logger.info("Ollama disabled via USE_OLLAMA; skipping comic generation.")
         return None
-
-    prompt = _build_comic_prompt(theme_name, level, is_bonus)
-
-    # две попытки: 1) обычная; 2) короче по токенам и холоднее по температуре
-    attempts = [
-        {"num_predict": TOKENS_COMIC,                   "temperature": TEMPERATURE, "timeout": REQUEST_TIMEOUT},
-        #{"num_predict": max(120, TOKENS_COMIC // 2),   "temperature": 0.1,         "timeout": REQUEST_TIMEOUT * 2},
-    ]
+    if deadline is None:
+        deadline = time.monotonic() + COMIC_DEADLINE
+
+    system = comic_system(level)
+    prompt = comic_user(theme_name, is_bonus)
+
+    # по попытке на модель цепочки; бюджет токенов у каждой модели свой
+    attempts = []
+    for model in route_models(level):
+        budget_key = ("comic", model, level.upper(), 1)
+        attempts.append({
+            "model": model,
+            "budget_key": budget_key,
+            "num_predict": token_budget.num_predict(budget_key, TOKENS_COMIC, cap=2 * TOKENS_COMIC),
+            "temperature": TEMPERATURE,
+        })
 
     last_err = None
     for i, opts in enumerate(attempts, start=1):
+        left = deadline - time.monotonic()
+        if left <= 0 or (i > 1 and left < MIN_ESCALATION_TIME):
+            logger.info("Ollama comic: %.1fs left before deadline; not trying %s after %s",
+                        max(0.0, left), opts["model"], last_err)
+            last_err = last_err or "deadline"
+            break
+        if i > 1:
+            routing.inc("comic", "escalated")
+            logger.info("Ollama comic: escalating to %s after %s", opts["model"], last_err)
+        routing.inc("comic", f"model:{opts['model']}")
         payload = {
-            "model": OLLAMA_MODEL,
+            "model": opts["model"],
+            "system": system,
             "prompt": prompt,
             "options": {"temperature": opts["temperature"], "num_predict": opts["num_predict"]},
-            "stream": False,
-            "format": "json",
+            "format": COMIC_SCHEMA if JSON_SCHEMA else "json",
         }
+        outcome, t0 = "error", time.perf_counter()
         try:
-            resp = _post_ollama(payload, opts["timeout"])
-            if resp.status_code != 200:
-                logger.warning("Ollama non-200(comic) attempt %s: %s %s", i, resp.status_code, resp.text[:2000])
-                last_err = f"HTTP {resp.status_code}"
+            status, text, eval_count, done_reason = _generate_text(payload, min(REQUEST_TIMEOUT, left), kind="comic")
+            if status != 200:
+                rejections.inc("comic", "http_error")
+                logger.warning("Ollama non-200(comic) attempt %s: %s %s", i, status, text[:2000])
+                last_err = f"HTTP {status}"
                 continue
+            token_budget.record(opts["budget_key"], eval_count, truncated=done_reason == "length")
 
-            text = (resp.json() or {}).get("response", "").strip()
-            text = _strip_code_fences(text)
+            outcome = "parse_fail"
+            text = _strip_code_fences(text.strip())
             if not text:
+                rejections.inc("comic", "empty_response")
                 logger.warning("Ollama returned empty response for comic task (attempt %s).", i)
                 last_err = "empty_response"
                 continue
@@ -296,12 +583,18 @@ def generate_comic_task(theme_name: str, level: str, is_bonus: bool) -> Optional
             try:
                 data = json.loads(text)
             except json.JSONDecodeError:
-                start = text.find("{")
-                end = text.rfind("}")
-                if start != -1 and end != -1 and end > start:
-                    data = json.loads(text[start:end+1])
-                else:
-                    raise
+                # без схемы (или если модель её не держит) объект бывает завёрнут в текст
+                data = _salvage_object(text)
+            reason = validate_comic(data)
+            if reason:
+                rejections.inc("comic", reason)
+                if not isinstance(data, dict):
+                    last_err = "not_object"
+                    continue
+                if i < len(attempts):
+                    last_err = reason
+                    continue
+                # у последней модели мелкие отклонения (лишний уровень сложности, пустой текст) чиним ниже
 
             diff = str(data.get("difficulty", "easy")).lower()
             if diff not in {"easy", "medium", "hard"}:
@@ -316,25 +609,35 @@ def generate_comic_task(theme_name: str, level: str, is_bonus: bool) -> Optional
             if not isinstance(expl, str) or not expl.strip():
                 expl = f"[{diff}] Тема: {theme_name} | Уровень: {level}"
 
+            outcome = "success"
+            OLLAMA_GENERATIONS.inc(kind="comic", outcome="success")
             return {"difficulty": diff, "explanation": expl.strip(), "vocabulary": vocab}
 
         except (requests.ReadTimeout, requests.ConnectTimeout) as e:
+            outcome = "timeout"
+            rejections.inc("comic", "timeout")
             logger.warning("Ollama timeout on comic attempt %s: %s", i, e)
             last_err = "timeout"
             continue
         except requests.RequestException as e:
+            outcome = "error"
             logger.error("Ollama request error (comic) attempt %s: %s", i, e)
             last_err = "request_error"
             continue
         except json.JSONDecodeError as e:
+            rejections.inc("comic", "json_decode")
             logger.error("Ollama JSON parse error (comic) attempt %s: %s", i, e)
             last_err = "json_error"
             continue
         except Exception as e:
+            outcome = "error"
             logger.exception("Unexpected Ollama error (comic) attempt %s: %s", i, e)
             last_err = "unexpected"
             continue
+        finally:
+            OLLAMA_CALL.observe(time.perf_counter() - t0, kind="comic", model=opts["model"], outcome=outcome)
 
+    OLLAMA_GENERATIONS.inc(kind="comic", outcome="fallback")
     logger.warning("Comic generation failed after retries, reason: %s", last_err)
     return None
     
@@ -0,0 +1,175 @@
+# app/services/llm/output_schema.py
+# JSON-схемы ответов Ollama и их предкомпилированные валидаторы.
+#
+# Схема уходит в поле "format" запроса (structured outputs): модель декодирует
+# по грамматике схемы, и ответы почти всегда разбираются с первого раза.
+# Для проверки та же схема один раз компилируется в дерево замыканий —
+# без интерпретации словаря на каждом элементе и без пакета jsonschema.
+# Поддерживается подмножество, которое нам нужно: type, properties, required,
+# items, minItems, maxItems, minLength, enum.
+from __future__ import annotations
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Optional
+
+# валидатор: значение → None (ок) или причина отказа "путь:правило"
+Validator = Callable[[Any, str], Optional[str]]
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any], Optional[str]]:
+    check = _compile(schema)
+    return lambda value: check(value, "$")
+
+
+def _compile(schema: Dict[str, Any]) -> Validator:
+    checks = []
+
+    typ = schema.get("type")
+    if typ:
+        py_type = _TYPES[typ]
+
+        def _type(v, path, py_type=py_type, typ=typ):
+            if not isinstance(v, py_type) or (typ in ("integer", "number") and isinstance(v, bool)):
+                return f"{path}:type"
+            return None
+        checks.append(_type)
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+        checks.append(lambda v, path, allowed=allowed: None if v in allowed else f"{path}:enum")
+
+    if "minLength" in schema:
+        n = schema["minLength"]
+        checks.append(lambda v, path, n=n: None if len(v.strip()) >= n else f"{path}:minLength")
+
+    if "minItems" in schema:
+        n = schema["minItems"]
+        checks.append(lambda v, path, n=n: None if len(v) >= n else f"{path}:minItems")
+    if "maxItems" in schema:
+        n = schema["maxItems"]
+        checks.append(lambda v, path, n=n: None if len(v) <= n else f"{path}:maxItems")
+
+    if "items" in schema:
+        item_check = _compile(schema["items"])
+
+        def _items(v, path):
+            for it in v:
+                reason = item_check(it, f"{path}[]")
+                if reason:
+                    return reason
+            return None
+        checks.append(_items)
+
+    required = tuple(schema.get("required", ()))
+    if required:
+        def _required(v, path):
+            for key in required:
+                if key not in v:
+                    return f"{path}.{key}:required"
+            return None
+        checks.append(_required)
+
+    props = {key: _compile(sub) for key, sub in schema.get("properties", {}).items()}
+    if props:
+        def _props(v, path):
+            for key, check in props.items():
+                if key in v:
+                    reason = check(v[key], f"{path}.{key}")
+                    if reason:
+                        return reason
+            return None
+        checks.append(_props)
+
+    checks = tuple(checks)
+
+    def _all(v, path):
+        for check in checks:
+            reason = check(v, path)
+            if reason:
+                return reason
+        return None
+    return _all
+
+
+EXERCISE_ITEM_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "prompt": {"type": "string", "minLength": 1},
+        "choices": {"type": "array", "items": {"type": "string", "minLength": 1}, "minItems": 2, "maxItems": 6},
+        "answer": {"type": "string", "minLength": 1},
+    },
+    "required": ["prompt", "choices", "answer"],
+}
+
+
+def exercise_array_schema(count: int) -> Dict[str, Any]:
+    """Схема для "format": ровно count упражнений по 4 варианта."""
+    item = {
+        **EXERCISE_ITEM_SCHEMA,
+        "properties": {
+            **EXERCISE_ITEM_SCHEMA["properties"],
+            "choices": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+        },
+    }
+    n = max(1, int(count))
+    return {"type": "array", "items": item, "minItems": n, "maxItems": n}
+
+
+COMIC_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "difficulty": {"type": "string", "enum": ["easy", "medium", "hard"]},
+        "explanation": {"type": "string", "minLength": 1},
+        "vocabulary": {"type": "array", "items": {"type": "string"}, "maxItems": 10},
+    },
+    "required": ["difficulty", "explanation", "vocabulary"],
+}
+
+# Проверка элементов ответа мягче схемы запроса: пустой или отсутствующий
+# "answer" чинит _clean_and_validate (первый вариант), и без "format"-схемы
+# (OLLAMA_JSON_SCHEMA=0) такие элементы не должны теряться.
+_REPAIRABLE_ITEM_SCHEMA: Dict[str, Any] = {
+    **EXERCISE_ITEM_SCHEMA,
+    "properties": {**EXERCISE_ITEM_SCHEMA["properties"], "answer": {"type": "string"}},
+    "required": ["prompt", "choices"],
+}
+
+# проверяем элементы по одному: частично верный массив не выбрасывается целиком
+validate_exercise_item = compile_schema(_REPAIRABLE_ITEM_SCHEMA)
+validate_comic = compile_schema(COMIC_SCHEMA)
+
+
+class RejectionStats:
+    """Счётчики отказов по (вид генерации, причина)."""
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, kind: str, reason: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[(kind, reason)] += n
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            items = list(self._counts.items())
+        out: Dict[str, Dict[str, int]] = {}
+        for (kind, reason), n in items:
+            out.setdefault(kind, {})[reason] = n
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+rejections = RejectionStats()
@@ -0,0 +1,188 @@
+# app/services/llm/prompts.py
+# Шаблоны промптов Ollama: статичная системная часть отдельно от переменных.
+#
+# Ollama переиспользует KV-кэш модели для общего префикса подряд идущих
+# запросов (пока модель загружена и слот свободен). Раньше в первых строках
+# промпта стояли count и тема — префикс расходился почти сразу, и каждый
+# запрос заново прогонял через модель весь текст с профилем уровня.
+# Теперь всё неизменное (роль, профиль уровня, формат ответа) уходит в поле
+# "system" — шаблон модели ставит его первым, — а в "prompt" остаются только
+# тема, count, выбранные типы заданий и список «не повторять».
+#
+# Поле "context" (токены прошлого ответа) для этого не годится: оно несёт
+# весь предыдущий диалог вместе с ответом модели, а не общий префикс.
+from __future__ import annotations
+import random
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, Optional, Sequence
+
+from services.llm.token_budget import _percentile
+
+# Профили уровней (можешь дополнять).
+# tier — с какой модели начинать: "fast" — малая модель, при провале проверки
+# эскалация на сильную; "strong" — сразу сильная (см. ollama_client.route_models).
+LEVEL_GUIDE = {
+    "A1": {
+        "tier": "fast",
+        "lexicon": "vocabulario muy básico del día a día",
+        "grammar": "presente de indicativo; ser/estar; artículos; adjetivos básicos; preposiciones simples",
+        "length": "frases cortas (<= 10-12 palabras)",
+        "avoid": "tiempos pasados/condicional/subjuntivo; oraciones complejas",
+    },
+    "A2": {
+        "tier": "fast",
+        "lexicon": "vocabulario cotidiano más amplio",
+        "grammar": "presente; pretérito indefinido; perífrasis básicas (ir a + inf.); comparativos",
+        "length": "frases cortas-medias (<= 14 palabras)",
+        "avoid": "subjuntivo; oraciones muy complejas",
+    },
+    "B1": {
+        "tier": "strong",
+        "lexicon": "temas frecuentes y algo abstractos",
+        "grammar": "presente; pasados (indef./impf.); futuro; condicional simple; subjuntivo presente en estructuras frecuentes",
+        "length": "frases medias (<= 18 palabras)",
+        "avoid": "construcciones raras o poco frecuentes",
+    },
+    "B2": {
+        "tier": "strong",
+        "lexicon": "temas variados, incluido abstracto",
+        "grammar": "todos los tiempos principales; subjuntivo frecuente; pasivas sencillas",
+        "length": "frases medias-largas (<= 22 palabras)",
+        "avoid": "tecnicismos innecesarios",
+    },
+}
+
+TASK_TYPES = [
+    "completar hueco con la forma correcta",
+    "elegir sinónimos o antónimos básicos",
+    "elegir la palabra que complete mejor la frase",
+    "elegir la forma correcta de ser/estar/tiempo verbal permitido",
+]
+
+
+def _level(level: str) -> str:
+    lvl = (level or "A1").strip().upper()[:2]
+    return lvl if lvl in LEVEL_GUIDE else "A1"
+
+
+# ---- панель упражнений ----
+@lru_cache(maxsize=None)
+def panel_system(level: str) -> str:
+    """Системная часть для панели: одна и та же строка на уровень."""
+    lvl = _level(level)
+    guide = LEVEL_GUIDE[lvl]
+    return f"""
+Eres profesor de ELE (Español como Lengua Extranjera).
+Generas ejercicios tipo test en español para nivel {lvl}.
+
+Respeta el perfil del nivel:
+- Léxico: {guide['lexicon']}
+- Gramática: {guide['grammar']}
+- Longitud de frase: {guide['length']}
+- Evitar: {guide['avoid']}
+
+Cada ejercicio es un objeto JSON con claves:
+- "prompt": enunciado breve y claro en español;
+- "choices": array de 4 opciones plausibles (strings);
+- "answer": string con la ÚNICA opción correcta (debe estar en "choices").
+
+REQUISITOS:
+- Usa SOLO estructuras propias del nivel {lvl}.
+- Longitud del enunciado acorde al nivel.
+- No repitas enunciados ni respuestas.
+- Salida: SOLO un array JSON (sin comentarios, sin markdown).
+""".strip()
+
+
+def panel_user(theme_name: str, count: int, theme_desc: Optional[str] = None,
+               avoid: Sequence[str] = ()) -> str:
+    """Переменная часть запроса панели."""
+    # 2-3 типа заданий на партию — для разнообразия
+    picked = random.sample(TASK_TYPES, k=min(3, len(TASK_TYPES)))
+    lines = [f'Genera EXACTAMENTE {count} ejercicios. Tema: "{theme_name}".']
+    if theme_desc:
+        lines.append(f"Descripción del tema: {theme_desc}.")
+    lines.append(f"Varía los tipos de ejercicio entre: {', '.join(picked)}.")
+    # добор недостающих: уже готовые вопросы не повторять
+    if avoid:
+        lines.append("Ya existen estos enunciados (NO los repitas): " + "; ".join(f'"{a}"' for a in avoid))
+    lines.append(f"Salida: SOLO un array JSON con {count} objetos.")
+    return "\n".join(lines)
+
+
+# ---- задание к комиксу ----
+@lru_cache(maxsize=None)
+def comic_system(level: str) -> str:
+    lvl = _level(level)
+    return f"""
+Eres un asistente de enseñanza de español. Nivel: {lvl}.
+
+Genera UN SOLO ejercicio breve relacionado con el tema indicado.
+Devuelve SOLO JSON (objeto) sin texto extra, sin markdown, sin comentarios, con el siguiente esquema:
+
+{{
+  "difficulty": "easy|medium|hard",
+  "explanation": "Instrucción en ruso, 1-2 frases, ясная задача для ученика",
+  "vocabulary": ["palabra1","palabra2","..."]  // 3-8 испанских слов по теме
+}}
+
+No incluyas nada más aparte del JSON.
+""".strip()
+
+
+def comic_user(theme_name: str, is_bonus: bool) -> str:
+    bonus = " (BONUS)" if is_bonus else ""
+    return f'Tema: "{theme_name}"{bonus}.'
+
+
+# ---- замеры prompt eval ----
+PROMPT_STATS_WINDOW = 200
+
+
+class PromptEvalStats:
+    """
+    Скользящее окно замеров по виду генерации: prompt_eval_count и
+    prompt_eval_duration из финального ответа Ollama и время до первого
+    токена (TTFT). В потоковом режиме мы обрываем ответ на закрытии JSON и
+    финальный фрагмент со счётчиками не приходит — тогда есть только TTFT,
+    который при попадании в кэш префикса падает так же, как prompt_eval.
+    """
+
+    def __init__(self, window: int = PROMPT_STATS_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, prompt_eval_count: Optional[int] = None,
+               prompt_eval_ms: Optional[float] = None, ttft_ms: Optional[float] = None) -> None:
+        with self._lock:
+            per_kind = self._samples.get(kind)
+            if per_kind is None:
+                per_kind = self._samples[kind] = {
+                    name: deque(maxlen=self.window) for name in ("prompt_eval_count", "prompt_eval_ms", "ttft_ms")
+                }
+            for name, value in (("prompt_eval_count", prompt_eval_count),
+                                ("prompt_eval_ms", prompt_eval_ms), ("ttft_ms", ttft_ms)):
+                if value is not None:
+                    per_kind[name].append(float(value))
+
+    def stats(self) -> Dict[str, Dict[str, dict]]:
+        with self._lock:
+            snap = {kind: {name: sorted(dq) for name, dq in per.items()} for kind, per in self._samples.items()}
+        return {
+            kind: {
+                name: {"n": len(vals), "p50": _percentile(vals, 50), "p95": _percentile(vals, 95)}
+                for name, vals in per.items() if vals
+            }
+            for kind, per in snap.items()
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+prompt_stats = PromptEvalStats()
+
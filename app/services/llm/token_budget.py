@@ -0,0 +1,83 @@
+# app/services/llm/token_budget.py
+# Подбор num_predict по фактическим размерам ответов Ollama.
+#
+# На каждую пару (тип задачи, уровень, count) храним скользящее окно
+# последних eval_count; бюджет = p-й перцентиль окна * (1 + запас) + const.
+# Пока наблюдений мало — статический дефолт (как раньше). Обрезанный по
+# лимиту ответ (done_reason == "length") не показывает реальную потребность,
+# поэтому такой замер записывается с повышающим множителем.
+from __future__ import annotations
+import math
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional
+
+BUDGET_WINDOW = int(os.getenv("OLLAMA_BUDGET_WINDOW", "200"))
+BUDGET_MIN_SAMPLES = int(os.getenv("OLLAMA_BUDGET_MIN_SAMPLES", "5"))
+BUDGET_PERCENTILE = float(os.getenv("OLLAMA_BUDGET_PERCENTILE", "95"))
+BUDGET_MARGIN = float(os.getenv("OLLAMA_BUDGET_MARGIN", "0.15"))
+BUDGET_EXTRA = int(os.getenv("OLLAMA_BUDGET_EXTRA", "16"))
+BUDGET_FLOOR = int(os.getenv("OLLAMA_BUDGET_FLOOR", "64"))
+TRUNCATED_BOOST = 1.5
+
+
+def _percentile(sorted_vals, pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * pct / 100.0
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return float(sorted_vals[lo])
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class TokenBudget:
+    def __init__(self, window: int = BUDGET_WINDOW, min_samples: int = BUDGET_MIN_SAMPLES,
+                 percentile: float = BUDGET_PERCENTILE, margin: float = BUDGET_MARGIN,
+                 extra: int = BUDGET_EXTRA, floor: int = BUDGET_FLOOR):
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.margin = margin
+        self.extra = extra
+        self.floor = floor
+        self._samples: Dict[Hashable, Deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Hashable, eval_count: int, truncated: bool = False) -> None:
+        if eval_count <= 0:
+            return
+        value = int(eval_count * TRUNCATED_BOOST) if truncated else int(eval_count)
+        with self._lock:
+            dq = self._samples.get(key)
+            if dq is None:
+                dq = self._samples[key] = deque(maxlen=self.window)
+            dq.append(value)
+
+    def num_predict(self, key: Hashable, default: int, cap: Optional[int] = None) -> int:
+        """Бюджет токенов для key; default — пока статистики недостаточно."""
+        with self._lock:
+            dq = self._samples.get(key)
+            samples = sorted(dq) if dq is not None and len(dq) >= self.min_samples else None
+        if samples is None:
+            return default
+        budget = int(math.ceil(_percentile(samples, self.percentile) * (1 + self.margin))) + self.extra
+        budget = max(self.floor, budget)
+        return min(budget, cap) if cap else budget
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            snap = {key: sorted(dq) for key, dq in self._samples.items()}
+        return {
+            "|".join(map(str, key)) if isinstance(key, tuple) else str(key): {
+                "n": len(vals),
+                "p50": _percentile(vals, 50),
+                "p95": _percentile(vals, 95),
+                "max": vals[-1] if vals else 0,
+            }
+            for key, vals in snap.items()
+        }
+
+
+token_budget = TokenBudget()
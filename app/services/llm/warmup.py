@@ -0,0 +1,200 @@
+# app/services/llm/warmup.py
+# Прогрев и удержание моделей Ollama в памяти.
+#
+# Ollama выгружает модель через keep_alive после последнего запроса, и первый
+# пользователь после простоя платит холодную загрузку (часто дольше
+# OLLAMA_TIMEOUT → тихий fallback). ModelWarmer:
+#   - при старте процесса загружает модель пустым запросом (/api/generate без prompt);
+#   - в фоне шлёт такие же дешёвые пинги, но только пока есть трафик: если за
+#     WARM_TRAFFIC_WINDOW запросов не было, модели позволяем выгрузиться
+#     (WARM_TRAFFIC_WINDOW <= 0 — держать загруженной всегда);
+#   - отдаёт состояние (что загружено по /api/ps, когда использовалось/пинговалось).
+from __future__ import annotations
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+WARM_ENABLED = os.getenv("OLLAMA_WARMUP", "1").lower() in {"1", "true", "yes"}
+WARM_TRAFFIC_WINDOW = float(os.getenv("OLLAMA_WARM_TRAFFIC_WINDOW", "7200"))  # сек
+WARM_TICK = float(os.getenv("OLLAMA_WARM_TICK", "15"))
+WARM_TIMEOUT = float(os.getenv("OLLAMA_WARM_TIMEOUT", "120"))  # загрузка модели бывает долгой
+
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+# Go-формат длительностей, который принимает Ollama: "300", "5m", "1h30m", "1m30.5s", "-1"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h)")
+_DURATION_UNITS = {"ns": 1e-9, "us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """'5m' / '1h30m' / '30s' / '300' → секунды (формат keep_alive у Ollama); отрицательное — «навсегда»."""
+    v = (value or "").strip().lower()
+    if not v:
+        return 0.0
+    sign = -1.0 if v.startswith("-") else 1.0
+    v = v.lstrip("+-")
+    try:
+        return sign * float(v)  # голое число — секунды
+    except ValueError:
+        pass
+    pos, total = 0, 0.0
+    for m in _DURATION_PART.finditer(v):
+        if m.start() != pos:
+            break
+        total += float(m.group(1)) * _DURATION_UNITS[m.group(2)]
+        pos = m.end()
+    if pos == 0 or pos != len(v):
+        raise ValueError(f"invalid duration: {value!r}")
+    return sign * total
+
+
+def normalize_keep_alive(value: str) -> str:
+    """keep_alive как есть, если он разбирается; иначе предупреждение и DEFAULT_KEEP_ALIVE — процесс стартует."""
+    try:
+        parse_duration(value)
+        return value
+    except ValueError:
+        logger.warning("OLLAMA_KEEP_ALIVE=%r is not a valid duration; using %s", value, DEFAULT_KEEP_ALIVE)
+        return DEFAULT_KEEP_ALIVE
+
+
+class ModelWarmer:
+    def __init__(self, host: str, models: Iterable[str], keep_alive: str,
+                 traffic_window: float = WARM_TRAFFIC_WINDOW, tick: float = WARM_TICK, http=requests):
+        self.host = host.rstrip("/")
+        self.keep_alive = normalize_keep_alive(keep_alive)
+        self.keep_alive_sec = parse_duration(self.keep_alive)
+        self.traffic_window = traffic_window
+        self.tick = tick
+        self.http = http
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._arrivals: Deque[float] = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        for m in models:
+            self._entry(m)
+
+    def _entry(self, model: str) -> Dict[str, Any]:
+        e = self._models.get(model)
+        if e is None:
+            e = self._models[model] = {"last_used": 0.0, "last_ping": 0.0, "loaded": None, "error": None}
+        return e
+
+    # ---- вызывается из ollama_client ----
+    def note_use(self, model: str, now: Optional[float] = None) -> None:
+        now = now or time.monotonic()
+        with self._lock:
+            self._entry(model)["last_used"] = now
+            self._arrivals.append(now)
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        if self.traffic_window <= 0:
+            self._arrivals.clear()
+            return
+        while self._arrivals and now - self._arrivals[0] > self.traffic_window:
+            self._arrivals.popleft()
+
+    # ---- расписание пингов ----
+    def ping_interval(self) -> float:
+        """Пинг незадолго до истечения keep_alive (с запасом на тик и задержки)."""
+        return max(self.tick, self.keep_alive_sec * 0.8 - self.tick)
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """Модели, которым пора пинг: трафик недавно был, а сама модель простаивает."""
+        now = now or time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if self.keep_alive_sec <= 0 or (self.traffic_window > 0 and not self._arrivals):
+                return []
+            interval = self.ping_interval()
+            return [
+                m for m, e in self._models.items()
+                if now - max(e["last_used"], e["last_ping"]) >= interval
+            ]
+
+    # ---- HTTP ----
+    def ping(self, model: str) -> bool:
+        """Пустой /api/generate: загружает модель (или продлевает keep_alive), токенов не генерирует."""
+        t0 = time.monotonic()
+        try:
+            resp = self.http.post(
+                f"{self.host}/api/generate",
+                json={"model": model, "prompt": "", "keep_alive": self.keep_alive, "stream": False},
+                timeout=WARM_TIMEOUT,
+            )
+            ok = resp.status_code == 200
+            err = None if ok else f"HTTP {resp.status_code}"
+        except requests.RequestException as e:
+            ok, err = False, str(e)
+        with self._lock:
+            e = self._entry(model)
+            e["last_ping"] = time.monotonic()
+            e["loaded"] = ok
+            e["error"] = err
+        if ok:
+            logger.info("Ollama model %s warm (%.1fs)", model, time.monotonic() - t0)
+        else:
+            logger.warning("Ollama warm-up for %s failed: %s", model, err)
+        return ok
+
+    def loaded_models(self) -> Optional[Dict[str, str]]:
+        """{модель: expires_at} по /api/ps; None — Ollama недоступна."""
+        try:
+            resp = self.http.get(f"{self.host}/api/ps", timeout=5)
+            if resp.status_code != 200:
+                return None
+            return {m.get("name") or m.get("model"): m.get("expires_at") for m in resp.json().get("models", [])}
+        except (requests.RequestException, ValueError):
+            return None
+
+    def state(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        ps = self.loaded_models()
+        with self._lock:
+            self._trim(now)
+            models = {
+                m: {
+                    "loaded": (m in ps) if ps is not None else e["loaded"],
+                    "expires_at": ps.get(m) if ps else None,
+                    "last_used_ago": round(now - e["last_used"], 1) if e["last_used"] else None,
+                    "last_ping_ago": round(now - e["last_ping"], 1) if e["last_ping"] else None,
+                    "error": e["error"],
+                }
+                for m, e in self._models.items()
+            }
+            return {
+                "ollama_reachable": ps is not None,
+                "keep_alive": self.keep_alive,
+                "requests_in_window": len(self._arrivals),
+                "models": models,
+            }
+
+    # ---- фоновый поток ----
+    def start(self) -> None:
+        """Загрузить модели и запустить пинги (идемпотентно, не блокирует старт)."""
+        if not WARM_ENABLED or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        for m in list(self._models):
+            self.ping(m)
+        while not self._stop.wait(self.tick):
+            for m in self.due():
+                self.ping(m)
@@ -0,0 +1,57 @@
+# app/services/panel_grading.py
+# Компактная запись для проверки панели: id вопросов и заранее нормализованные
+# правильные ответы. Формат (UTF-8, bytes):
+#   "q1\x1fq2\x1f...\x1eответ1\x1fответ2\x1f..."
+# Пишется один раз в generate_panel; при submit — два split и сравнение списков
+# без json.loads и без повторной нормализации эталонов.
+from __future__ import annotations
+import json
+import unicodedata
+from operator import eq
+from typing import Iterable, List, Mapping, Tuple
+
+_FIELD = "\x1f"
+_GROUP = "\x1e"
+
+
+def norm_answer(s: str) -> str:
+    """lower + strip + снятие диакритики (á → a, ñ → n)."""
+    s = (s or "").strip().lower()
+    if s.isascii():  # NFD для ASCII — тождество, комбинирующих знаков нет
+        return s
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def _clean(s: str) -> str:
+    return s.replace(_FIELD, " ").replace(_GROUP, " ")
+
+
+def encode_grading(questions: Iterable[Tuple[str, str]]) -> bytes:
+    """[(qid, gold_answer), ...] → компактная запись с нормализованными ответами."""
+    ids: List[str] = []
+    golds: List[str] = []
+    for qid, gold in questions:
+        ids.append(_clean(str(qid)))
+        golds.append(_clean(norm_answer(gold)))
+    return (_FIELD.join(ids) + _GROUP + _FIELD.join(golds)).encode("utf-8")
+
+
+def decode_grading(blob: bytes) -> Tuple[List[str], List[str]]:
+    ids, _, golds = bytes(blob).decode("utf-8").partition(_GROUP)
+    if not ids:
+        return [], []
+    return ids.split(_FIELD), golds.split(_FIELD)
+
+
+def grade(blob: bytes, answers: Mapping[str, str]) -> Tuple[int, int]:
+    """(correct, total) по компактной записи."""
+    ids, golds = decode_grading(blob)
+    given = [norm_answer(answers.get(qid, "")) for qid in ids]
+    return sum(map(eq, given, golds)), len(ids)
+
+
+def grading_from_payload(payload_json: str | None) -> Tuple[bytes, str | None]:
+    """Старые упражнения без grading: собрать запись из payload_json."""
+    payload = json.loads(payload_json or "{}")
+    blob = encode_grading((q["id"], q.get("answer") or "") for q in payload.get("questions", []))
+    return blob, payload.get("difficulty")
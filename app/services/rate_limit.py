@@ -0,0 +1,202 @@
+# app/services/rate_limit.py
+# Token bucket на пользователя и на класс маршрутов целиком.
+#
+# Лимиты: RATE_LIMITS="llm=20/10,llm.global=600/100,jobs=30/20" —
+# "<класс>=<запросов в минуту>/<burst>", "<класс>.global" — общий бакет класса
+# для всех пользователей. Класс без записи не ограничивается.
+#
+# Бэкенды (RATE_LIMIT_BACKEND):
+#   memory — словарь в процессе: доли микросекунды на проверку, но у каждого
+#            процесса API свой лимит;
+#   db     — таблица rate_limit_bucket в основной БД: все бакеты запроса
+#            списываются в одной короткой транзакции, лимит общий для всех
+#            процессов, но строка "<класс>:*" — общая точка блокировки.
+from __future__ import annotations
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models.rate_limit_bucket import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "llm=20/10,llm.global=600/100,jobs=30/20")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()  # memory | db
+
+GLOBAL = "*"
+
+Limit = Tuple[float, float]  # (токенов в секунду, ёмкость)
+
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    """'llm=20/10,llm.global=600/100' → {"llm": (20/60, 10), "llm.global": (10.0, 100)}."""
+    out: Dict[str, Limit] = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        per_min, _, burst = value.partition("/")
+        try:
+            rate, cap = float(per_min) / 60.0, float(burst or per_min)
+        except ValueError:
+            continue
+        if rate > 0 and cap >= 1:
+            out[name.strip()] = (rate, cap)
+    return out
+
+
+def refill(tokens: float, updated_at: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class Decision:
+    __slots__ = ("allowed", "limit", "remaining", "reset", "retry_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset: float, retry_after: float = 0.0):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset          # секунд до полного бакета
+        self.retry_after = retry_after  # секунд до следующего токена (при отказе)
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            h["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return h
+
+
+# ---- бэкенды ----
+Bucket = Tuple[str, float, float]  # (ключ, токенов в секунду, ёмкость)
+
+
+def charge(states: List[float]) -> Tuple[bool, List[float]]:
+    """Списать по токену из каждого бакета — только если хватает во всех."""
+    ok = all(tokens >= 1.0 for tokens in states)
+    return ok, [tokens - 1.0 for tokens in states] if ok else states
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take_many(self, buckets: Sequence[Bucket], now: float) -> Tuple[bool, List[float]]:
+        """Списать по токену из всех бакетов разом; (успех, остатки после)."""
+        with self._lock:
+            states = []
+            for key, rate, capacity in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                states.append(refill(tokens, updated, now, rate, capacity))
+            ok, states = charge(states)
+            for (key, _, _), tokens in zip(buckets, states):
+                self._buckets[key] = (tokens, now)
+            return ok, states
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class DbBackend:
+    """
+    Бакеты в таблице rate_limit_bucket. Все бакеты запроса читаются одним
+    SELECT ... FOR UPDATE (в порядке ключей — без взаимных блокировок) и
+    пишутся в той же транзакции; SQLite сериализует запись сам.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self._table = RateLimitBucket.__table__
+
+    def take_many(self, buckets: Sequence[Bucket], now: float) -> Tuple[bool, List[float]]:
+        t = self._table
+        keys = sorted(key for key, _, _ in buckets)
+        for _ in range(2):
+            try:
+                with self.engine.begin() as conn:
+                    rows = {r.key: r for r in conn.execute(
+                        select(t.c.key, t.c.tokens, t.c.updated_at).where(t.c.key.in_(keys))
+                        .order_by(t.c.key).with_for_update())}
+                    states = [capacity if key not in rows
+                              else refill(rows[key].tokens, rows[key].updated_at, now, rate, capacity)
+                              for key, rate, capacity in buckets]
+                    ok, states = charge(states)
+                    for (key, _, _), tokens in zip(buckets, states):
+                        if key not in rows:
+                            conn.execute(insert(t).values(key=key, tokens=tokens, updated_at=now))
+                        elif ok:
+                            conn.execute(update(t).where(t.c.key == key).values(tokens=tokens, updated_at=now))
+                    return ok, states
+            except IntegrityError:
+                # бакет одновременно создал другой процесс — повторяем уже с UPDATE
+                continue
+            except SQLAlchemyError:
+                # БД недоступна, блокировка не дождалась и т.п. — ниже тот же пропуск
+                logger.exception("rate limit: buckets %s update failed", keys)
+                break
+        # не смогли посчитать — пропускаем запрос, а не роняем эндпоинт
+        logger.warning("rate limit: buckets %s not updated; allowing request", keys)
+        return True, [capacity for _, _, capacity in buckets]
+
+    def reset(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(self._table.delete())
+
+
+# ---- лимитер ----
+class RateLimiter:
+    def __init__(self, backend, limits: Optional[Dict[str, Limit]] = None, clock=time.time):
+        self.backend = backend
+        self.limits = parse_limits(RATE_LIMITS) if limits is None else limits
+        self.clock = clock
+
+    def check(self, route_class: str, user_id: int) -> Optional[Decision]:
+        """
+        Списать по токену из бакета пользователя и общего бакета класса — оба
+        или ни одного. None — класс не ограничен.
+        """
+        limits = [(key, limit) for key, limit in (
+            (f"{route_class}:{user_id}", self.limits.get(route_class)),
+            (f"{route_class}:{GLOBAL}", self.limits.get(f"{route_class}.global")),
+        ) if limit is not None]
+        if not limits:
+            return None
+        ok, states = self.backend.take_many([(key, *limit) for key, limit in limits], self.clock())
+        decisions = [self._decide(ok or left >= 1.0, left, *limit)
+                     for (_, limit), left in zip(limits, states)]
+        if not ok:
+            # при отказе — первый бакет, которому не хватило токена
+            return next(d for d in decisions if not d.allowed)
+        # в заголовках — тот бакет, что кончится раньше
+        return min(decisions, key=lambda d: d.remaining)
+
+    @staticmethod
+    def _decide(ok: bool, left: float, rate: float, capacity: float) -> Decision:
+        return Decision(
+            allowed=ok,
+            limit=int(capacity),
+            remaining=int(left),
+            reset=(capacity - left) / rate,
+            retry_after=0.0 if ok else (1.0 - left) / rate,
+        )
+
+    def reset(self) -> None:
+        self.backend.reset()
+
+
+def _make_backend():
+    if RATE_LIMIT_BACKEND == "db":
+        from database.database import engine
+        return DbBackend(engine)
+    return MemoryBackend()
+
+
+rate_limiter = RateLimiter(_make_backend())
@@ -0,0 +1,106 @@
+# app/services/spaced_repetition.py
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlmodel import Session
+
+from models.theme import Theme
+from models.theme_schedule import ThemeSchedule
+from services.crud.theme_schedule import (
+    get_earliest_schedule,
+    get_next_unseen_theme,
+    get_schedules_for_themes,
+)
+
+MIN_EASE = 1.3
+# провал (quality < 3) — повторяем тему через 10 минут, а не через сутки
+RELEARN_INTERVAL_DAYS = 10 / (24 * 60)
+
+
+def _as_utc(dt: datetime) -> datetime:
+    # SQLite отдаёт naive datetime — считаем его UTC
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def quality_from_score(score: int) -> int:
+    """Оценка панели 0..100 → качество ответа SM-2 (0..5)."""
+    return max(0, min(5, round((score or 0) / 20)))
+
+
+def sm2_step(repetitions: int, interval_days: float, ease: float, quality: int) -> Tuple[int, float, float]:
+    """
+    Один шаг SM-2: (repetitions, interval_days, ease) после ответа с качеством 0..5.
+    """
+    q = max(0, min(5, int(quality)))
+    ease = max(MIN_EASE, ease + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    if q < 3:
+        return 0, RELEARN_INTERVAL_DAYS, ease
+    repetitions += 1
+    if repetitions == 1:
+        interval_days = 1.0
+    elif repetitions == 2:
+        interval_days = 6.0
+    else:
+        interval_days = round(max(interval_days, 1.0) * ease, 2)
+    return repetitions, interval_days, ease
+
+
+def recommend_next_theme(
+    user_id: int, session: Session, now: Optional[datetime] = None
+) -> Tuple[Optional[Theme], Optional[ThemeSchedule]]:
+    """
+    Выбрать следующую тему (не больше двух запросов к БД):
+    1) просроченное повторение с минимальным due_at;
+    2) иначе — новая тема по порядку каталога;
+    3) иначе — ближайшее будущее повторение.
+    Возвращает (тема, запись расписания или None для новой темы).
+    """
+    now = now or datetime.now(timezone.utc)
+    earliest = get_earliest_schedule(user_id, session)
+    if earliest and _as_utc(earliest[0].due_at) <= now:
+        schedule, theme = earliest
+        return theme, schedule
+
+    unseen = get_next_unseen_theme(user_id, session)
+    if unseen:
+        return unseen, None
+    if earliest:
+        schedule, theme = earliest
+        return theme, schedule
+    return None, None
+
+
+def record_reviews_no_commit(
+    user_id: int,
+    qualities: Dict[int, int],
+    session: Session,
+    now: Optional[datetime] = None,
+) -> Dict[int, ThemeSchedule]:
+    """
+    Обновить расписание по результатам {theme_id: quality} одним IN-запросом.
+    Коммит выполняет вызывающая сторона.
+    """
+    if not qualities:
+        return {}
+    now = now or datetime.now(timezone.utc)
+    rows = get_schedules_for_themes(user_id, qualities.keys(), session)
+    for theme_id, quality in qualities.items():
+        row = rows.get(theme_id)
+        if row is None:
+            row = ThemeSchedule(user_id=user_id, theme_id=theme_id)
+            rows[theme_id] = row
+        row.repetitions, row.interval_days, row.ease = sm2_step(
+            row.repetitions, row.interval_days, row.ease, quality
+        )
+        row.last_reviewed_at = now
+        row.due_at = now + timedelta(days=row.interval_days)
+        session.add(row)
+    return rows
+
+
+def record_review_no_commit(
+    user_id: int, theme_id: int, quality: int, session: Session, now: Optional[datetime] = None
+) -> ThemeSchedule:
+    """Обновить расписание одной темы (обёртка над record_reviews_no_commit)."""
+    return record_reviews_no_commit(user_id, {theme_id: quality}, session, now)[theme_id]
@@ -0,0 +1,80 @@
+# app/services/theme_catalog.py
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional
+
+from sqlmodel import Session
+
+from schemas.theme import ThemeResponse
+from services.theme_index import ThemeIndex, ThemeSnapshot, theme_index
+
+
+class CatalogEntry:
+    """Готовый к отдаче ответ: сериализованное тело + сильный ETag."""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+
+class _Rendered:
+    def __init__(self, snap: ThemeSnapshot):
+        self.snap = snap
+        items = [ThemeResponse.model_validate(t).model_dump(mode="json") for t in snap.themes]
+        by_level: Dict[str, List[dict]] = {}
+        for it in items:
+            by_level.setdefault(it["level"], []).append(it)
+        self.all = CatalogEntry(items)
+        self.by_level = {lvl: CatalogEntry(rows) for lvl, rows in by_level.items()}
+        self.by_id = {it["id"]: CatalogEntry(it) for it in items}
+
+
+class ThemeCatalog:
+    """
+    HTTP-представление каталога тем поверх ThemeIndex: сериализованные тела
+    и ETag строятся один раз на каждый снимок индекса. Версия и инвалидация —
+    общие с индексом (theme_index.notify_changed()).
+    """
+
+    def __init__(self, index: ThemeIndex):
+        self.index = index
+        self._lock = threading.Lock()
+        self._rendered: Optional[_Rendered] = None
+
+    @property
+    def version(self) -> int:
+        return self.index.version
+
+    def invalidate(self) -> None:
+        self.index.notify_changed()
+
+    def _current(self, session: Session) -> _Rendered:
+        snap = self.index.snapshot(session)
+        rendered = self._rendered
+        if rendered is None or rendered.snap is not snap:
+            with self._lock:
+                rendered = self._rendered
+                if rendered is None or rendered.snap is not snap:
+                    rendered = self._rendered = _Rendered(snap)
+        return rendered
+
+    def all(self, session: Session) -> CatalogEntry:
+        return self._current(session).all
+
+    def by_level(self, level: str, session: Session) -> CatalogEntry:
+        return self._current(session).by_level.get(level) or _EMPTY
+
+    def by_id(self, theme_id: int, session: Session) -> Optional[CatalogEntry]:
+        entry = self._current(session).by_id.get(theme_id)
+        # промах: тема могла появиться в соседнем процессе — индекс перечитает БД
+        if entry is None and self.index.get(theme_id, session) is not None:
+            entry = self._current(session).by_id.get(theme_id)
+        return entry
+
+
+_EMPTY = CatalogEntry([])
+
+theme_catalog = ThemeCatalog(theme_index)
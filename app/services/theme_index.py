@@ -0,0 +1,131 @@
+# app/services/theme_index.py
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlmodel import Session
+
+from models.theme import Theme
+from services.crud.theme import get_all_themes
+from services.generation.exercise_panel import match_topic_key, normalize_level
+from services.generation.grammar import grammar_focus
+
+logger = logging.getLogger(__name__)
+
+# Воркеры не получают уведомлений от роутера тем — подтягивают изменения по TTL
+# и при промахе по id (новая тема, созданная в API-процессе).
+INDEX_TTL = float(os.getenv("THEME_INDEX_TTL", "30"))
+MISS_RELOAD_INTERVAL = 1.0
+
+
+def normalize_name(name: str) -> str:
+    return " ".join((name or "").lower().split())
+
+
+class IndexedTheme:
+    """
+    Отсоединённая от сессии копия темы + предрасчитанные метаданные генерации.
+    """
+    __slots__ = ("theme", "level_key", "topic_key", "focus", "norm_name")
+
+    def __init__(self, theme: Theme):
+        self.theme = theme
+        self.level_key = normalize_level(theme.level)
+        self.topic_key = match_topic_key(theme.name, theme.level)
+        self.focus = grammar_focus(theme.name, theme.level)
+        self.norm_name = normalize_name(theme.name)
+
+    def topic_key_for(self, level: str) -> Optional[str]:
+        """Ключ банка заглушек: предрасчитанный для уровня темы, для другого уровня — None (ищется заново)."""
+        return self.topic_key if normalize_level(level) == self.level_key else None
+
+
+class ThemeSnapshot:
+    """Неизменяемый снимок каталога: индексы по id, уровню и нормализованному имени."""
+
+    def __init__(self, themes: List[Theme], version: int):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.themes = themes  # порядок get_all_themes: level, name
+        self.by_id: Dict[int, IndexedTheme] = {}
+        self.by_level: Dict[str, List[IndexedTheme]] = {}
+        self.by_name: Dict[str, IndexedTheme] = {}
+        for t in themes:
+            entry = IndexedTheme(t)
+            self.by_id[t.id] = entry
+            self.by_level.setdefault(t.level, []).append(entry)
+            self.by_name.setdefault(entry.norm_name, entry)
+
+
+def _detached_copy(t: Theme) -> Theme:
+    return Theme(
+        id=t.id,
+        name=t.name,
+        level=t.level,
+        base_comic=t.base_comic,
+        bonus_comics=list(t.bonus_comics or []),
+        description=t.description,
+    )
+
+
+class ThemeIndex:
+    """
+    Общий read-mostly индекс тем процесса. Загружается при старте (load),
+    перестраивается после notify_changed() или по истечении TTL.
+    """
+
+    def __init__(self, ttl: float = INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot: Optional[ThemeSnapshot] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def notify_changed(self) -> None:
+        """Вызывается роутером тем после create/delete."""
+        with self._lock:
+            self._version += 1
+
+    def load(self, session: Session) -> ThemeSnapshot:
+        with self._lock:
+            version = self._version
+        themes = [_detached_copy(t) for t in get_all_themes(session)]
+        snap = ThemeSnapshot(themes, version)
+        with self._lock:
+            # не затираем более свежий снимок, собранный параллельно
+            if self._snapshot is None or self._snapshot.version <= version:
+                self._snapshot = snap
+        logger.info("ThemeIndex loaded: %d themes (v%s)", len(themes), version)
+        return snap
+
+    def snapshot(self, session: Session) -> ThemeSnapshot:
+        snap = self._snapshot
+        if (
+            snap is None
+            or snap.version != self._version
+            or time.monotonic() - snap.loaded_at >= self.ttl
+        ):
+            snap = self.load(session)
+        return snap
+
+    def get(self, theme_id: int, session: Session) -> Optional[IndexedTheme]:
+        snap = self.snapshot(session)
+        entry = snap.by_id.get(theme_id)
+        if entry is None and time.monotonic() - snap.loaded_at >= MISS_RELOAD_INTERVAL:
+            entry = self.load(session).by_id.get(theme_id)
+        return entry
+
+    def by_level(self, level: str, session: Session) -> List[IndexedTheme]:
+        return self.snapshot(session).by_level.get(level, [])
+
+    def by_name(self, name: str, session: Session) -> Optional[IndexedTheme]:
+        return self.snapshot(session).by_name.get(normalize_name(name))
+
+
+theme_index = ThemeIndex()
@@ -1,14 +1,16 @@
 from workers.worker_base import start_worker
 from services.generation.grammar import GrammarModel
-from models.theme import Theme
+from services.theme_index import theme_index
 from sqlmodel import Session
 
 def handle_job(job, session: Session):
-    theme = session.get(Theme, job.theme_id)
-    if not theme:
+    # тема берётся из индекса процесса, без запроса к БД
+    indexed = theme_index.get(job.theme_id, session)
+    if not indexed:
         raise ValueError("Тема не найдена")
+    theme = indexed.theme
     model = GrammarModel()
-    task_result = model.generate_task(theme, is_bonus=False)
+    task_result = model.generate_task(theme, is_bonus=False, focus=indexed.focus)
     return {
         "model_name": model.name,
         "theme_name": theme.name,
@@ -1,11 +1,14 @@
 from workers.worker_base import start_worker
 from services.generation.vocabulary import VocabularyModel
+from services.theme_index import theme_index
 from sqlmodel import Session
 
 def handle_job(job, session: Session):
-    theme = session.get(Theme, job.theme_id)
-    if not theme:
+    # тема берётся из индекса процесса, без запроса к БД
+    indexed = theme_index.get(job.theme_id, session)
+    if not indexed:
         raise ValueError("Тема не найдена")
+    theme = indexed.theme
     model = VocabularyModel()
     task_result = model.generate_task(theme, is_bonus=False)
     return {
@@ -0,0 +1,164 @@
+# bench/amqp_stub.py
+"""
+Брокер в процессе вместо RabbitMQ для нагрузочных прогонов.
+
+publish_task подменяется на постановку в queue.Queue; на каждую очередь —
+N потоков-потребителей, которые вызывают тот же обработчик, что и воркер
+(workers.worker_base.make_callback), с поддельным каналом. Заголовки те же,
+что у настоящего publish_task (traceparent, x-enqueued-at), так что спаны
+queue.wait и метрики WORKER_JOB/MQ_QUEUE_WAIT считаются как в проде.
+consume_lanes — обычная и быстрая полоса с тем же выбором по весам, что
+у start_worker (workers.worker_base.poll_lanes).
+"""
+import json
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from core import tracing
+from core.metrics import MQ_PUBLISH
+from workers.worker_base import WeightedLanes, poll_lanes
+
+
+class _Channel:
+    """От канала обработчику нужен только basic_ack."""
+
+    def __init__(self, broker: "InProcessBroker"):
+        self.broker = broker
+
+    def basic_ack(self, delivery_tag=None):
+        self.broker._acked(delivery_tag)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._queues: Dict[str, "queue.Queue"] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._tag = 0
+        self._inflight = 0
+        self._idle = threading.Condition(self._lock)
+        self._arrived = threading.Condition()
+        self._stopping = False
+        self.published = 0
+        self.acked = 0
+        self.waits: Dict[str, List[float]] = defaultdict(list)  # очередь → секунды от публикации до выдачи
+
+    def _queue(self, name: str) -> "queue.Queue":
+        with self._lock:
+            return self._queues.setdefault(name, queue.Queue())
+
+    def publish_task(self, queue_name: str, message: dict) -> None:
+        """Сигнатура и заголовки — как у mq.publisher.publish_task."""
+        with tracing.span("mq.publish", queue=queue_name), MQ_PUBLISH.time(queue=queue_name):
+            body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+            headers = tracing.inject({tracing.ENQUEUED_AT: repr(time.time())})
+            with self._lock:
+                self._tag += 1
+                self._inflight += 1
+                self.published += 1
+                tag = self._tag
+            self._queue(queue_name).put((tag, body, headers))
+        with self._arrived:
+            self._arrived.notify()
+
+    def consume(self, queue_name: str, callback: Callable, workers: int = 1) -> None:
+        """Запустить workers потоков на очередь; callback — как у basic_consume."""
+        q = self._queue(queue_name)
+        ch = _Channel(self)
+
+        def _loop():
+            while True:
+                item = q.get()
+                if item is None:
+                    return
+                self._deliver(queue_name, item, callback, ch)
+
+        for i in range(workers):
+            t = threading.Thread(target=_loop, name=f"consumer-{queue_name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def consume_lanes(self, weights: Dict[str, int], callbacks: Dict[str, Callable], workers: int = 1) -> None:
+        """
+        workers потоков, каждый разбирает все очереди из weights по весам —
+        как start_worker с быстрой полосой; callbacks — обработчик на очередь.
+        """
+        queues = {name: self._queue(name) for name in weights}
+        ch = _Channel(self)
+
+        def _get(name):
+            try:
+                return queues[name].get_nowait()
+            except queue.Empty:
+                return None
+
+        def _loop():
+            lanes = WeightedLanes(weights)
+            while not self._stopping:
+                picked = poll_lanes(lanes, _get)
+                if picked is None:
+                    with self._arrived:
+                        self._arrived.wait(0.05)
+                    continue
+                name, item = picked
+                if item is not None:
+                    self._deliver(name, item, callbacks[name], ch)
+
+        for i in range(workers):
+            t = threading.Thread(target=_loop, name=f"lanes-{'+'.join(weights)}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _deliver(self, queue_name: str, item, callback: Callable, ch: _Channel) -> None:
+        tag, body, headers = item
+        wait = time.time() - float(headers[tracing.ENQUEUED_AT])
+        with self._lock:
+            self.waits[queue_name].append(wait)
+        callback(ch, SimpleNamespace(delivery_tag=tag), SimpleNamespace(headers=headers), body)
+
+    def _acked(self, tag) -> None:
+        with self._lock:
+            self.acked += 1
+            self._inflight -= 1
+            if self._inflight <= 0:
+                self._idle.notify_all()
+
+    def drain(self, timeout: float = 60.0) -> bool:
+        """Дождаться, пока все опубликованные сообщения подтверждены."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._inflight > 0:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._idle.wait(left)
+        return True
+
+    def depth(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: q.qsize() for name, q in self._queues.items()}
+
+    def stop(self) -> None:
+        self._stopping = True
+        with self._arrived:
+            self._arrived.notify_all()
+        with self._lock:
+            queues = list(self._queues.values())
+        for q in queues:
+            for _ in self._threads:
+                q.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads.clear()
+
+
+def install(broker: InProcessBroker) -> None:
+    """Подменить publish_task там, где его уже импортировали (роутер и модуль publisher)."""
+    import mq.publisher
+    import routers.prediction_async
+    mq.publisher.publish_task = broker.publish_task
+    routers.prediction_async.publish_task = broker.publish_task
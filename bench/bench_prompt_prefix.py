@@ -0,0 +1,101 @@
+# bench/bench_prompt_prefix.py
+"""
+Бенчмарк prompt eval у Ollama: монолитный промпт (как было до разделения)
+против system + короткий prompt из services/llm/prompts.
+
+Каждый запрос — с num_predict=1, чтобы в замер попадала только обработка
+промпта. Темы и count меняются от запроса к запросу, как в реальной нагрузке.
+Печатает по режимам prompt_eval_count и prompt_eval_duration (p50/p95, мс)
+из ответа Ollama. Нужна запущенная Ollama с загруженной моделью.
+
+    python bench/bench_prompt_prefix.py --requests 30 --level B1
+    OLLAMA_HOST=http://localhost:11434 python bench/bench_prompt_prefix.py --model qwen2.5:3b-instruct
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import requests
+
+from services.llm.prompts import LEVEL_GUIDE, TASK_TYPES, panel_system, panel_user
+
+THEMES = ("Familia", "Viajes", "Comida", "Trabajo", "Ciudad", "Tiempo libre", "Salud", "Compras")
+
+
+def legacy_prompt(theme_name: str, count: int, level: str) -> str:
+    """Промпт в прежнем виде: count и тема в самом начале, профиль уровня после."""
+    guide = LEVEL_GUIDE[level]
+    picked = random.sample(TASK_TYPES, k=3)
+    return f"""
+Eres profesor de ELE (Español como Lengua Extranjera).
+Genera EXACTAMENTE {count} ejercicios tipo test en español para nivel {level}.
+Tema: "{theme_name}".
+
+Respeta el perfil del nivel:
+- Léxico: {guide['lexicon']}
+- Gramática: {guide['grammar']}
+- Longitud de frase: {guide['length']}
+- Evitar: {guide['avoid']}
+
+Varía los tipos de ejercicio entre: {", ".join(picked)}.
+Cada ejercicio es un objeto JSON con claves:
+- "prompt": enunciado breve y claro en español;
+- "choices": array de 4 opciones plausibles (strings);
+- "answer": string con la ÚNICA opción correcta (debe estar en "choices").
+
+REQUISITOS:
+- Usa SOLO estructuras propias del nivel {level}.
+- Longitud del enunciado acorde al nivel.
+- No repitas enunciados ni respuestas.
+- Salida: SOLO un array JSON con {count} objetos (sin comentarios, sin markdown).
+""".strip()
+
+
+def run(host: str, model: str, mode: str, n: int, level: str):
+    counts, durations = [], []
+    for i in range(n):
+        theme, count = THEMES[i % len(THEMES)], random.choice((5, 10, 15))
+        payload = {"model": model, "stream": False, "options": {"num_predict": 1, "temperature": 0}}
+        if mode == "split":
+            payload["system"] = panel_system(level)
+            payload["prompt"] = panel_user(theme, count)
+        else:
+            payload["prompt"] = legacy_prompt(theme, count, level)
+        resp = requests.post(f"{host}/api/generate", json=payload, timeout=300)
+        resp.raise_for_status()
+        data = resp.json()
+        counts.append(int(data.get("prompt_eval_count") or 0))
+        durations.append((data.get("prompt_eval_duration") or 0) / 1e6)
+    durations.sort()
+    return {
+        "mode": mode,
+        "requests": n,
+        "prompt_eval_count_avg": round(statistics.mean(counts), 1),
+        "prompt_eval_ms_p50": round(statistics.median(durations), 1),
+        "prompt_eval_ms_p95": round(durations[int(0.95 * (len(durations) - 1))], 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+    ap.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "qwen2.5:3b-instruct"))
+    ap.add_argument("--requests", type=int, default=20)
+    ap.add_argument("--level", default="A2", choices=sorted(LEVEL_GUIDE))
+    args = ap.parse_args()
+
+    host = args.host.rstrip("/")
+    # прогрев: загрузка модели не должна попасть в первый замер
+    requests.post(f"{host}/api/generate", json={"model": args.model, "prompt": ""}, timeout=300)
+    for mode in ("legacy", "split"):
+        print(run(host, args.model, mode, args.requests, args.level))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# bench/ollama_stub.py
+"""
+Локальная заглушка Ollama для нагрузочных прогонов (bench/load.py).
+
+Отвечает на POST /api/generate (stream и non-stream) и GET /api/ps так же,
+как настоящий сервер, но без модели: массив упражнений собирается по
+maxItems из "format", комикс — по COMIC_SCHEMA. Настраиваются:
+  --latency   задержка до первого токена: "200" | "100-400" (равномерно) | "lognorm:300:0.5";
+  --tokens-per-sec  скорость выдачи (0 — весь ответ сразу);
+  --malformed доля ответов с битым JSON (обрезанный хвост), 0..1.
+
+    python bench/ollama_stub.py --port 11555 --latency 100-400 --tokens-per-sec 80 --malformed 0.05
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any, Dict, Optional
+
+VERBS = ("hablar", "comer", "vivir", "ser", "estar", "tener", "ir", "hacer", "poder", "decir")
+FORMS = ("hablo", "como", "vivo", "soy", "estoy", "tengo", "voy", "hago", "puedo", "digo")
+# нарезка ответа на «токены» для потокового режима
+_TOKEN_RE = re.compile(r"\s*\S{1,6}")
+
+
+def parse_latency(spec: str):
+    """Строка задержки → функция rnd -> секунды."""
+    spec = (spec or "0").strip()
+    if spec.startswith("lognorm:"):
+        _, median_ms, sigma = spec.split(":")
+        mu, s = math.log(float(median_ms) / 1000), float(sigma)
+        return lambda rnd: rnd.lognormvariate(mu, s)
+    if "-" in spec:
+        lo, hi = (float(x) / 1000 for x in spec.split("-", 1))
+        return lambda rnd: rnd.uniform(lo, hi)
+    fixed = float(spec) / 1000
+    return lambda rnd: fixed
+
+
+class StubConfig:
+    def __init__(self, latency: str = "0", tokens_per_sec: float = 0.0, malformed: float = 0.0,
+                 seed: Optional[int] = None):
+        self.latency = parse_latency(latency)
+        self.tokens_per_sec = float(tokens_per_sec)
+        self.malformed = float(malformed)
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.seq = count(1)
+        self.stats = {"requests": 0, "malformed": 0, "streamed": 0}
+
+    def draw(self):
+        with self.lock:
+            return self.latency(self.rnd), self.rnd.random() < self.malformed
+
+
+def _exercises(n: int, seq: int) -> list:
+    items = []
+    for i in range(n):
+        k = (seq * 7 + i) % len(VERBS)
+        choices = [FORMS[(k + j) % len(FORMS)] for j in range(4)]
+        items.append({
+            # уникальный текст: фильтр почти-дубликатов не должен съедать ответы заглушки
+            "prompt": f"[{seq}.{i}] Yo ___ ({VERBS[k]}) todos los días.",
+            "choices": choices,
+            "answer": FORMS[k],
+        })
+    return items
+
+
+def build_response(payload: Dict[str, Any], seq: int) -> str:
+    fmt = payload.get("format")
+    if isinstance(fmt, dict) and fmt.get("type") == "object":
+        body: Any = {"difficulty": "easy", "explanation": f"Historieta {seq}: Ana va al mercado.",
+                     "vocabulary": ["mercado", "comprar", "fruta"]}
+    else:
+        n = fmt.get("maxItems", 5) if isinstance(fmt, dict) else 5
+        body = _exercises(int(n), seq)
+    return json.dumps(body, ensure_ascii=False)
+
+
+def make_handler(cfg: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # тишина: иначе вывод нагрузки тонет в логах
+            pass
+
+        def _json(self, code: int, obj: Any) -> None:
+            data = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith("/api/ps"):
+                return self._json(200, {"models": []})
+            self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self.path.startswith("/api/generate"):
+                return self._json(404, {"error": "not found"})
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            delay, broken = cfg.draw()
+            seq = next(cfg.seq)
+            text = build_response(payload, seq) if payload.get("prompt") else ""
+            if broken and text:
+                text = text[: max(1, len(text) * 2 // 3)]
+            with cfg.lock:
+                cfg.stats["requests"] += 1
+                cfg.stats["malformed"] += int(broken)
+            time.sleep(delay)
+            tokens = _TOKEN_RE.findall(text)
+            final = {"model": payload.get("model"), "done": True, "done_reason": "stop",
+                     "prompt_eval_count": len(str(payload.get("prompt", ""))) // 4,
+                     "prompt_eval_duration": int(delay * 1e9), "eval_count": len(tokens)}
+            if not payload.get("stream", True):
+                if cfg.tokens_per_sec > 0:
+                    time.sleep(len(tokens) / cfg.tokens_per_sec)
+                return self._json(200, {**final, "response": text})
+            self._stream(tokens, final)
+
+        def _stream(self, tokens, final) -> None:
+            with cfg.lock:
+                cfg.stats["streamed"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pause = 1.0 / cfg.tokens_per_sec if cfg.tokens_per_sec > 0 else 0.0
+            try:
+                for tok in tokens:
+                    self._chunk({"response": tok, "done": False})
+                    if pause:
+                        time.sleep(pause)
+                self._chunk({**final, "response": ""})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # клиент закрыл поток, как только JSON закрылся, — штатно
+                self.close_connection = True
+
+        def _chunk(self, obj: Dict[str, Any]) -> None:
+            data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # клиент рвёт keep-alive соединение после раннего закрытия потока — не ошибка
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start(port: int = 0, host: str = "127.0.0.1", **cfg_kwargs):
+    """Поднять заглушку в фоне; возвращает (server, cfg). server.server_address — фактический порт."""
+    cfg = StubConfig(**cfg_kwargs)
+    server = _Server((host, port), make_handler(cfg))
+    threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True).start()
+    return server, cfg
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Заглушка Ollama для нагрузочных тестов")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11555)
+    ap.add_argument("--latency", default="150-400", help='"200" | "100-400" | "lognorm:300:0.5" (мс)')
+    ap.add_argument("--tokens-per-sec", type=float, default=0.0)
+    ap.add_argument("--malformed", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    server, _ = start(args.port, args.host, latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                      malformed=args.malformed, seed=args.seed)
+    print(f"ollama stub on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
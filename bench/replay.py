@@ -0,0 +1,215 @@
+# bench/replay.py
+"""
+Воспроизведение записанного трафика (core/traffic_recorder.py) против локального стенда.
+
+Запросы уходят в исходном порядке и с исходными интервалами, ускоренными
+в --speed раз (конкурентность сохраняется сама: перекрывавшиеся запросы
+снова перекрываются); --speed max — без пауз, в --concurrency потоков
+(по умолчанию — максимум одновременных запросов в записи). Токены
+выпускаются заново для записанного user_id — у стенда должен быть тот же
+SECRET_KEY. Пароли в записи скрыты; --password подставляет свой.
+
+Отчёт по маршрутам: p50/p95 в записи и при воспроизведении, разница и
+расхождения статусов.
+
+    TRAFFIC_RECORD_PATH=traffic.jsonl uvicorn api:app ...    # запись на проде/стенде
+    python bench/replay.py traffic.jsonl --base-url http://localhost:8080 --speed 1
+    python bench/replay.py traffic.jsonl --speed 5 --out replay-report.json
+    python bench/replay.py traffic.jsonl --speed max --concurrency 64 --routes /api/panel
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import requests
+
+from core.security import create_access_token
+from core.traffic_recorder import REDACTED
+
+_PASSWORD_KEYS = {"password", "raw_password"}
+
+
+def load(path: str, routes=None, limit=None) -> list:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            e = json.loads(line)
+            if routes and not any(r in (e.get("route") or e["path"]) for r in routes):
+                continue
+            entries.append(e)
+    entries.sort(key=lambda e: e["ts"])
+    return entries[:limit] if limit else entries
+
+
+def _fill_passwords(value, password):
+    if isinstance(value, dict):
+        return {k: (password if k in _PASSWORD_KEYS and v == REDACTED else _fill_passwords(v, password))
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill_passwords(v, password) for v in value]
+    return value
+
+
+class RequestBuilder:
+    def __init__(self, base_url: str, password=None):
+        self.base_url = base_url.rstrip("/")
+        self.password = password
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _auth(self, auth):
+        if not auth:
+            return {}
+        if auth.get("invalid") or auth.get("user_id") is None:
+            return {"Authorization": "Bearer invalid"}
+        key = (auth["user_id"], auth.get("is_admin", False))
+        with self._lock:
+            tok = self._tokens.get(key)
+            if tok is None:
+                payload = {"user_id": key[0], "is_admin": key[1], "email": f"replay{key[0]}@replay.example.com"}
+                tok = self._tokens[key] = create_access_token(payload)[0]
+        return {"Authorization": f"Bearer {tok}"}
+
+    def build(self, e: dict):
+        """(method, url, kwargs) или None, если тело не записано (не-JSON или слишком большое)."""
+        if "body_bytes" in e:
+            return None
+        url = self.base_url + e["path"] + (f"?{e['query']}" if e.get("query") else "")
+        kwargs = {"headers": self._auth(e.get("auth")), "timeout": 300}
+        if "body" in e:
+            kwargs["json"] = _fill_passwords(e["body"], self.password) if self.password else e["body"]
+        return e["method"], url, kwargs
+
+
+def replay(entries: list, builder: RequestBuilder, speed, concurrency: int) -> dict:
+    results = []  # (entry, status, latency_ms, lag_ms)
+    lock = threading.Lock()
+    local = threading.local()
+    skipped = Counter()
+
+    def _send(e, scheduled_at):
+        req = builder.build(e)
+        if req is None:
+            with lock:
+                skipped["opaque_body"] += 1
+            return
+        http = getattr(local, "http", None)
+        if http is None:
+            http = local.http = requests.Session()
+        method, url, kwargs = req
+        lag = (time.perf_counter() - scheduled_at) * 1000 if scheduled_at is not None else 0.0
+        t0 = time.perf_counter()
+        try:
+            status = http.request(method, url, **kwargs).status_code
+        except requests.RequestException as exc:
+            status = type(exc).__name__
+        latency = (time.perf_counter() - t0) * 1000
+        with lock:
+            results.append((e, status, latency, lag))
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if speed == "max":
+            for e in entries:
+                pool.submit(_send, e, None)
+        else:
+            ts0 = entries[0]["ts"] if entries else 0.0
+            for e in entries:
+                due = t_start + (e["ts"] - ts0) / speed
+                pause = due - time.perf_counter()
+                if pause > 0:
+                    time.sleep(pause)
+                pool.submit(_send, e, due)
+    wall = time.perf_counter() - t_start
+    return {"results": results, "skipped": dict(skipped), "wall_s": wall}
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def report(run: dict) -> dict:
+    by_route = defaultdict(list)
+    for e, status, latency, lag in run["results"]:
+        by_route[f"{e['method']} {e.get('route') or e['path']}"].append((e, status, latency))
+    routes = {}
+    for key, rows in by_route.items():
+        rec = sorted(r[0]["duration_ms"] for r in rows)
+        cur = sorted(r[2] for r in rows)
+        rec50, rec95, cur50, cur95 = _pct(rec, 50), _pct(rec, 95), _pct(cur, 50), _pct(cur, 95)
+        routes[key] = {
+            "requests": len(rows),
+            "recorded_p50_ms": round(rec50, 2),
+            "recorded_p95_ms": round(rec95, 2),
+            "replay_p50_ms": round(cur50, 2),
+            "replay_p95_ms": round(cur95, 2),
+            "delta_p50_ms": round(cur50 - rec50, 2),
+            "delta_p95_ms": round(cur95 - rec95, 2),
+            "delta_p95_pct": round((cur95 - rec95) / rec95 * 100, 1) if rec95 else None,
+            "status_mismatch": sum(1 for e, status, _ in rows if status != e["status"]),
+        }
+    lags = sorted(r[3] for r in run["results"])
+    n = len(run["results"])
+    return {
+        "requests": n,
+        "skipped": run["skipped"],
+        "wall_s": round(run["wall_s"], 3),
+        "throughput_rps": round(n / run["wall_s"], 2) if run["wall_s"] > 0 else 0.0,
+        # клиент не успевал отправлять вовремя — задержки стенда занижены, нужен ещё один генератор
+        "schedule_lag_p95_ms": round(_pct(lags, 95), 2),
+        "routes": dict(sorted(routes.items(), key=lambda kv: -(kv[1]["delta_p95_ms"]))),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("log", help="JSONL из TRAFFIC_RECORD_PATH")
+    ap.add_argument("--base-url", default="http://localhost:8080")
+    ap.add_argument("--speed", default="1", help='множитель темпа (1, 2, 10 …) или "max"')
+    ap.add_argument("--concurrency", type=int, default=None,
+                    help="потоков клиента; по умолчанию — пик одновременных запросов в записи (×2 для темпа)")
+    ap.add_argument("--password", default=None, help="пароль вместо скрытого в записи (signin/signup)")
+    ap.add_argument("--routes", default=None, help="фильтр по подстроке маршрута, через запятую")
+    ap.add_argument("--limit", type=int, default=None)
+    ap.add_argument("--out", default=None, help="куда записать отчёт (JSON)")
+    args = ap.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(",")] if args.routes else None
+    entries = load(args.log, routes, args.limit)
+    if not entries:
+        ap.error("no entries to replay")
+    speed = "max" if args.speed == "max" else float(args.speed)
+    peak = max(e.get("inflight") or 1 for e in entries)
+    concurrency = args.concurrency or (peak if speed == "max" else peak * 2 + 4)
+    print(f"replaying {len(entries)} requests at speed={args.speed}, concurrency={concurrency} (recorded peak {peak})")
+
+    out = report(replay(entries, RequestBuilder(args.base_url, args.password), speed, concurrency))
+    print(f"wall={out['wall_s']}s rps={out['throughput_rps']} lag_p95={out['schedule_lag_p95_ms']}ms "
+          f"skipped={out['skipped']}")
+    for key, r in out["routes"].items():
+        print(f"  {key:50s} n={r['requests']:5d} p50 {r['recorded_p50_ms']:8.1f} → {r['replay_p50_ms']:8.1f}  "
+              f"p95 {r['recorded_p95_ms']:8.1f} → {r['replay_p95_ms']:8.1f}  status≠{r['status_mismatch']}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **out}, f, ensure_ascii=False, indent=2)
+        print(f"report: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,9 @@ from database.database import get_session
 from dependencies.auth import get_current_user, get_current_admin
 from dependencies.authz import self_or_admin
 from schemas.auth import TokenData
+from services.theme_index import theme_index
+from services.rate_limit import rate_limiter
+from core.query_audit import QueryAudit, attach
 
 @pytest.fixture(scope="session")
 def engine():
@@ -81,6 +84,25 @@ def session(connection):
             pass
 
 
+@pytest.fixture
+def query_counter(engine):
+    """
+    with query_counter() as q: client.get(...)
+    q.count — число SQL в блоке, q.repeated() — одинаковые запросы (N+1).
+    """
+    from contextlib import contextmanager
+
+    @contextmanager
+    def _count():
+        audit = QueryAudit()
+        detach = attach(engine, audit)
+        try:
+            yield audit
+        finally:
+            detach()
+    return _count
+
+
 @pytest.fixture
 def client(session: SQLMSession):
     def _get_session_override():
@@ -88,6 +110,10 @@ def client(session: SQLMSession):
 
     # подменяем сессию БД
     app.dependency_overrides[get_session] = _get_session_override
+    # БД откатывается после каждого теста — снимок индекса тем тоже сбрасываем
+    theme_index.notify_changed()
+    # id пользователей повторяются между тестами — бакеты лимитов тоже с нуля
+    rate_limiter.reset()
 
     # дефолт: гость = обычный юзер id=0 (если где-то потребуют)
     app.dependency_overrides[get_current_user] = lambda: TokenData(user_id=0, is_admin=False, email="guest@example.com")
@@ -133,6 +159,18 @@ def signup(client: TestClient):
         return int(body.get("user_id") or body.get("id"))
     return _do
 
+@pytest.fixture
+def create_theme(client: TestClient):
+    def _do(admin_h: dict, name: str = "A1 - theme", level: str = "A1") -> int:
+        r = client.post(
+            "/api/themes/",
+            headers=admin_h,
+            json={"name": name, "level": level, "base_comic": "base.png", "bonus_comics": []},
+        )
+        assert r.status_code == HTTPStatus.CREATED, r.text
+        return r.json()["id"]
+    return _do
+
 @pytest.fixture
 def signin(client: TestClient):
     def _do(email: str, password: str) -> str:
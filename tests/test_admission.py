@@ -0,0 +1,141 @@
+import threading
+import time
+from http import HTTPStatus
+
+import pytest
+
+import routers.panel
+import routers.prediction
+from services.generation import exercise_panel
+from services.llm.admission import AdmissionController, Overloaded, PAID, FREE
+
+
+def _hold_slot(ctl, priority=FREE):
+    """Занять слот в фоне; возвращает функцию, освобождающую слот."""
+    taken, release = threading.Event(), threading.Event()
+
+    def _run():
+        with ctl.admit(priority):
+            taken.set()
+            release.wait(5)
+    t = threading.Thread(target=_run, daemon=True)
+    t.start()
+    assert taken.wait(5)
+
+    def _release():
+        release.set()
+        t.join(5)
+    return _release
+
+
+def test_sheds_to_fallback_or_429_when_projected_wait_exceeds_budget():
+    ctl = AdmissionController(max_inflight=1, wait_budget=1.0, classes={PAID: 3, FREE: 1},
+                              mode="fallback", service_time=2.0)
+    release = _hold_slot(ctl)
+    try:
+        # прогноз 2с > бюджета free (1с) — без ожидания, сразу фолбэк
+        t0 = time.monotonic()
+        with ctl.admit(FREE) as use_llm:
+            assert use_llm is False
+        assert time.monotonic() - t0 < 0.5
+
+        ctl.mode = "reject"
+        with pytest.raises(Overloaded) as exc:
+            with ctl.admit(FREE):
+                pass
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "2"
+    finally:
+        release()
+    # после освобождения слот снова доступен
+    with ctl.admit(FREE) as use_llm:
+        assert use_llm is True
+    assert ctl.snapshot()["inflight"] == 0
+
+
+def test_paid_waits_within_budget_and_goes_ahead_of_free():
+    ctl = AdmissionController(max_inflight=1, wait_budget=0.5, classes={PAID: 10, FREE: 4},
+                              mode="fallback", service_time=0.1)
+    release = _hold_slot(ctl)
+    order = []
+
+    def _call(priority):
+        with ctl.admit(priority) as use_llm:
+            order.append((priority, use_llm))
+
+    free = threading.Thread(target=_call, args=(FREE,))
+    free.start()
+    while ctl.snapshot()["queued"] < 1:
+        time.sleep(0.01)
+    paid = threading.Thread(target=_call, args=(PAID,))
+    paid.start()
+    while ctl.snapshot()["queued"] < 2:
+        time.sleep(0.01)
+    release()
+    free.join(5)
+    paid.join(5)
+    assert order == [(PAID, True), (FREE, True)]
+
+
+def test_predict_returns_429_and_refunds_bonus(signup, as_admin, as_user, client, monkeypatch):
+    user_id = signup("shed@example.com", "password123")
+    admin_h = as_admin()
+    client.post("/api/wallet/admin_top_up", headers=admin_h, json={"user_id": user_id, "amount": 5, "reason": "init"})
+    theme_id = client.post("/api/themes/", headers=admin_h, json={
+        "name": "A1 - shed", "level": "A1", "base_comic": "base.png", "bonus_comics": []}).json()["id"]
+    user_h = as_user(user_id)
+
+    ctl = AdmissionController(max_inflight=1, wait_budget=0.1, mode="reject", service_time=5.0)
+    monkeypatch.setattr(routers.prediction, "admission", ctl)
+    monkeypatch.setattr(routers.panel, "admission", ctl)
+    # в тестах Ollama выключена — считаем, что вызов был бы
+    monkeypatch.setattr(routers.prediction, "ollama_enabled", lambda: True)
+    monkeypatch.setattr(routers.panel, "llm_enabled", lambda: True)
+    release = _hold_slot(ctl)
+    try:
+        r = client.post("/api/predictions/", headers=user_h,
+                        json={"user_id": user_id, "theme_id": theme_id, "is_bonus": True})
+        assert r.status_code == HTTPStatus.TOO_MANY_REQUESTS, r.text
+        assert int(r.headers["Retry-After"]) >= 1
+        assert client.get(f"/api/wallet/{user_id}", headers=user_h).json()["balance"] == 5
+
+        # режим reject действует и на /panel/generate
+        r = client.post(f"/api/panel/generate?theme_id={theme_id}", headers=user_h)
+        assert r.status_code == HTTPStatus.TOO_MANY_REQUESTS
+
+        # в режиме fallback — мгновенный ответ из банка
+        ctl.mode = "fallback"
+        r = client.post(f"/api/panel/generate?theme_id={theme_id}", headers=user_h)
+        assert r.status_code == HTTPStatus.OK, r.text
+        assert r.json()["questions"]
+    finally:
+        release()
+
+
+def test_no_slot_taken_when_ollama_is_not_called(signup, as_admin, as_user, client, monkeypatch):
+    user_id = signup("noslot@example.com", "password123")
+    theme_id = client.post("/api/themes/", headers=as_admin(), json={
+        "name": "A1 - noslot", "level": "A1", "base_comic": "base.png", "bonus_comics": []}).json()["id"]
+    user_h = as_user(user_id)
+
+    ctl = AdmissionController(max_inflight=1, wait_budget=0.1, mode="reject", service_time=5.0)
+    monkeypatch.setattr(routers.prediction, "admission", ctl)
+    monkeypatch.setattr(routers.panel, "admission", ctl)
+    release = _hold_slot(ctl)
+    try:
+        # Ollama выключена (как в тестах) — очередь не мешает и service_time не трогается
+        r = client.post(f"/api/panel/generate?theme_id={theme_id}", headers=user_h)
+        assert r.status_code == HTTPStatus.OK, r.text
+        r = client.post("/api/predictions/panel", headers=user_h, json={"user_id": user_id, "theme_id": theme_id})
+        assert r.status_code == HTTPStatus.OK, r.text
+
+        # Ollama включена, но банк форсирован — тоже без слота
+        monkeypatch.setattr(exercise_panel, "ollama_enabled", lambda: True)
+        monkeypatch.setenv("PANEL_FORCE_FALLBACK", "1")
+        r = client.post(f"/api/panel/generate?theme_id={theme_id}", headers=user_h)
+        assert r.status_code == HTTPStatus.OK, r.text
+
+        assert ctl.snapshot()["inflight"] == 1
+        assert ctl.service_time == 5.0
+    finally:
+        release()
@@ -0,0 +1,89 @@
+import json
+
+from services.generation.keyword_index import KeywordMatcher
+from services.generation.exercise_bank import compile_bank, load_bank_file
+from services.generation.exercise_panel import FALLBACK_BANK, _fallback_generate, match_topic_key
+from services.generation.grammar import grammar_focus
+
+
+def _naive_topic(theme_name, keys):
+    t = theme_name.lower()
+    for k in keys:
+        for v in [s.strip() for s in k.split("|")]:
+            if v and v in t:
+                return k
+    return None
+
+
+def test_matcher_same_as_substring_scan():
+    """Ахо–Корасик возвращает тот же ключ, что и прежний перебор подстрок."""
+    names = [
+        "A1 - ser/estar", "Прилагательные и comparativos", "pretérito perfecto",
+        "por y para", "nada", "pronombres de objeto", "Condicional tipo 2", "",
+    ]
+    for level, topics in FALLBACK_BANK.items():
+        for name in names:
+            assert match_topic_key(name, level) == _naive_topic(name, list(topics)), (level, name)
+
+    m = KeywordMatcher([("he", 1), ("she", 2), ("hers", 3)])
+    assert m.best("ushers") == 1
+    assert m.best("xyz") is None
+
+
+def test_fallback_sample_and_focus():
+    items = _fallback_generate("A1 - artículos", 2, "A1")
+    assert [q.id for q in items] == ["q1", "q2"]
+    assert all(q.answer in q.choices for q in items)
+    # запрошено больше, чем есть в теме → вся тема
+    assert len(_fallback_generate("A1 - artículos", 50, "A1")) == 3
+    assert grammar_focus("Прилагательные", "A1").startswith("A1: согласование")
+
+
+def test_external_jsonl_bank(tmp_path):
+    path = tmp_path / "bank.jsonl"
+    rows = [
+        {"level": "A1", "topic": "colores|colors", "prompt": f"Color {i}", "choices": ["rojo", "azul"], "answer": "rojo"}
+        for i in range(500)
+    ]
+    rows.append({"level": "A1", "topic": "colores", "prompt": "bad", "choices": ["a"], "answer": "b"})
+    path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in rows), encoding="utf-8")
+
+    bank = compile_bank(FALLBACK_BANK, load_bank_file(str(path)))
+    assert bank.match_topic("Los colores", "A1") == "colores|colors"
+    picked = bank.sample("A1", "colores|colors", 5)
+    assert len(picked) == 5 and len({p for p, _, _ in picked}) == 5
+    assert len(bank.levels["A1"].topics["colores|colors"]) == 500  # невалидный элемент отброшен
+
+
+def test_mmap_bank_roundtrip(tmp_path):
+    from services.generation.bank_store import BankChain, MmapBank, build_bank_file
+
+    src = tmp_path / "bank.jsonl"
+    rows = [
+        {"level": lvl, "topic": topic, "prompt": f"{lvl} {topic} {i} ñ", "choices": ["sí", "no"], "answer": "sí"}
+        for lvl in ("A1", "B1") for topic in ("colores|colors", "comida") for i in range(300)
+    ]
+    rows.append({"level": "A1", "topic": "comida", "prompt": "bad", "choices": ["a"], "answer": "b"})
+    src.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in rows), encoding="utf-8")
+
+    dst = tmp_path / "bank.spbank"
+    stats = build_bank_file(str(src), str(dst))
+    assert stats == {"items": 1200, "skipped": 1, "segments": 4}
+
+    bank = MmapBank(str(dst))
+    try:
+        assert len(bank) == 1200
+        assert bank.match_topic("Los colores", "A1") == "colores|colors"
+        picked = bank.sample("B1", "comida", 10)
+        assert len({p for p, _, _ in picked}) == 10
+        assert all(p.startswith("B1 comida") and c == ("sí", "no") and a == "sí" for p, c, a in picked)
+        # без темы — весь уровень
+        assert all(p.startswith("A1") for p, _, _ in bank.sample("A1", None, 50))
+
+        chain = BankChain(bank, compile_bank(FALLBACK_BANK))
+        assert chain.match_topic("A1 - artículos", "A1") is not None
+        art = chain.sample("A1", chain.match_topic("A1 - artículos", "A1"), 2)
+        assert art and not art[0][0].startswith("A1 ")  # из встроенного банка
+        assert chain.sample("A2", None, 1)  # уровень есть только во встроенном
+    finally:
+        bank.close()
@@ -0,0 +1,40 @@
+from http import HTTPStatus
+
+from core.metrics import HTTP_DB_QUERIES, HTTP_LATENCY, Registry
+
+
+def test_registry_renders_prometheus_text():
+    reg = Registry()
+    c = reg.counter("jobs_total", "Jobs", ("queue",))
+    h = reg.histogram("job_seconds", "Job time", ("queue",), buckets=(0.1, 1.0))
+    c.inc(queue="comic")
+    c.inc(2, queue="comic")
+    for v in (0.05, 0.5, 3.0):
+        h.observe(v, queue='a"b')
+
+    text = reg.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{queue="comic"} 3' in text
+    # корзины накопительные, метки экранированы
+    assert 'job_seconds_bucket{queue="a\\"b",le="0.1"} 1' in text
+    assert 'job_seconds_bucket{queue="a\\"b",le="1"} 2' in text
+    assert 'job_seconds_bucket{queue="a\\"b",le="+Inf"} 3' in text
+    assert 'job_seconds_count{queue="a\\"b"} 3' in text
+    assert reg.counter("jobs_total", "dup") is c  # повторная регистрация возвращает ту же метрику
+
+
+def test_http_latency_and_db_queries_per_route(client, as_admin):
+    route = "/api/themes/{theme_id}"
+    before = HTTP_LATENCY.count(method="GET", route=route, status="404")
+    queries_before = HTTP_DB_QUERIES.sum(route=route)
+
+    r = client.get("/api/themes/999999", headers=as_admin())
+    assert r.status_code == HTTPStatus.NOT_FOUND
+
+    # метка — шаблон маршрута, а не конкретный путь
+    assert HTTP_LATENCY.count(method="GET", route=route, status="404") == before + 1
+    assert HTTP_DB_QUERIES.sum(route=route) > queries_before
+
+    text = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/themes/{theme_id}",status="404"}' in text
+    assert "db_query_duration_seconds_bucket" in text
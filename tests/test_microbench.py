@@ -0,0 +1,115 @@
+# tests/test_microbench.py
+"""
+Микробенчмарки горячего пути генерации и проверки панели.
+
+С установленным pytest-benchmark — полноценные замеры и сравнение прогонов:
+    pytest tests/test_microbench.py --benchmark-autosave
+    pytest tests/test_microbench.py --benchmark-compare --benchmark-compare-fail=mean:15%
+Без плагина работает упрощённая фикстура benchmark ниже: короткий прогон
+(функции выполняются, результат проверяется), статистика — в benchmark.stats.
+"""
+import importlib.util
+import json
+import time
+
+import pytest
+
+import services.llm.ollama_client as oc
+from services.generation.exercise_panel import _fallback_generate
+from services.panel_grading import norm_answer
+
+VERBS = ("hablar", "comer", "vivir", "ser", "estar", "tener", "ir", "hacer", "poder", "decir")
+FORMS = ("hablo", "como", "vivo", "soy", "estoy", "tengo", "voy", "hago", "puedo", "digo")
+
+
+# ---------- запасная фикстура без pytest-benchmark ----------
+class _FallbackBenchmark:
+    """Подмножество API pytest-benchmark: benchmark(fn, *args, **kwargs) → результат fn."""
+
+    def __init__(self, min_rounds: int = 5, max_time: float = 0.05):
+        self.min_rounds = min_rounds
+        self.max_time = max_time
+        self.stats = {}
+
+    def _record(self, timings):
+        timings.sort()
+        self.stats = {"rounds": len(timings), "min": timings[0], "median": timings[len(timings) // 2],
+                      "mean": sum(timings) / len(timings)}
+
+    def __call__(self, fn, *args, **kwargs):
+        timings, result = [], None
+        deadline = time.perf_counter() + self.max_time
+        while len(timings) < self.min_rounds or time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            timings.append(time.perf_counter() - t0)
+        self._record(timings)
+        return result
+
+
+if importlib.util.find_spec("pytest_benchmark") is None:
+    @pytest.fixture
+    def benchmark():
+        return _FallbackBenchmark()
+
+
+# ---------- данные ----------
+def _items(n: int):
+    return [
+        {"prompt": f"[{i}] Yo ___ ({VERBS[i % 10]}) todos los días.",
+         "choices": [FORMS[(i + j) % 10] for j in range(4)],
+         "answer": FORMS[i % 10]}
+        for i in range(n)
+    ]
+
+
+GOOD = json.dumps(_items(5), ensure_ascii=False)
+FENCED = f"```json\n{GOOD}\n```"
+TRUNCATED = GOOD[: len(GOOD) * 2 // 3]
+LARGE = json.dumps(_items(100), ensure_ascii=False)
+WRAPPED = {"items": _items(100)}
+ANSWERS = ["Está", "  estás ", "MAÑANA", "comió", "había", "corrí", "es", "la", "hablé", "ser"] * 10
+
+
+# ---------- разбор ответа ----------
+def test_strip_code_fences(benchmark):
+    assert benchmark(oc._strip_code_fences, FENCED) == GOOD
+
+
+@pytest.mark.parametrize("text,expected,problem", [
+    (GOOD, 5, None),
+    (FENCED, 5, None),
+    (TRUNCATED, 3, "truncated_salvaged"),
+    (LARGE, 100, None),
+], ids=["good", "fenced", "truncated", "large-100"])
+def test_parse_exercise_text(benchmark, text, expected, problem):
+    parsed, reason = benchmark(oc._parse_exercise_text, text)
+    assert len(parsed) == expected and reason == problem
+
+
+def test_salvage_array_large_truncated(benchmark):
+    text = LARGE[: len(LARGE) - 40]
+    assert len(benchmark(oc._salvage_array, text)) == 99
+
+
+@pytest.mark.parametrize("parsed", [_items(100), WRAPPED], ids=["list", "wrapped"])
+def test_coerce_to_list(benchmark, parsed):
+    assert len(benchmark(oc._coerce_to_list, parsed)) == 100
+
+
+def test_clean_and_validate_100(benchmark):
+    items = _items(100)
+    cleaned = benchmark(oc._clean_and_validate, items, 100)
+    assert len(cleaned) == 100
+    assert all(it["answer"] in it["choices"] and len(it["choices"]) == 4 for it in cleaned)
+
+
+# ---------- проверка и заглушки ----------
+def test_norm_answer(benchmark):
+    out = benchmark(lambda: [norm_answer(a) for a in ANSWERS])
+    assert out[:3] == ["esta", "estas", "manana"]
+
+
+def test_fallback_generate(benchmark):
+    items = benchmark(_fallback_generate, "Presente de indicativo", 15, "A1")
+    assert 0 < len(items) <= 15 and all(it.answer in it.choices for it in items)
@@ -0,0 +1,87 @@
+from services.generation.near_dup import NearDupIndex, hamming, simhash64
+from services.llm.ollama_client import _clean_and_validate
+
+
+def _item(prompt):
+    return {"prompt": prompt, "choices": ["soy", "eres", "es", "somos"], "answer": "soy"}
+
+
+def test_simhash_close_for_small_edits():
+    a = simhash64("Yo ___ estudiante de medicina en Madrid.")
+    assert hamming(a, simhash64("yo ___ ESTUDIANTE de medicina en madrid")) == 0
+    assert hamming(a, simhash64("Nosotros ___ en la playa todos los veranos.")) > 3
+
+
+def test_index_rejects_near_duplicates_and_persists(tmp_path):
+    path = str(tmp_path / "near_dup.json")
+    idx = NearDupIndex(max_distance=3, max_per_key=2, path=path, flush_sec=3600)
+    key = idx.make_key("A1 - ser/estar", "A1")
+    assert idx.add(key, ["Yo ___ estudiante.", "yo ___ estudiante"]) == 1  # почти-дубль не записан
+    assert idx.seen(key, "Yo ___ estudiante!")
+    assert idx.add(("otra", "A1"), ["Yo ___ estudiante."]) == 1  # другой ключ — своя история
+
+    # вытеснение старых при переполнении
+    assert idx.add(key, ["Ella ___ en casa ahora mismo.", "Mañana vamos ___ cine con mis amigos."]) == 2
+    assert not idx.seen(key, "Yo ___ estudiante.")
+
+    idx.save(path)
+    restored = NearDupIndex(max_distance=3, path=path)
+    assert restored.seen(key, "Mañana vamos ___ cine con mis amigos")
+    assert len(restored) == len(idx)
+
+
+def test_clean_and_validate_skips_near_duplicates(monkeypatch):
+    import services.llm.ollama_client as oc
+    idx = NearDupIndex(path="")
+    monkeypatch.setattr(oc, "near_dup_index", idx)
+    key = idx.make_key("Ser", "A1")
+
+    first = _clean_and_validate([_item("Yo ___ estudiante."), _item("Tú ___ alto."), _item("yo ___ estudiante")], 2, key)
+    assert [it["prompt"] for it in first] == ["Yo ___ estudiante.", "Tú ___ alto."]  # почти-дубль внутри ответа
+    # очистка индекс не пишет — только принятая панель
+    assert len(idx) == 0
+    oc.remember_exercises("Ser", "A1", first)
+    assert len(idx) == 2
+    # повторная генерация: почти те же фразы отбрасываются, место получает новая
+    second = _clean_and_validate(
+        [_item("Yo ___ estudiante!"), _item("Tú ___ alto"), _item("Ella ___ médica en el hospital.")], 2, key
+    )
+    assert [it["prompt"] for it in second] == ["Ella ___ médica en el hospital."]
+
+
+def test_saturated_topic_skips_top_up_and_escalation(monkeypatch):
+    """Все ответы — уже выданные фразы: один вызов Ollama и фолбэк, без добора и сильной модели."""
+    import json
+    import services.llm.ollama_client as oc
+    from services.llm.token_budget import TokenBudget
+
+    idx = NearDupIndex(path="")
+    oc_key = idx.make_key("Ser", "A1")
+    idx.add(oc_key, ["Yo ___ estudiante.", "Tú ___ alto."])
+    calls = []
+
+    class _Resp:
+        status_code = 200
+        text = ""
+
+        def json(self):
+            body = [_item("Yo ___ estudiante!"), _item("tú ___ alto")]
+            return {"response": json.dumps(body, ensure_ascii=False), "eval_count": 10, "done_reason": "stop"}
+
+    def _post(payload, timeout, stream=False):
+        calls.append(payload["model"])
+        return _Resp()
+
+    monkeypatch.setattr(oc, "near_dup_index", idx)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", True)
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", False)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 1)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_FAST", "small")
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "big")
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+
+    assert oc.generate_exercises("Ser", 2, "A1") is None
+    assert calls == ["small"]
+    assert len(idx) == 2
@@ -0,0 +1,426 @@
+import json
+import time
+
+import services.llm.ollama_client as oc
+from services.llm.token_budget import TokenBudget
+
+
+class _FakeStream:
+    """Ответ requests с NDJSON-потоком Ollama; запоминает, сколько строк прочитано."""
+
+    def __init__(self, pieces, status_code=200):
+        self.status_code = status_code
+        self.text = ""
+        self.read = 0
+        self.closed = False
+        self._lines = [json.dumps({"response": p, "done": False}) for p in pieces]
+        self._lines.append(json.dumps({"response": "", "done": True, "eval_count": len(pieces), "done_reason": "stop"}))
+
+    def iter_lines(self):
+        for line in self._lines:
+            self.read += 1
+            yield line.encode()
+
+    def close(self):
+        self.closed = True
+
+
+class _DripStream(_FakeStream):
+    """Поток, который не кончается: по фрагменту раз в delay секунд."""
+
+    def __init__(self, delay):
+        super().__init__([])
+        self.delay = delay
+
+    def iter_lines(self):
+        yield json.dumps({"response": "[", "done": False}).encode()
+        while not self.closed and self.read < 500:  # без общего срока тест не зависнет, а упадёт
+            time.sleep(self.delay)
+            self.read += 1
+            yield json.dumps({"response": '{"prompt": "x"}, ', "done": False}).encode()
+
+
+def test_stream_total_deadline_stops_slow_drip(monkeypatch):
+    fake = _DripStream(0.02)
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 0)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "")
+    monkeypatch.setattr(oc, "REQUEST_TIMEOUT", 0.2)
+    monkeypatch.setattr(oc, "_post_ollama", lambda payload, timeout, stream=False: fake)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+    stats = oc.RejectionStats()
+    monkeypatch.setattr(oc, "rejections", stats)
+
+    t0 = time.monotonic()
+    assert oc.generate_exercises("ser", 1, "A1") is None
+    assert time.monotonic() - t0 < 1.0
+    assert fake.closed and fake.read < 30
+    assert stats.snapshot()["panel"]["timeout"] == 1
+
+
+def test_json_close_tracker_handles_strings():
+    t = oc._JsonCloseTracker()
+    assert t.feed('  [{"prompt": "a ] b \\" }", ') == -1
+    assert t.feed('"choices": ["x"]}') == -1
+    assert t.feed(']  trailing') == 0
+
+
+def test_stream_stops_when_array_closes(monkeypatch):
+    item = {"prompt": "Yo ___ estudiante.", "choices": ["soy", "es", "eres", "somos"], "answer": "soy"}
+    body = json.dumps([item], ensure_ascii=False)
+    pieces = [body[i:i + 5] for i in range(0, len(body), 5)] + ["\n\n", "garbage"] * 50
+    fake = _FakeStream(pieces)
+    sent = {}
+
+    def _post(payload, timeout, stream=False):
+        sent.update(payload)
+        return fake
+
+    budget = TokenBudget(min_samples=1)
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", budget)
+
+    items = oc.generate_exercises("ser", 1, "A1")
+    assert items and items[0]["answer"] == "soy"
+    assert fake.closed and fake.read < len(pieces)  # генерация оборвана на закрытии массива
+    assert sent["options"]["num_predict"] == max(oc.TOKENS_PANEL, oc.TOKENS_PER_ITEM)  # холодный старт
+
+    # после замера бюджет следует за фактическим размером ответа
+    oc.generate_exercises("ser", 1, "A1")
+    assert sent["options"]["num_predict"] < 100
+
+
+def test_token_budget_percentile_and_truncation():
+    b = TokenBudget(min_samples=3, percentile=95, margin=0.1, extra=0, floor=1)
+    key = ("panel", "A1", 1)
+    assert b.num_predict(key, default=800) == 800
+    for n in (100, 110, 120):
+        b.record(key, n)
+    assert 120 <= b.num_predict(key, default=800) <= 135
+    b.record(key, 200, truncated=True)  # обрезанный ответ тянет бюджет вверх
+    assert b.num_predict(key, default=800) > 250
+    assert b.num_predict(key, default=800, cap=240) == 240
+
+
+def test_compiled_validator_reasons():
+    from services.llm.output_schema import exercise_array_schema, compile_schema, validate_exercise_item
+
+    ok = {"prompt": "Yo ___ alto.", "choices": ["soy", "es"], "answer": "soy"}
+    assert validate_exercise_item(ok) is None
+    assert validate_exercise_item({**ok, "prompt": "  "}) == "$.prompt:minLength"
+    # answer чинится при очистке — проверка его не требует
+    assert validate_exercise_item({"prompt": "x", "choices": ["a", "b"]}) is None
+    assert validate_exercise_item({"choices": ["a", "b"]}) == "$.prompt:required"
+    assert validate_exercise_item({**ok, "choices": "soy"}) == "$.choices:type"
+    assert validate_exercise_item([ok]) == "$:type"
+    arr = compile_schema(exercise_array_schema(2))
+    assert arr([ok]) == "$:minItems"
+
+
+def test_schema_sent_and_bad_items_counted(monkeypatch):
+    from services.llm.output_schema import RejectionStats
+
+    good = {"prompt": "Ella ___ médica.", "choices": ["es", "está", "son", "soy"], "answer": "es"}
+    bad = {"prompt": "Sin variantes", "choices": "a b c d", "answer": "a"}
+    fake = _FakeStream([json.dumps([good, bad, 42], ensure_ascii=False)])
+    sent = {}
+
+    def _post(payload, timeout, stream=False):
+        sent.update(payload)
+        return fake
+
+    stats = RejectionStats()
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "JSON_SCHEMA", True)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 0)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+    monkeypatch.setattr(oc, "rejections", stats)
+
+    items = oc.generate_exercises("ser", 3, "A1")
+    assert [it["prompt"] for it in items] == ["Ella ___ médica."]
+    assert sent["format"]["type"] == "array" and sent["format"]["minItems"] == 3
+    assert stats.snapshot() == {"panel": {"$.choices:type": 1, "$:type": 1}}
+
+
+def test_salvage_truncated_array_and_top_up(monkeypatch):
+    def _ex(i):
+        return {"prompt": f"Frase número {i} con ___ distinto {i * 7}.", "choices": ["a", "b", "c", "d"], "answer": "a"}
+
+    full = json.dumps([_ex(i) for i in range(1, 4)], ensure_ascii=False)
+    cut = full[: full.rindex("{") + 12]  # третий объект оборван
+    assert [it["prompt"] for it in oc._salvage_array(cut)] == [_ex(1)["prompt"], _ex(2)["prompt"]]
+    assert oc._salvage_array("nada") == []
+
+    calls = []
+
+    def _post(payload, timeout, stream=False):
+        calls.append(payload)
+        if len(calls) == 1:
+            return _FakeStream([cut])
+        return _FakeStream([json.dumps([_ex(3)], ensure_ascii=False)])
+
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 1)
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+
+    items = oc.generate_exercises("ser", 3, "A1")
+    assert [it["prompt"] for it in items] == [_ex(i)["prompt"] for i in (1, 2, 3)]
+    assert len(calls) == 2
+    assert calls[1]["format"]["minItems"] == 1  # добор только недостающего
+    assert _ex(1)["prompt"] in calls[1]["prompt"]
+
+
+def test_model_warmer_pings_only_with_recent_traffic():
+    from services.llm.warmup import ModelWarmer, parse_duration
+
+    class _Resp:
+        def __init__(self, status=200, body=None):
+            self.status_code = status
+            self._body = body or {}
+
+        def json(self):
+            return self._body
+
+    class _Http:
+        def __init__(self):
+            self.posts = []
+
+        def post(self, url, json, timeout):
+            self.posts.append(json)
+            return _Resp()
+
+        def get(self, url, timeout):
+            return _Resp(body={"models": [{"name": "m1", "expires_at": "2030-01-01T00:00:00Z"}]})
+
+    assert parse_duration("5m") == 300 and parse_duration("1h") == 3600 and parse_duration("45") == 45
+    # составные длительности Go, которые принимает Ollama
+    assert parse_duration("1h30m") == 5400 and parse_duration("1m30.5s") == 90.5 and parse_duration("-1") == -1
+    assert ModelWarmer("http://ollama", ["m1"], "soon", http=None).keep_alive == "30m"  # битое значение не роняет старт
+
+    http = _Http()
+    w = ModelWarmer("http://ollama", ["m1"], "5m", traffic_window=3600, tick=10, http=http)
+    assert w.due(now=1000.0) == []          # трафика не было — модель можно выгрузить
+    w.note_use("m1", now=1000.0)
+    assert w.due(now=1100.0) == []          # модель недавно использовалась
+    assert w.due(now=1000.0 + w.ping_interval()) == ["m1"]
+    assert w.due(now=1000.0 + 3601) == []   # трафик ушёл из окна
+
+    assert w.ping("m1")
+    assert http.posts[-1] == {"model": "m1", "prompt": "", "keep_alive": "5m", "stream": False}
+    state = w.state()
+    assert state["models"]["m1"]["loaded"] is True and state["ollama_reachable"]
+
+
+def test_static_system_prompt_and_prompt_eval_recorded(monkeypatch):
+    from services.llm.prompts import PromptEvalStats
+
+    sent = []
+
+    class _Resp:
+        status_code = 200
+        text = ""
+
+        def json(self):
+            item = {"prompt": f"Frase {len(sent)} ___.", "choices": ["a", "b", "c", "d"], "answer": "a"}
+            return {"response": json.dumps([item], ensure_ascii=False), "eval_count": 40,
+                    "prompt_eval_count": 12, "prompt_eval_duration": 3_000_000, "done_reason": "stop"}
+
+    def _post(payload, timeout, stream=False):
+        sent.append(payload)
+        return _Resp()
+
+    stats = PromptEvalStats()
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", False)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 0)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+    monkeypatch.setattr(oc, "prompt_stats", stats)
+
+    oc.generate_exercises("Familia", 1, "a2", "miembros de la familia")
+    oc.generate_exercises("Viajes", 1, "A2")
+
+    # профиль уровня целиком в system и одинаков между запросами; тема — только в prompt
+    assert sent[0]["system"] == sent[1]["system"]
+    assert "pretérito indefinido" in sent[0]["system"] and "Familia" not in sent[0]["system"]
+    assert "Familia" in sent[0]["prompt"] and "Viajes" in sent[1]["prompt"]
+    panel = stats.stats()["panel"]
+    assert panel["prompt_eval_count"]["n"] == 2
+    assert panel["prompt_eval_ms"]["p50"] == 3.0
+
+
+def test_routing_escalates_failures_and_hard_levels(monkeypatch):
+    calls = []
+
+    def _post(payload, timeout, stream=False):
+        calls.append(payload["model"])
+        if payload["model"] == "small":
+            # малая модель отдаёт один годный вопрос из двух
+            bad = {"prompt": "", "choices": [], "answer": ""}
+            return _FakeStream([json.dumps([{"prompt": "Yo ___ alto.", "choices": ["soy", "es", "eres", "son"],
+                                             "answer": "soy"}, bad], ensure_ascii=False)])
+        return _FakeStream([json.dumps([{"prompt": "Tú ___ alta.", "choices": ["eres", "es", "soy", "son"],
+                                         "answer": "eres"}], ensure_ascii=False)])
+
+    stats = oc.RejectionStats()
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 0)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_FAST", "small")
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "big")
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+    monkeypatch.setattr(oc, "routing", stats)
+
+    assert oc.route_models("A1") == ["small", "big"] and oc.route_models("b2") == ["big"]
+
+    items = oc.generate_exercises("ser", 2, "A1")
+    assert calls == ["small", "big"]  # у сильной модели просим только недостающий остаток
+    assert [it["answer"] for it in items] == ["soy", "eres"]
+    assert stats.snapshot()["panel"]["escalated"] == 1
+
+    calls.clear()
+    oc.generate_exercises("ser", 1, "B1")
+    assert calls == ["big"]
+
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "")
+    assert oc.route_models("B2") == ["small"]
+
+
+def test_missing_answer_repaired_and_empty_result_not_success(monkeypatch):
+    from core.metrics import OLLAMA_CALL
+
+    no_answer = {"prompt": "Nosotros ___ amigos.", "choices": ["somos", "estamos", "sois", "son"]}
+    responses = [[no_answer], [no_answer]]
+
+    def _post(payload, timeout, stream=False):
+        return _FakeStream([json.dumps(responses.pop(0), ensure_ascii=False)])
+
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "JSON_SCHEMA", False)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 0)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_FAST", "m-repair")
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "")
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+
+    # без схемы в запросе элемент без answer не теряется: ответ — первый вариант
+    items = oc.generate_exercises("ser", 1, "A1")
+    assert items[0]["prompt"] == no_answer["prompt"] and items[0]["answer"] in no_answer["choices"]
+
+    # все элементы отброшены при очистке — исход вызова не success
+    monkeypatch.setattr(oc, "_clean_and_validate", lambda *a, **kw: [])
+    before = OLLAMA_CALL.count(kind="panel", model="m-repair", outcome="rejected")
+    assert oc.generate_exercises("ser", 1, "A1") is None
+    assert OLLAMA_CALL.count(kind="panel", model="m-repair", outcome="rejected") == before + 1
+
+
+def test_deadline_bounds_top_up_rounds(monkeypatch):
+    calls = []
+
+    def _post(payload, timeout, stream=False):
+        calls.append(timeout)
+        time.sleep(0.12)
+        item = {"prompt": f"Frase {len(calls)} ___.", "choices": ["a", "b", "c", "d"], "answer": "a"}
+        return _FakeStream([json.dumps([item], ensure_ascii=False)])
+
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "TOP_UP_ROUNDS", 3)
+    monkeypatch.setattr(oc, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_FAST", "small")
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "big")
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+
+    # на 3 элемента нужно 3 раунда: второй получает лишь остаток срока и обрывается,
+    # после срока ни добора, ни эскалации на сильную модель
+    items = oc.generate_exercises("ser", 3, "A1", deadline=time.monotonic() + 0.2)
+    assert len(items) == 1
+    assert len(calls) == 2 and calls[0] <= 0.2 and calls[1] < 0.1
+
+
+def test_comic_escalation_shares_one_deadline(monkeypatch):
+    calls = []
+
+    def _post(payload, timeout, stream=False):
+        # медленная модель: отвечает за 0.4с мусором, с меньшим таймаутом — ReadTimeout
+        calls.append((payload["model"], timeout))
+        time.sleep(min(timeout, 0.4))
+        if timeout < 0.4:
+            raise oc.requests.ReadTimeout("slow model")
+        return _FakeStream(["Claro, aquí tienes el cómic"])
+
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_FAST", "small")
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "big")
+    monkeypatch.setattr(oc, "MIN_ESCALATION_TIME", 0.0)
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+
+    # сильная модель получает лишь остаток общего срока, а не свой полный таймаут
+    t0 = time.monotonic()
+    assert oc.generate_comic_task("ser", "A1", False, deadline=t0 + 0.5) is None
+    assert time.monotonic() - t0 < 0.7
+    assert [m for m, _ in calls] == ["small", "big"] and calls[1][1] < 0.15
+
+    # остатка не хватит сильной модели — эскалацию не начинаем
+    calls.clear()
+    monkeypatch.setattr(oc, "MIN_ESCALATION_TIME", 0.2)
+    assert oc.generate_comic_task("ser", "A1", False, deadline=time.monotonic() + 0.5) is None
+    assert [m for m, _ in calls] == ["small"]
+
+
+def test_comic_object_wrapped_in_prose_is_accepted(monkeypatch):
+    calls = []
+    comic = {"difficulty": "medium", "explanation": "Ser — постоянное, estar — состояние.", "vocabulary": ["ser", "estar"]}
+
+    def _post(payload, timeout, stream=False):
+        calls.append(payload["model"])
+        return _FakeStream([f"¡Claro! Aquí tienes:\n{json.dumps(comic, ensure_ascii=False)}\nEspero que te sirva."])
+
+    monkeypatch.setattr(oc, "USE_OLLAMA", True)
+    monkeypatch.setattr(oc, "STREAM", True)
+    monkeypatch.setattr(oc, "JSON_SCHEMA", False)
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_FAST", "small")
+    monkeypatch.setattr(oc, "OLLAMA_MODEL_STRONG", "big")
+    monkeypatch.setattr(oc, "_post_ollama", _post)
+    monkeypatch.setattr(oc, "token_budget", TokenBudget())
+
+    assert oc.generate_comic_task("ser", "A1", False) == comic
+    assert calls == ["small"]  # без эскалации
+
+
+def test_build_panel_soft_timeout_returns_without_waiting(monkeypatch):
+    import services.generation.exercise_panel as ep
+
+    seen = {}
+
+    def _slow(theme_name, count, level, deadline):
+        seen["deadline"] = deadline
+        time.sleep(1.0)
+        return None
+
+    monkeypatch.setattr(ep, "ollama_generate", _slow)
+    monkeypatch.setattr(ep, "SOFT_TIMEOUT", 0.1)
+    monkeypatch.delenv("PANEL_FORCE_FALLBACK", raising=False)
+
+    t0 = time.monotonic()
+    panel = ep.build_panel("ser/estar", 1, "A1")
+    assert time.monotonic() - t0 < 0.5  # фолбэк сразу, не дожидаясь Ollama
+    assert panel and seen["deadline"] <= t0 + 0.2
@@ -97,3 +97,122 @@ def test_panel_forbidden_other_user(signup, as_admin, as_user, client):
         json={"user_id": owner_id, "theme_id": theme_id, "count": 15, "is_bonus": False},
     )
     assert r.status_code == HTTPStatus.FORBIDDEN, r.text
+
+def test_panel_submit_uses_compact_grading(signup, as_admin, as_user, client, session, monkeypatch):
+    """POST /api/panel/{id}/submit: проверка по ExerciseSet.grading и fallback на payload_json."""
+    import json
+    from models.exercise import Exercise
+    from models.exercise_set import ExerciseSet
+    from services.crud.exercise import get_exercise_payload
+    from services.panel_grading import decode_grading, norm_answer
+
+    monkeypatch.setenv("PANEL_FORCE_FALLBACK", "1")
+    user_id = signup("panel_submit@example.com", "password123")
+    theme_id = _create_theme(client, as_admin(), name="A1 - ser/estar", level="A1")
+    user_h = as_user(user_id)
+
+    r = client.post(f"/api/panel/generate?theme_id={theme_id}&level=A1", headers=user_h)
+    assert r.status_code == HTTPStatus.OK, r.text
+    ex_id = r.json()["exercise_id"]
+
+    ex = session.get(Exercise, ex_id)
+    assert ex.payload_json is None and ex.set_id is not None
+    ids, golds = decode_grading(session.get(ExerciseSet, ex.set_id).grading)
+    gold = {q["id"]: q["answer"] for q in get_exercise_payload(ex_id, session)["questions"]}
+    assert ids == list(gold) and golds == [norm_answer(a) for a in gold.values()]
+
+    # регистр и диакритика не важны
+    answers = {qid: a.upper().replace("á", "a") for qid, a in gold.items()}
+    r = client.post(f"/api/panel/{ex_id}/submit", headers=user_h, json={"answers": answers})
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert r.json()["score"] == 100 and r.json()["total"] == len(gold)
+
+    # старое упражнение без набора (set_id IS NULL) → проверка по payload_json
+    ex.set_id = None
+    ex.payload_json = json.dumps({"difficulty": "medium", "questions": [
+        {"id": qid, "prompt": "?", "choices": [a], "answer": a} for qid, a in gold.items()
+    ]}, ensure_ascii=False)
+    session.add(ex)
+    session.commit()
+    r = client.post(f"/api/panel/{ex_id}/submit", headers=user_h, json={"answers": {}})
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert r.json()["correct"] == 0 and r.json()["total"] == len(gold)
+
+    # чужое упражнение
+    other = signup("panel_submit_other@example.com", "password123")
+    r = client.post(f"/api/panel/{ex_id}/submit", headers=as_user(other), json={"answers": answers})
+    assert r.status_code == HTTPStatus.NOT_FOUND
+
+def test_panel_submit_batch(signup, as_admin, as_user, client, session, monkeypatch):
+    """POST /api/panel/submit-batch: одна транзакция, суммарное начисление, режимы лога."""
+    from sqlmodel import select
+    from models.transaction_log import TransactionLog
+    from services.crud.exercise import get_exercise_payload
+    from routers import panel as panel_router
+
+    monkeypatch.setenv("PANEL_FORCE_FALLBACK", "1")
+    user_id = signup("panel_batch@example.com", "password123")
+    admin_h = as_admin()
+    t1 = _create_theme(client, admin_h, name="A1 - ser/estar", level="A1")
+    t2 = _create_theme(client, admin_h, name="A1 - artículos", level="A1")
+    user_h = as_user(user_id)
+
+    def _make(theme_id):
+        r = client.post(f"/api/panel/generate?theme_id={theme_id}&level=A1&difficulty=hard", headers=user_h)
+        assert r.status_code == HTTPStatus.OK, r.text
+        ex_id = r.json()["exercise_id"]
+        qs = get_exercise_payload(ex_id, session)["questions"]
+        return ex_id, {q["id"]: q["answer"] for q in qs}
+
+    def _logs():
+        return session.exec(select(TransactionLog).where(TransactionLog.user_id == user_id)).all()
+
+    panels = [_make(t1), _make(t1), _make(t2)]
+    items = [{"exercise_id": ex_id, "answers": gold} for ex_id, gold in panels[:2]]
+    items.append({"exercise_id": panels[2][0], "answers": {}})
+
+    before = client.get(f"/api/wallet/{user_id}", headers=user_h).json()["balance"]
+    logs_before = len(_logs())
+    r = client.post("/api/panel/submit-batch", headers=user_h, json={"items": items})
+    assert r.status_code == HTTPStatus.OK, r.text
+    body = r.json()
+    assert [x["score"] for x in body["results"]] == [100, 100, 0]
+    assert body["reward"] == 6  # hard = 3 за каждую идеальную панель
+    after = client.get(f"/api/wallet/{user_id}", headers=user_h).json()["balance"]
+    assert after == before + 6
+    assert len(_logs()) == logs_before + 1
+
+    # по записи на упражнение
+    monkeypatch.setattr(panel_router, "BATCH_LOG_MODE", "exercise")
+    r = client.post("/api/panel/submit-batch", headers=user_h, json={"items": items})
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert len(_logs()) == logs_before + 3
+
+    # чужое или несуществующее упражнение → 404, ничего не начислено
+    r = client.post("/api/panel/submit-batch", headers=user_h,
+                    json={"items": items[:1] + [{"exercise_id": 999999, "answers": {}}]})
+    assert r.status_code == HTTPStatus.NOT_FOUND
+    assert client.get(f"/api/wallet/{user_id}", headers=user_h).json()["balance"] == after + 6
+
+    r = client.post("/api/panel/submit-batch", headers=user_h, json={"items": items[:1] * 2})
+    assert r.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_exercise_sets_are_deduplicated(session):
+    """Одинаковые наборы вопросов хранятся один раз; все кодеки читаются обратно."""
+    from sqlmodel import select
+    from models.exercise_set import ExerciseSet
+    from services.crud.exercise_set import get_or_create_set_no_commit
+    from services.exercise_codec import decode_questions, encode_questions
+
+    qs = [{"id": "q1", "prompt": "Yo ___ estudiante.", "choices": ["soy", "estoy"], "answer": "soy"}]
+    a = get_or_create_set_no_commit(qs, session)
+    b = get_or_create_set_no_commit([dict(qs[0])], session)
+    assert a.id == b.id
+    assert len(session.exec(select(ExerciseSet)).all()) == 1
+
+    for codec in ("json", "zlib", "zstd"):
+        used, as_json, blob = encode_questions(qs * 20, codec)
+        assert decode_questions(used, as_json, blob) == qs * 20
+        if used != "json":
+            assert len(blob) < len(str(qs * 20))
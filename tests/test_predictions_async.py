@@ -75,7 +75,8 @@ def test_async_job_charges_and_publishes(
 
     job = r.json()
     assert job.get("status") in {"pending", "processing", "queued"}
-    assert published.get("queue")
+    # бонусная задача — в быструю полосу
+    assert published.get("queue") == "queue.comic.fast"
     assert "job_id" in (published.get("msg") or {})
 
     after = client.get(
@@ -0,0 +1,61 @@
+import threading
+import time
+from http import HTTPStatus
+
+from core import profiler
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(2000))
+
+
+def test_profile_returns_collapsed_stacks():
+    stop = threading.Event()
+    t = threading.Thread(target=_busy_loop, args=(stop,), name="busy", daemon=True)
+    t.start()
+    try:
+        out = profiler.profile(0.3, interval_ms=5)
+    finally:
+        stop.set()
+        t.join()
+
+    lines = out.strip().splitlines()
+    assert lines
+    stack, n = lines[0].rsplit(" ", 1)
+    assert int(n) > 0
+    busy = [ln for ln in lines if ln.startswith("thread:busy;")]
+    assert busy and any("test_profiler.py:_busy_loop" in ln for ln in busy)
+    # сам поток профайлера в выборку не попадает
+    assert not any("profiler.py:sample_once" in ln for ln in lines)
+
+
+def test_one_profile_at_a_time(as_admin, client):
+    assert profiler._busy.acquire(blocking=False)
+    try:
+        r = client.get("/api/debug/profile", params={"seconds": 0.1}, headers=as_admin())
+        assert r.status_code == HTTPStatus.CONFLICT
+    finally:
+        profiler._busy.release()
+
+    r = client.get("/api/debug/profile", params={"seconds": 0.1, "include_idle": True}, headers=as_admin())
+    assert r.status_code == HTTPStatus.OK
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "thread:" in r.text
+
+
+def test_signal_handler_writes_file(tmp_path, monkeypatch):
+    import os
+    import signal
+
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        assert profiler.install_signal_handler(signal.SIGUSR1, seconds=0.2)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not list(tmp_path.glob("*.collapsed")):
+            time.sleep(0.05)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert list(tmp_path.glob("profile-*.collapsed"))
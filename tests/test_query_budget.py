@@ -0,0 +1,92 @@
+from http import HTTPStatus
+
+from core import query_audit
+from core.query_audit import QueryAudit, RouteReport
+
+
+def _create_theme(client, admin_h, name):
+    r = client.post("/api/themes/", headers=admin_h,
+                    json={"name": name, "level": "A1", "base_comic": "base.png", "bonus_comics": []})
+    assert r.status_code == HTTPStatus.CREATED, r.text
+    return r.json()["id"]
+
+
+def test_users_list_query_count_independent_of_table_size(signup, as_admin, client, query_counter):
+    """GET /api/users/: selectinload — число SQL не растёт с числом пользователей."""
+    signup("qb0@example.com", "password123")
+    with query_counter() as small:
+        assert client.get("/api/users/", headers=as_admin()).status_code == HTTPStatus.OK
+    for i in range(1, 6):
+        signup(f"qb{i}@example.com", "password123")
+    with query_counter() as big:
+        assert client.get("/api/users/", headers=as_admin()).status_code == HTTPStatus.OK
+    assert big.count == small.count
+    assert not big.repeated(2)
+
+
+def test_hot_paths_query_budget(signup, as_admin, as_user, client, query_counter):
+    """Бюджет SQL на горячих путях: регрессия (лишний lookup, N+1) ломает тест."""
+    user_id = signup("budget@example.com", "password123")
+    admin_h = as_admin()
+    theme_id = _create_theme(client, admin_h, "A1 - budget")
+    client.post("/api/wallet/admin_top_up", headers=admin_h, json={"user_id": user_id, "amount": 5, "reason": "init"})
+    user_h = as_user(user_id)
+
+    with query_counter() as q:
+        r = client.get(f"/api/recommendations/{user_id}", headers=user_h)
+    assert r.status_code == HTTPStatus.OK
+    assert q.count <= 4, q.statements
+
+    with query_counter() as q:
+        r = client.post("/api/predictions/", headers=user_h,
+                        json={"user_id": user_id, "theme_id": theme_id, "is_bonus": False})
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert q.count <= 10, q.statements
+    assert not q.repeated(), q.repeated()
+
+
+def test_audit_flags_repeated_statements_and_reports_routes(as_admin, client, monkeypatch):
+    audit = QueryAudit()
+    audit.record("SELECT 1")
+    for _ in range(4):
+        audit.record("SELECT theme.id FROM theme\n  WHERE theme.id = ?", 0.001)
+    assert audit.count == 5
+    assert audit.repeated() == [("SELECT theme.id FROM theme WHERE theme.id = ?", 4)]
+    assert audit.suspicious() and not audit.suspicious(max_queries=10, min_repeat=5)
+
+    rep = RouteReport()
+    rep.add("GET /api/x", audit)
+    rep.add("GET /api/y", QueryAudit())
+    monkeypatch.setattr(query_audit, "report", rep)
+
+    # dev-эндпоинт выключен, пока не включён аудит
+    assert client.get("/api/debug/queries", headers=as_admin()).status_code == HTTPStatus.NOT_FOUND
+    monkeypatch.setattr(query_audit, "QUERY_AUDIT", True)
+    rows = client.get("/api/debug/queries", headers=as_admin()).json()
+    assert rows[0]["route"] == "GET /api/x" and rows[0]["flagged"] == 1
+    assert rows[0]["repeated"][0]["max_repeats"] == 4
+
+
+def test_middleware_counts_queries_per_request(engine, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+
+    rep = RouteReport()
+    monkeypatch.setattr(query_audit, "QUERY_AUDIT", True)
+    monkeypatch.setattr(query_audit, "report", rep)
+    app = FastAPI()
+    query_audit.install(app)
+
+    @app.get("/items/{n}")
+    def items(n: int):
+        with engine.connect() as conn:
+            for i in range(n):  # классический N+1: один и тот же запрос в цикле
+                conn.execute(text("SELECT :i"), {"i": i})
+        return {"n": n}
+
+    r = TestClient(app).get("/items/4")
+    assert r.headers["X-Query-Count"] == "4"
+    row = rep.top()[0]
+    assert row["route"] == "GET /items/{n}" and row["flagged"] == 1
+    assert row["repeated"][0]["max_repeats"] == 4
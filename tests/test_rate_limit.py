@@ -0,0 +1,116 @@
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import SQLModel, create_engine
+
+import dependencies.rate_limit
+from models.rate_limit_bucket import RateLimitBucket
+from services.rate_limit import DbBackend, MemoryBackend, RateLimiter, parse_limits
+
+
+class _Clock:
+    def __init__(self, t=1000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def test_parse_limits_skips_broken_pairs():
+    limits = parse_limits("llm=60/10, llm.global=600,jobs=abc/1,bad")
+    assert limits == {"llm": (1.0, 10.0), "llm.global": (10.0, 600.0)}
+
+
+@pytest.fixture(params=["memory", "db"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    eng = create_engine(f"sqlite:///{tmp_path / 'rl.db'}")
+    SQLModel.metadata.create_all(eng, tables=[RateLimitBucket.__table__])
+    return DbBackend(eng)
+
+
+def test_bucket_drains_and_refills(backend):
+    clock = _Clock()
+    rl = RateLimiter(backend, limits={"llm": (1.0, 3.0)}, clock=clock)  # 60/мин, burst 3
+
+    decisions = [rl.check("llm", 7) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].headers()["Retry-After"] == "1"
+    # у другого пользователя свой бакет
+    assert rl.check("llm", 8).allowed
+
+    clock.t += 1.5
+    assert rl.check("llm", 7).allowed
+    assert not rl.check("llm", 7).allowed
+    # класс без лимита не проверяется
+    assert rl.check("jobs", 7) is None
+
+
+def test_global_bucket_denial_returns_user_token(backend):
+    clock = _Clock()
+    rl = RateLimiter(backend, limits={"llm": (1.0, 2.0), "llm.global": (0.1, 2.0)}, clock=clock)
+    assert rl.check("llm", 1).allowed
+    assert rl.check("llm", 2).allowed
+    denied = rl.check("llm", 1)
+    assert not denied.allowed
+    assert denied.limit == 2  # отказал общий бакет
+    # общий бакет пополнился — у пользователя 1 по-прежнему токен (возвращён при отказе)
+    clock.t += 10.0
+    assert rl.check("llm", 1).allowed
+
+
+def test_user_denial_does_not_spend_global_token(backend):
+    clock = _Clock()
+    rl = RateLimiter(backend, limits={"llm": (0.1, 1.0), "llm.global": (0.1, 2.0)}, clock=clock)
+    assert rl.check("llm", 1).allowed
+    denied = rl.check("llm", 1)
+    assert not denied.allowed
+    assert denied.limit == 1  # отказал бакет пользователя, общий не тронут
+    assert rl.check("llm", 2).remaining == 0  # в общем был ещё ровно один токен
+    assert not rl.check("llm", 3).allowed
+
+
+def test_db_backend_one_transaction_per_check(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'rl.db'}")
+    SQLModel.metadata.create_all(eng, tables=[RateLimitBucket.__table__])
+    begins = []
+    event.listen(eng, "begin", lambda conn: begins.append(1))
+    rl = RateLimiter(DbBackend(eng), limits={"llm": (1.0, 1.0), "llm.global": (0.01, 1.0)}, clock=_Clock())
+    assert rl.check("llm", 1).allowed
+    assert not rl.check("llm", 2).allowed  # отказ общего бакета — без отдельного возврата токена
+    assert len(begins) == 2
+
+
+def test_db_backend_fails_open_on_database_error(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'rl.db'}")  # таблицы нет — OperationalError
+    rl = RateLimiter(DbBackend(eng), limits={"llm": (1.0, 2.0), "llm.global": (1.0, 5.0)}, clock=_Clock())
+    decision = rl.check("llm", 1)
+    assert decision.allowed
+    assert decision.remaining == 2
+
+
+def test_endpoint_returns_429_with_headers(signup, as_admin, as_user, client, monkeypatch):
+    user_id = signup("ratelimit@example.com", "password123")
+    theme_id = client.post("/api/themes/", headers=as_admin(), json={
+        "name": "A1 - rl", "level": "A1", "base_comic": "base.png", "bonus_comics": []}).json()["id"]
+    user_h = as_user(user_id)
+    monkeypatch.setattr(dependencies.rate_limit, "rate_limiter",
+                        RateLimiter(MemoryBackend(), limits={"llm": (1 / 60, 2.0)}))
+
+    r = client.post(f"/api/panel/generate?theme_id={theme_id}", headers=user_h)
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert r.headers["X-RateLimit-Limit"] == "2"
+    assert r.headers["X-RateLimit-Remaining"] == "1"
+
+    # /predictions/panel — тот же класс "llm", общий бакет пользователя
+    r = client.post("/api/predictions/panel", headers=user_h, json={"user_id": user_id, "theme_id": theme_id})
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert r.headers["X-RateLimit-Remaining"] == "0"
+
+    r = client.post(f"/api/panel/generate?theme_id={theme_id}", headers=user_h)
+    assert r.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(r.headers["Retry-After"]) >= 1
+    assert r.headers["X-RateLimit-Remaining"] == "0"
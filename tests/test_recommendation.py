@@ -0,0 +1,66 @@
+from http import HTTPStatus
+
+from services.spaced_repetition import sm2_step, record_review_no_commit
+
+
+def test_sm2_step_intervals():
+    """SM-2: 1 → 6 → interval*ease при успехе, сброс при провале."""
+    reps, interval, ease = sm2_step(0, 0.0, 2.5, 5)
+    assert (reps, interval) == (1, 1.0)
+    reps, interval, ease = sm2_step(reps, interval, ease, 5)
+    assert (reps, interval) == (2, 6.0)
+    reps, interval, ease = sm2_step(reps, interval, ease, 4)
+    assert reps == 3 and interval > 6.0
+
+    reps, interval, ease_after_fail = sm2_step(reps, interval, ease, 1)
+    assert reps == 0 and interval < 1.0
+    assert ease_after_fail < ease
+
+
+def test_recommend_new_then_due(signup, as_admin, as_user, client, session, create_theme):
+    """GET /api/recommendations/{id}: сначала новые темы по порядку, затем просроченные повторения."""
+    user_id = signup("sr@example.com", "password123")
+    admin_h = as_admin()
+    t1 = create_theme(admin_h, "A1 - sr one")
+    t2 = create_theme(admin_h, "A1 - sr two")
+
+    user_h = as_user(user_id)
+    r = client.get(f"/api/recommendations/{user_id}", headers=user_h)
+    assert r.status_code == HTTPStatus.OK, r.text
+    body = r.json()
+    assert body["is_new"] is True
+    first = body["theme"]["id"]
+    assert first <= t1
+
+    # провал по теме t1 → короткий интервал, но новая t2 всё равно впереди
+    record_review_no_commit(user_id, t1, 1, session)
+    session.commit()
+    r = client.get(f"/api/recommendations/{user_id}", headers=user_h)
+    assert r.json()["theme"]["id"] == t2
+    assert r.json()["is_new"] is True
+
+    # все темы начаты → возвращается ближайшее повторение (t1, интервал 10 минут)
+    record_review_no_commit(user_id, t2, 5, session)
+    session.commit()
+    r = client.get(f"/api/recommendations/{user_id}", headers=user_h)
+    body = r.json()
+    assert body["is_new"] is False
+    assert body["theme"]["id"] == t1
+    assert body["repetitions"] == 0
+
+
+def test_lower_id_theme_stays_new_after_reviewing_higher_one(signup, as_admin, as_user, client, session, create_theme):
+    """Повторение темы 2 раньше темы 1 не прячет тему 1 из новых; GET ничего не пишет."""
+    user_id = signup("sr-order@example.com", "password123")
+    admin_h = as_admin()
+    t1 = create_theme(admin_h, "A1 - order one")
+    t2 = create_theme(admin_h, "A1 - order two")
+    record_review_no_commit(user_id, t2, 5, session)
+    session.commit()
+
+    user_h = as_user(user_id)
+    r = client.get(f"/api/recommendations/{user_id}", headers=user_h)
+    assert r.status_code == HTTPStatus.OK, r.text
+    assert r.json()["theme"]["id"] == t1
+    assert r.json()["is_new"] is True
+    assert client.get(f"/api/predictions/history/{user_id}", headers=user_h).json() == []
@@ -0,0 +1,74 @@
+from http import HTTPStatus
+from types import SimpleNamespace
+
+
+def _create_theme(client, admin_h, name, level="A1"):
+    r = client.post(
+        "/api/themes/",
+        headers=admin_h,
+        json={"name": name, "level": level, "base_comic": "base.png", "bonus_comics": []},
+    )
+    assert r.status_code == HTTPStatus.CREATED, r.text
+    return r.json()["id"]
+
+
+def test_themes_etag_and_not_modified(as_admin, client):
+    """GET /api/themes/: сильный ETag, 304 при совпадении If-None-Match."""
+    admin_h = as_admin()
+    theme_id = _create_theme(client, admin_h, "A2 - cache", level="A2")
+
+    r = client.get("/api/themes/")
+    assert r.status_code == HTTPStatus.OK
+    etag = r.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    assert any(t["id"] == theme_id for t in r.json())
+
+    r = client.get("/api/themes/", headers={"If-None-Match": etag})
+    assert r.status_code == HTTPStatus.NOT_MODIFIED
+    assert r.content == b""
+
+    r = client.get("/api/themes/level/A2")
+    assert theme_id in [t["id"] for t in r.json()]
+    assert client.get(f"/api/themes/{theme_id}").json()["name"] == "A2 - cache"
+
+
+def test_themes_cache_invalidated_on_write(as_admin, client, session):
+    """Создание/удаление темы меняет версию каталога и ETag; в steady state БД не читается."""
+    admin_h = as_admin()
+    etag_before = client.get("/api/themes/").headers["etag"]
+
+    theme_id = _create_theme(client, admin_h, "A1 - invalidation")
+    r = client.get("/api/themes/")
+    assert r.headers["etag"] != etag_before
+    assert any(t["id"] == theme_id for t in r.json())
+
+    # повторное чтение берётся из снимка: тема, удалённая в обход роутера, ещё видна
+    from models.theme import Theme
+    session.delete(session.get(Theme, theme_id))
+    session.commit()
+    assert any(t["id"] == theme_id for t in client.get("/api/themes/").json())
+
+    theme_id2 = _create_theme(client, admin_h, "A1 - invalidation 2")
+    r = client.delete(f"/api/themes/{theme_id2}", headers=admin_h)
+    assert r.status_code == HTTPStatus.OK, r.text
+    ids = [t["id"] for t in client.get("/api/themes/").json()]
+    assert theme_id not in ids and theme_id2 not in ids
+
+
+def test_theme_index_metadata_and_worker_lookup(as_admin, client, session):
+    """ThemeIndex: поиск по id/уровню/имени и предрасчитанные метаданные генерации."""
+    from services.theme_index import theme_index
+    from workers.worker_vocab import handle_job
+
+    admin_h = as_admin()
+    theme_id = _create_theme(client, admin_h, "A1 -  Ser/Estar ", level="A1")
+
+    entry = theme_index.get(theme_id, session)
+    assert entry.level_key == "A1"
+    assert entry.topic_key == "ser/estar"
+    assert entry.focus.startswith("A1")
+    assert theme_index.by_name("a1 - ser/estar", session) is entry
+    assert entry in theme_index.by_level("A1", session)
+
+    job = SimpleNamespace(theme_id=theme_id)
+    assert handle_job(job=job, session=session)["theme_name"] == entry.theme.name
@@ -0,0 +1,129 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import mq.publisher as publisher
+from core import tracing
+from workers.worker_base import _trace_queue_wait
+
+
+class _FakeChannel:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def queue_declare(self, **kw):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.sink.append(properties)
+
+
+class _FakeConnection:
+    sent = []
+
+    def __init__(self, params):
+        pass
+
+    def channel(self):
+        return _FakeChannel(self.sent)
+
+    def close(self):
+        pass
+
+
+def test_trace_crosses_publish_and_worker(monkeypatch):
+    exp = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "exporter", exp)
+    monkeypatch.setattr(publisher.pika, "BlockingConnection", _FakeConnection)
+    _FakeConnection.sent.clear()
+
+    with tracing.span("HTTP POST") as root:
+        publisher.publish_task("queue.comic", {"job_id": 1})
+    headers = _FakeConnection.sent[0].headers
+    assert tracing.extract(headers)[0] == root.trace_id
+    assert float(headers[tracing.ENQUEUED_AT]) > 0
+
+    # воркер: продолжение трейса по заголовкам сообщения + ожидание в очереди отдельным спаном
+    with tracing.span("job.queue.comic", parent=tracing.extract(headers)) as job:
+        _trace_queue_wait(job, headers)
+        with tracing.span("ollama.generate"):
+            pass
+
+    spans = {s["name"]: s for s in exp.spans(root.trace_id)}
+    assert set(spans) == {"HTTP POST", "mq.publish", "job.queue.comic", "queue.wait", "ollama.generate"}
+    assert spans["job.queue.comic"]["parent_id"] == spans["mq.publish"]["span_id"]
+    assert spans["ollama.generate"]["parent_id"] == spans["job.queue.comic"]["span_id"]
+    assert spans["queue.wait"]["duration_ms"] >= 0
+    assert job.attrs["queue_wait_ms"] == spans["queue.wait"]["duration_ms"]
+
+    summary = tracing.summarize(exp.spans())
+    assert summary[0]["root"] == "HTTP POST" and summary[0]["spans"] == 5
+
+
+@pytest.fixture
+def db_tracing(monkeypatch):
+    """SQL-спаны на время теста (по умолчанию TRACE_DB=0)."""
+    monkeypatch.setattr(tracing, "TRACE_DB", True)
+    tracing.install_db_tracing()
+    yield
+    event.remove(Engine, "before_cursor_execute", tracing._before_cursor_execute)
+    event.remove(Engine, "after_cursor_execute", tracing._after_cursor_execute)
+    event.remove(Engine, "handle_error", tracing._handle_error)
+    tracing._db_installed = False
+
+
+def test_http_request_continues_incoming_trace_with_db_spans(client, as_admin, monkeypatch, db_tracing):
+    exp = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "exporter", exp)
+    trace_id, parent = "ab" * 16, "cd" * 8
+
+    r = client.get("/api/themes/999999", headers={**as_admin(), "traceparent": f"00-{trace_id}-{parent}-01"})
+    assert r.status_code == 404
+    assert r.headers["traceparent"].split("-")[1] == trace_id
+
+    spans = exp.spans(trace_id)
+    http = next(s for s in spans if s["name"] == "HTTP GET")
+    assert http["parent_id"] == parent and http["attrs"]["route"] == "/api/themes/{theme_id}"
+    assert any(s["name"] == "db.select" for s in spans)
+
+    r = client.get("/api/debug/traces", params={"trace_id": trace_id}, headers=as_admin())
+    assert r.status_code == 200 and {s["name"] for s in r.json()} >= {"HTTP GET", "db.select"}
+
+
+def test_unsampled_trace_is_dropped_everywhere(client, as_admin, monkeypatch, db_tracing):
+    exp = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "exporter", exp)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE", 0.0)
+
+    with tracing.span("HTTP POST") as root:
+        headers = tracing.inject({})
+        with tracing.span("ollama.generate"):
+            pass
+    assert headers[tracing.TRACEPARENT].endswith("-00")
+    # воркер продолжает решение корня, а не бросает жребий заново
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE", 1.0)
+    with tracing.span("job.queue.comic", parent=tracing.extract(headers)) as job:
+        assert not job.sampled and job.trace_id == root.trace_id
+    assert exp.spans() == []
+
+    # входящий запрос с флагом 00 — ни HTTP-, ни SQL-спанов
+    trace_id = "ef" * 16
+    r = client.get("/api/themes/999999", headers={**as_admin(), "traceparent": f"00-{trace_id}-{'12' * 8}-00"})
+    assert r.status_code == 404 and r.headers["traceparent"].endswith("-00")
+    assert exp.spans(trace_id) == []
+
+
+def test_jsonl_exporter_rotates_at_size_cap(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exp = tracing.JsonlExporter(str(path), max_bytes=2000)
+    try:
+        for i in range(40):
+            sp = tracing.start_span("job", n=i)
+            sp.end = sp.start
+            exp.export(sp)
+        assert path.stat().st_size <= 2000
+        assert (tmp_path / "traces.jsonl.1").stat().st_size <= 2000
+        names = [s["attrs"]["n"] for s in exp.spans()]
+        assert names[-1] == 39 and names == sorted(names)
+    finally:
+        exp.close()
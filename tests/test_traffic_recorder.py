@@ -0,0 +1,53 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core import traffic_recorder
+from core.security import create_access_token
+
+
+def test_sanitize_hides_secrets_and_pseudonymizes_email():
+    body = {"email": "Ana@Example.com", "password": "superclave123", "answers": {"q1": "está"},
+            "items": [{"token": "abc", "exercise_id": 7}], "note": "x" * 500}
+    out = traffic_recorder.sanitize(body)
+    assert out["password"] == traffic_recorder.REDACTED
+    assert out["items"] == [{"token": traffic_recorder.REDACTED, "exercise_id": 7}]
+    assert out["answers"] == {"q1": "está"}
+    assert len(out["note"]) == 200
+    # псевдоним стабилен и не зависит от регистра — повторные входы одного пользователя видны в записи
+    assert out["email"] == traffic_recorder.pseudonymize_email("ana@example.com")
+    assert "Ana" not in out["email"]
+    assert traffic_recorder.sanitize_query("theme_id=3&token=zzz") == "theme_id=3&token=%2A%2A%2A"
+
+
+def test_middleware_records_shape_timing_and_caller(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    app = FastAPI()
+    rec = traffic_recorder.install(app, path=str(path))
+
+    @app.post("/api/items/{item_id}")
+    def create(item_id: int, payload: dict):
+        return {"id": item_id}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    token = create_access_token({"user_id": 42, "is_admin": False, "email": "u42@example.com"})[0]
+    c = TestClient(app)
+    assert c.post("/api/items/5?level=A1", json={"password": "p4ssword", "count": 3},
+                  headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert c.get("/health").status_code == 200
+    rec.close()
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 1  # служебные маршруты не пишутся
+    entry = lines[0]
+    assert entry["method"] == "POST" and entry["path"] == "/api/items/5"
+    assert entry["route"] == "/api/items/{item_id}"
+    assert entry["query"] == "level=A1"
+    assert entry["body"] == {"password": traffic_recorder.REDACTED, "count": 3}
+    assert entry["auth"] == {"user_id": 42, "is_admin": False}
+    assert entry["status"] == 200 and entry["duration_ms"] >= 0 and entry["inflight"] == 1
+    assert token not in path.read_text(encoding="utf-8")